@@ -0,0 +1,81 @@
+"""
+gunicorn settings, driven by the environment.
+
+    GUNICORN_WORKER_CLASS   sync (default), gthread, gevent, or uvicorn to serve the
+                            ASGI app (needed for live order status streams)
+    WEB_CONCURRENCY         worker processes (default: derived from CPUs/memory)
+    GUNICORN_THREADS        threads per gthread worker (default 4)
+    GUNICORN_WORKER_CONNECTIONS  concurrent clients per gevent worker (default 100)
+    GUNICORN_WORKER_MEMORY_MB    memory budget per worker used for sizing (default 150)
+    GUNICORN_MAX_REQUESTS   recycle a worker after this many requests (default 1000, 0 = never)
+    GUNICORN_MAX_REQUESTS_JITTER  random extra requests so workers don't recycle together (default 100)
+    GUNICORN_TIMEOUT        seconds before a silent worker is killed (default 30)
+    GUNICORN_GRACEFUL_TIMEOUT  seconds to finish in-flight requests on restart (default 30)
+    GUNICORN_KEEPALIVE      seconds to hold idle keep-alive connections (default 5)
+    GUNICORN_PRELOAD        load the app in the master before forking (default true,
+                            false for gevent: see below)
+    PORT                    port to bind on 0.0.0.0 (default 8000)
+
+``manage.py benchmark_server`` compares the worker classes on this machine.
+"""
+import importlib.util
+import os
+from ipswich_retail import server
+
+def _env_int(name, default):
+    return int(os.environ.get(name) or default)
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+worker_kind = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+if worker_kind not in server.WORKER_CLASSES:
+    raise RuntimeError(
+        f'GUNICORN_WORKER_CLASS must be one of {", ".join(server.WORKER_CLASSES)}, not {worker_kind!r}'
+    )
+if worker_kind == 'gevent' and importlib.util.find_spec('gevent') is None:
+    raise RuntimeError('GUNICORN_WORKER_CLASS=gevent needs the gevent and psycogreen packages installed')
+if worker_kind == 'uvicorn' and importlib.util.find_spec('uvicorn') is None:
+    raise RuntimeError('GUNICORN_WORKER_CLASS=uvicorn needs the uvicorn package installed')
+
+worker_class = server.WORKER_CLASS_PATHS.get(worker_kind, worker_kind)
+
+threads = _env_int('GUNICORN_THREADS', 4) if worker_kind == 'gthread' else 1
+worker_connections = _env_int('GUNICORN_WORKER_CONNECTIONS', 100)
+workers = _env_int('WEB_CONCURRENCY', 0) or server.worker_count(
+    worker_kind,
+    server.cpu_count(),
+    server.memory_limit(),
+    worker_memory_mb=_env_int('GUNICORN_WORKER_MEMORY_MB', 150),
+    threads=threads,
+)
+
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', 100) if max_requests else 0
+timeout = _env_int('GUNICORN_TIMEOUT', 30)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+# gevent workers monkey-patch the standard library only after the fork. A
+# preloaded master would already have imported Django, psycopg2 and ssl
+# unpatched, leaving the workers with broken SSL and blocking database
+# calls, so gevent boots each worker cold unless told otherwise.
+preload_default = 'false' if worker_kind == 'gevent' else 'true'
+preload_app = os.environ.get('GUNICORN_PRELOAD', preload_default).lower() in ('1', 'true', 'yes', 'on')
+
+# Used when no app is given on the command line
+wsgi_app = 'ipswich_retail.asgi:application' if worker_kind == 'uvicorn' else 'ipswich_retail.wsgi:application'
+
+accesslog = '-'
+errorlog = '-'
+
+def post_fork(server_, worker):
+    if worker_kind == 'gevent':
+        # psycopg2 blocks the whole worker unless it yields to the gevent hub
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+def when_ready(server_):
+    server_.log.info(
+        f'{workers} {worker_kind} workers'
+        + (f' x {threads} threads' if worker_kind == 'gthread' else '')
+        + f', max_requests={max_requests}+{max_requests_jitter}'
+    )
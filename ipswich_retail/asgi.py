@@ -14,3 +14,12 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ipswich_retail.settings")
 
 application = get_asgi_application()
+
+# Same warm-up as wsgi.py: with gunicorn --preload and uvicorn workers the
+# master does it once and the workers inherit it
+from django.conf import settings  # noqa: E402
+
+if settings.WARMUP_ON_BOOT:
+    from store.warmup import warm_up
+
+    warm_up()
@@ -36,10 +36,18 @@ DATABASES = {
     )
 }
 
-# Static files with WhiteNoise
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
-WHITENOISE_USE_FINDERS = True
+# Always serve compiled templates from memory in production
+TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+]
+
+# Static files with WhiteNoise: only what collectstatic produced, no finder
+# lookups at runtime, and no unhashed copies left around
+STORAGES["staticfiles"]["BACKEND"] = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+SELF_HOSTED_ASSETS = config('SELF_HOSTED_ASSETS', default=True, cast=bool)
+WHITENOISE_USE_FINDERS = False
 WHITENOISE_AUTOREFRESH = False
+WHITENOISE_KEEP_ONLY_HASHED_FILES = True
 
 # Caching with Redis (if available)
 redis_url = config('REDIS_URL', default=None)
@@ -0,0 +1,68 @@
+"""
+Sizing helpers for gunicorn.conf.py.
+
+Worker counts are derived from the CPUs and memory the process can actually
+use, honouring cgroup limits so a container with a 2-CPU quota on a 64-core
+host is sized for 2 CPUs.
+"""
+import math
+import os
+
+WORKER_CLASSES = ('sync', 'gthread', 'gevent', 'uvicorn')
+# Worker classes gunicorn doesn't know by a short name
+WORKER_CLASS_PATHS = {'uvicorn': 'uvicorn.workers.UvicornWorker'}
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def cpu_count():
+    """Usable CPUs: the affinity mask, capped by any cgroup CPU quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = None
+    cpu_max = _read('/sys/fs/cgroup/cpu.max')  # cgroup v2: "<quota> <period>"
+    if cpu_max and not cpu_max.startswith('max'):
+        limit, period = cpu_max.split()
+        quota = int(limit) / int(period)
+    else:
+        limit = _read('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')  # cgroup v1
+        period = _read('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+        if limit and period and int(limit) > 0:
+            quota = int(limit) / int(period)
+    if quota:
+        cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+def memory_limit():
+    """Bytes of memory available to this container or machine, if known."""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        value = _read(path)
+        # v1 reports "unlimited" as a huge page-aligned number
+        if value and value != 'max' and int(value) < 1 << 60:
+            return int(value)
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+def worker_count(worker_class, cpus, memory=None, worker_memory_mb=150, threads=1):
+    """
+    Workers for ``cpus`` CPUs: the classic ``2 * cpus + 1`` for sync
+    workers, fewer for threaded and cooperative ones since each already
+    overlaps I/O. Capped so the workers fit in ``memory`` bytes.
+    """
+    if worker_class == 'sync':
+        workers = 2 * cpus + 1
+    elif worker_class == 'gthread':
+        workers = max(2, math.ceil(2 * cpus / max(1, threads)) + 1)
+    else:
+        workers = cpus
+    if memory:
+        workers = min(workers, memory // (worker_memory_mb * 1024 * 1024))
+    return max(1, workers)
@@ -46,32 +46,50 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "store.ratelimit.RateLimitMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "store.profiling.TemplateProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "ipswich_retail.urls"
 
+TEMPLATE_LOADERS = [
+    "django.template.loaders.filesystem.Loader",
+    "django.template.loaders.app_directories.Loader",
+]
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [BASE_DIR / 'templates'],
-        "APP_DIRS": True,
         "OPTIONS": {
             "context_processors": [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
                 "store.context_processors.cart_context",
+                "store.context_processors.assets_context",
             ],
+            # Compiled templates are kept per process; runserver's autoreloader
+            # resets them on change. CACHED_TEMPLATES=False re-reads every render.
+            "loaders": (
+                [("django.template.loaders.cached.Loader", TEMPLATE_LOADERS)]
+                if config('CACHED_TEMPLATES', default=True, cast=bool)
+                else TEMPLATE_LOADERS
+            ),
         },
     },
 ]
 
+# Per-template/per-block render timing (Server-Timing header + log line)
+TEMPLATE_PROFILING = config('TEMPLATE_PROFILING', default=False, cast=bool)
+TEMPLATE_PROFILING_ENTRIES = 10
+
 WSGI_APPLICATION = "ipswich_retail.wsgi.application"
 
 
@@ -123,8 +141,24 @@ STATIC_URL = "static/"
 STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
-# WhiteNoise configuration
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# WhiteNoise configuration. Outside dev, collectstatic writes fingerprinted
+# names plus gzip and Brotli siblings, and WhiteNoise serves the hashed names
+# as immutable with a far-future max-age. The manifest only exists after
+# collectstatic, so dev keeps plain names.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": (
+            "django.contrib.staticfiles.storage.StaticFilesStorage" if DEBUG
+            else "whitenoise.storage.CompressedManifestStaticFilesStorage"
+        ),
+    },
+}
+
+# Serve the bundles built by `manage.py build_assets` instead of CDN links
+SELF_HOSTED_ASSETS = config('SELF_HOSTED_ASSETS', default=not DEBUG, cast=bool)
 
 # Media files
 MEDIA_URL = '/media/'
@@ -139,6 +173,93 @@ LOGOUT_REDIRECT_URL = '/'
 SESSION_COOKIE_AGE = 86400  # 24 hours
 CART_SESSION_ID = 'cart'
 
+# Max-age for anonymous catalog pages in shared caches (ETag-validated)
+CATALOG_CACHE_MAX_AGE = config('CATALOG_CACHE_MAX_AGE', default=60, cast=int)
+# Render catalog pages as a user-agnostic shell that any shared cache can serve
+EDGE_CACHE_CATALOG = config('EDGE_CACHE_CATALOG', default=False, cast=bool)
+
+# Outbox worker (store.outbox / manage.py run_outbox_worker)
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_BACKOFF_SECONDS = 10
+OUTBOX_BACKOFF_MAX_SECONDS = 3600
+OUTBOX_LOCK_TIMEOUT = 300  # seconds before a claimed job is considered abandoned
+LOW_STOCK_THRESHOLD = 5
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='orders@ipswich-retail.com')
+
+# Stock is split across this many rows per product so concurrent checkouts
+# of one product don't queue on a single row lock (store.inventory).
+# Product.stock, the total shown in the catalog, is refreshed at most once
+# per STOCK_REFRESH_SECONDS per product, and by rebalance_stock.
+STOCK_SHARDS = config('STOCK_SHARDS', default=8, cast=int)
+STOCK_REFRESH_SECONDS = 5
+
+# Product/Category lookups by id and slug (store.objectcache): a per-worker
+# LRU trusted for OBJECT_CACHE_LOCAL_SECONDS, in front of the shared cache
+OBJECT_CACHE_LOCAL_SIZE = 1000
+OBJECT_CACHE_LOCAL_SECONDS = 5
+OBJECT_CACHE_SECONDS = 3600
+
+# "Frequently bought together" (store.recommendations)
+RECOMMENDATIONS_PER_PRODUCT = 4
+RECOMMENDATIONS_MAX_BASKET = 50
+RECOMMENDATIONS_CACHE_SECONDS = 3600
+
+# Warm imports, URL resolver and templates when the WSGI app loads (store.warmup)
+WARMUP_ON_BOOT = config('WARMUP_ON_BOOT', default=not DEBUG, cast=bool)
+
+# Per-URL-name request limits (store.ratelimit). "rate" is per client IP,
+# "user_rate" per session; "param" limits only requests carrying that query
+# parameter and "methods" only those methods.
+RATE_LIMIT_ENABLED = config('RATE_LIMIT_ENABLED', default=True, cast=bool)
+RATE_LIMIT_CACHE = 'default'
+RATE_LIMIT_TRUSTED_PROXIES = config('RATE_LIMIT_TRUSTED_PROXIES', default=0, cast=int)
+RATE_LIMITS = {
+    'store:product_list': {'rate': '60/m', 'user_rate': '20/m', 'param': 'q'},
+    'store:cart_add': {'rate': '60/m', 'user_rate': '20/m', 'methods': ['POST']},
+    'store:cart_remove': {'rate': '60/m', 'user_rate': '20/m', 'methods': ['POST']},
+    'store:cart_lines': {'rate': '60/m', 'user_rate': '20/m', 'methods': ['POST']},
+    'store:checkout': {'rate': '20/m', 'user_rate': '5/m', 'methods': ['POST']},
+    # Page-view beacons feeding the trending sort; extra views are dropped
+    'store:product_viewed': {'rate': '120/m', 'methods': ['POST']},
+    'login': {'rate': '10/m', 'methods': ['POST']},
+    'admin:login': {'rate': '10/m', 'methods': ['POST']},
+}
+
+# Live order status (store.notifier / store:order_events). Set a Redis URL
+# to deliver status changes across processes; empty means in-process only.
+ORDER_EVENTS_REDIS_URL = config('REDIS_URL', default='')
+ORDER_EVENTS_KEEPALIVE_SECONDS = 15
+ORDER_EVENTS_RETRY_SECONDS = 5
+ORDER_EVENTS_POLL_SECONDS = 30  # reconnect interval when served over WSGI
+
+# Pre-generated sitemaps (store.sitemaps / manage.py generate_sitemaps)
+SITEMAP_ROOT = BASE_DIR / 'sitemaps'
+SITEMAP_BASE_URL = config('SITEMAP_BASE_URL', default='http://localhost:8000')
+SITEMAP_LIMIT = 50000  # URLs per file, the protocol's maximum
+
+# Background backfills (store.backfills / manage.py run_backfills). Between
+# chunks a run waits while replicas lag more than BACKFILL_MAX_LAG_SECONDS or
+# more than BACKFILL_MAX_ACTIVE_QUERIES other queries are running (Postgres).
+BACKFILL_CHUNK_SIZE = 1000
+BACKFILL_PAUSE_SECONDS = config('BACKFILL_PAUSE_SECONDS', default=0.1, cast=float)
+BACKFILL_MAX_LAG_SECONDS = config('BACKFILL_MAX_LAG_SECONDS', default=5, cast=float)
+BACKFILL_MAX_ACTIVE_QUERIES = config('BACKFILL_MAX_ACTIVE_QUERIES', default=20, cast=int)
+
+# Order references (store.ids)
+ORDER_ID_GENERATOR = 'store.ids.TimeOrderedIdGenerator'
+
+# Delivered/cancelled orders older than this move to ArchivedOrder (manage.py archive_orders)
+ORDER_ARCHIVE_AFTER_DAYS = config('ORDER_ARCHIVE_AFTER_DAYS', default=365, cast=int)
+
+# Popular/trending sorts (store.rankings / manage.py flush_rankings)
+RANKINGS_EPOCH = '2025-01-01T00:00:00+00:00'
+RANKINGS_HALF_LIFE_HOURS = {'popularity': 24 * 30, 'trending': 24}
+RANKINGS_VIEW_WEIGHT = 1
+RANKINGS_SALE_WEIGHT = 10  # per unit sold, for trending
+
+# Admin changelists switch to estimated counts above this many rows (Postgres)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 100000
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -14,3 +14,12 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ipswich_retail.settings")
 
 application = get_wsgi_application()
+
+# Import, resolve and compile what every request needs now, so that with
+# gunicorn --preload the workers inherit it from the master
+from django.conf import settings  # noqa: E402
+
+if settings.WARMUP_ON_BOOT:
+    from store.warmup import warm_up
+
+    warm_up()
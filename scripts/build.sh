@@ -41,7 +41,8 @@ echo -e "${GREEN}✅ All tests passed${NC}"
 
 # Step 6: Collect static files
 echo -e "${YELLOW}📁 Collecting static files...${NC}"
-python manage.py collectstatic --noinput --clear
+python manage.py build_assets --report
+DEBUG=False python manage.py collectstatic --noinput --clear
 echo -e "${GREEN}✅ Static files collected${NC}"
 
 # Step 7: Run code quality checks (if tools available)
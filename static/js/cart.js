@@ -0,0 +1,116 @@
+// Progressive enhancement for cart forms. Forms marked data-cart-form send
+// their lines as one JSON request to store:cart_lines and update the page
+// in place instead of posting and following a redirect. Without JS (or
+// fetch) they submit normally.
+(function () {
+    var cartUrl = document.body.dataset.cartUrl;
+    if (!cartUrl || !window.fetch) {
+        return;
+    }
+
+    function linesFor(form) {
+        var productId = form.dataset.productId;
+        if (form.dataset.cartForm === 'add') {
+            return [{product_id: productId, op: 'add', quantity: form.elements.quantity.value}];
+        }
+        if (form.dataset.cartForm === 'remove') {
+            return [{product_id: productId, op: 'remove', quantity: 0}];
+        }
+        var lines = [];
+        document.querySelectorAll('input[form="' + form.id + '"][name^="quantity_"]').forEach(function (input) {
+            lines.push({product_id: input.name.slice('quantity_'.length), op: 'set', quantity: input.value});
+        });
+        return lines;
+    }
+
+    function showMessage(tags, text) {
+        var container = document.querySelector('[data-messages]');
+        if (!container) {
+            return;
+        }
+        var alert = document.createElement('div');
+        alert.className = 'alert alert-' + tags + ' alert-dismissible fade show';
+        alert.setAttribute('role', 'alert');
+        alert.textContent = text;
+        var close = document.createElement('button');
+        close.type = 'button';
+        close.className = 'btn-close';
+        close.setAttribute('data-bs-dismiss', 'alert');
+        alert.appendChild(close);
+        container.appendChild(alert);
+    }
+
+    function render(cart) {
+        var lines = {};
+        cart.lines.forEach(function (line) { lines[line.product_id] = line; });
+        document.querySelectorAll('[data-cart-count]').forEach(function (el) { el.textContent = cart.count; });
+        document.querySelectorAll('[data-cart-total]').forEach(function (el) { el.textContent = '$' + cart.total; });
+        document.querySelectorAll('[data-cart-line]').forEach(function (row) {
+            var line = lines[row.dataset.cartLine];
+            if (!line) {
+                row.remove();
+                return;
+            }
+            row.querySelector('input[name^="quantity_"]').value = line.quantity;
+            row.querySelector('[data-line-total]').textContent = '$' + line.total_price;
+        });
+        if (cart.count === 0 && document.querySelector('#cart-update')) {
+            // Let the server render the empty-cart page
+            window.location.reload();
+        }
+    }
+
+    function csrfToken(form) {
+        var input = form.querySelector('input[name="csrfmiddlewaretoken"]');
+        var headerUrl = document.body.dataset.headerUrl;
+        if ((input && input.value) || !headerUrl) {
+            return Promise.resolve(input ? input.value : '');
+        }
+        // Edge-cached shell submitted before header.js filled the token in
+        return fetch(headerUrl, {credentials: 'same-origin', headers: {'Accept': 'application/json'}})
+            .then(function (response) { return response.json(); })
+            .then(function (state) {
+                document.querySelectorAll('input[name="csrfmiddlewaretoken"]').forEach(function (el) { el.value = state.csrf_token; });
+                state.messages.forEach(function (message) { showMessage(message.tags, message.text); });
+                return state.csrf_token;
+            });
+    }
+
+    document.addEventListener('submit', function (event) {
+        var form = event.target.closest('[data-cart-form]');
+        if (!form) {
+            return;
+        }
+        event.preventDefault();
+        csrfToken(form)
+            .then(function (token) {
+                return fetch(cartUrl, {
+                    method: 'POST',
+                    credentials: 'same-origin',
+                    headers: {
+                        'Content-Type': 'application/json',
+                        'Accept': 'application/json',
+                        'X-CSRFToken': token
+                    },
+                    body: JSON.stringify({lines: linesFor(form)})
+                });
+            })
+            .then(function (response) {
+                return response.json().then(function (data) { return {ok: response.ok, data: data}; });
+            })
+            .then(function (result) {
+                if (result.data.cart) {
+                    render(result.data.cart);
+                }
+                if (result.ok) {
+                    showMessage('success', form.dataset.cartForm === 'add' ? 'Added to cart' : 'Cart updated');
+                } else {
+                    result.data.errors.forEach(function (error) { showMessage('danger', error); });
+                }
+            })
+            .catch(function () {
+                // Fall back to the regular form post
+                form.submit();
+            });
+    });
+})();
@@ -0,0 +1,30 @@
+// Fills in the per-visitor header on pages rendered as an edge-cacheable
+// shell (see store.conditional). No-op on fully server-rendered pages.
+(function () {
+    var headerUrl = document.body.dataset.headerUrl;
+    if (!headerUrl) {
+        return;
+    }
+    fetch(headerUrl, {credentials: 'same-origin', headers: {'Accept': 'application/json'}})
+        .then(function (response) { return response.json(); })
+        .then(function (state) {
+            document.querySelectorAll('[data-cart-count]').forEach(function (el) { el.textContent = state.cart_count; });
+            document.querySelectorAll('[data-username]').forEach(function (el) { el.textContent = state.username || ''; });
+            document.querySelectorAll('[data-auth-only]').forEach(function (el) { el.classList.toggle('d-none', !state.authenticated); });
+            document.querySelectorAll('[data-anonymous-only]').forEach(function (el) { el.classList.toggle('d-none', state.authenticated); });
+            document.querySelectorAll('input[name="csrfmiddlewaretoken"]').forEach(function (el) { el.value = state.csrf_token; });
+            var container = document.querySelector('[data-messages]');
+            state.messages.forEach(function (message) {
+                var alert = document.createElement('div');
+                alert.className = 'alert alert-' + message.tags + ' alert-dismissible fade show';
+                alert.setAttribute('role', 'alert');
+                alert.textContent = message.text;
+                var close = document.createElement('button');
+                close.type = 'button';
+                close.className = 'btn-close';
+                close.setAttribute('data-bs-dismiss', 'alert');
+                alert.appendChild(close);
+                container.appendChild(alert);
+            });
+        });
+})();
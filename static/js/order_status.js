@@ -0,0 +1,32 @@
+// Live order status. An element marked data-order-events opens the
+// store:order_events stream, and every data-order-status="<order id>"
+// element on the page follows that order's status. Badges marked
+// data-status-colors change colour too. Without EventSource the page stays
+// as rendered.
+(function () {
+    var source = document.querySelector('[data-order-events]');
+    if (!source || !window.EventSource) {
+        return;
+    }
+    var COLORS = {
+        pending: 'secondary',
+        processing: 'warning',
+        shipped: 'info',
+        delivered: 'success',
+        cancelled: 'danger'
+    };
+
+    var events = new EventSource(source.dataset.orderEvents);
+    events.addEventListener('status', function (event) {
+        var message = JSON.parse(event.data);
+        document.querySelectorAll('[data-order-status]').forEach(function (element) {
+            if (element.dataset.orderStatus !== message.order_id) {
+                return;
+            }
+            element.textContent = message.status_display;
+            if ('statusColors' in element.dataset) {
+                element.className = element.className.replace(/\bbg-\w+/, 'bg-' + (COLORS[message.status] || 'secondary'));
+            }
+        });
+    });
+})();
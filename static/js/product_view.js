@@ -0,0 +1,15 @@
+// Product page views for the trending sort. The page itself may come from
+// a 304 or an edge cache, so the view is reported with a beacon to the URL
+// in data-product-view instead of being counted while rendering.
+(function () {
+    var page = document.querySelector('[data-product-view]');
+    if (!page) {
+        return;
+    }
+    var url = page.dataset.productView;
+    if (navigator.sendBeacon) {
+        navigator.sendBeacon(url);
+    } else if (window.fetch) {
+        fetch(url, {method: 'POST', keepalive: true, credentials: 'omit'});
+    }
+})();
@@ -0,0 +1,181 @@
+"""
+Read-only JSON catalog API.
+
+    GET api/products/?ids=1,2,3 | ?slugs=a,b | ?category=<slug>
+                     &fields=name,price&limit=50&cursor=<next>
+    GET api/products/<slug>/?fields=...
+    GET api/categories/?ids=... | ?slugs=...&fields=...
+
+Batched lookups are a single ``IN`` query. ``fields`` narrows the SELECT to
+the columns needed, and rows are read with ``.values()`` so no model
+instances are built. Lists page by keyset on ``id`` with an opaque cursor,
+so page 1,000 costs the same as page 1. Bodies are encoded with orjson and
+carry a content ETag, so an unchanged response revalidates as an empty 304.
+"""
+import base64
+import binascii
+import hashlib
+import orjson
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_GET
+from .models import Category, Product
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+MAX_BATCH = 100
+
+class BadRequest(Exception):
+    pass
+
+def _product_url(row):
+    return reverse('store:product_detail', kwargs={'slug': row['slug']})
+
+def _category_url(row):
+    return reverse('store:category_detail', kwargs={'slug': row['slug']})
+
+def _image_url(row):
+    return default_storage.url(row['image']) if row['image'] else None
+
+# Public field -> (columns read, how to render the row)
+PRODUCT_FIELDS = {
+    'id': (['id'], lambda row: row['id']),
+    'name': (['name'], lambda row: row['name']),
+    'slug': (['slug'], lambda row: row['slug']),
+    'description': (['description'], lambda row: row['description']),
+    'price': (['price'], lambda row: str(row['price'])),
+    'stock': (['stock'], lambda row: row['stock']),
+    'available': (['available'], lambda row: row['available']),
+    'category': (['category_id'], lambda row: row['category_id']),
+    'image': (['image'], _image_url),
+    'url': (['slug'], _product_url),
+    'created_at': (['created_at'], lambda row: row['created_at'].isoformat()),
+    'updated_at': (['updated_at'], lambda row: row['updated_at'].isoformat()),
+}
+CATEGORY_FIELDS = {
+    'id': (['id'], lambda row: row['id']),
+    'name': (['name'], lambda row: row['name']),
+    'slug': (['slug'], lambda row: row['slug']),
+    'description': (['description'], lambda row: row['description']),
+    'url': (['slug'], _category_url),
+}
+
+def _split(value):
+    return [part for part in (value or '').split(',') if part]
+
+def parse_fields(request, available):
+    names = _split(request.GET.get('fields')) or list(available)
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise BadRequest(f"Unknown fields: {', '.join(unknown)}")
+    # id is always read: it's the cursor
+    columns = {'id'}
+    for name in names:
+        columns.update(available[name][0])
+    return names, sorted(columns)
+
+def render_rows(rows, names, available):
+    return [{name: available[name][1](row) for name in names} for row in rows]
+
+def apply_batch(request, queryset):
+    if 'ids' in request.GET:
+        try:
+            ids = [int(part) for part in _split(request.GET['ids'])]
+        except ValueError:
+            raise BadRequest('ids must be comma-separated integers')
+        if len(ids) > MAX_BATCH:
+            raise BadRequest(f'At most {MAX_BATCH} ids per request')
+        queryset = queryset.filter(id__in=ids)
+    if 'slugs' in request.GET:
+        slugs = _split(request.GET['slugs'])
+        if len(slugs) > MAX_BATCH:
+            raise BadRequest(f'At most {MAX_BATCH} slugs per request')
+        queryset = queryset.filter(slug__in=slugs)
+    return queryset
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise BadRequest('Invalid cursor')
+
+def paginate(request, queryset, columns):
+    """Keyset page of ``.values()`` rows plus the cursor for the next one."""
+    try:
+        limit = min(int(request.GET.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError:
+        raise BadRequest('limit must be an integer')
+    if limit < 1:
+        raise BadRequest('limit must be positive')
+    if request.GET.get('cursor'):
+        queryset = queryset.filter(id__gt=decode_cursor(request.GET['cursor']))
+    rows = list(queryset.order_by('id').values(*columns)[:limit + 1])
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1]['id'])
+    return rows, None
+
+def next_url(request, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query['cursor'] = cursor
+    return request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+
+def json_response(request, payload):
+    body = orjson.dumps(payload)
+    etag = quote_etag(hashlib.md5(body, usedforsecurity=False).hexdigest())
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=settings.CATALOG_CACHE_MAX_AGE)
+    return response
+
+def api_view(view_func):
+    """GET-only JSON view that turns ``BadRequest`` into a 400."""
+    @require_GET
+    def inner(request, *args, **kwargs):
+        try:
+            return view_func(request, *args, **kwargs)
+        except BadRequest as e:
+            return JsonResponse({'error': str(e)}, status=400)
+    inner.__name__ = view_func.__name__
+    inner.__doc__ = view_func.__doc__
+    return inner
+
+@api_view
+def product_list(request):
+    names, columns = parse_fields(request, PRODUCT_FIELDS)
+    products = apply_batch(request, Product.objects.filter(available=True))
+    if request.GET.get('category'):
+        products = products.filter(category__slug=request.GET['category'])
+    rows, cursor = paginate(request, products, columns)
+    return json_response(request, {
+        'results': render_rows(rows, names, PRODUCT_FIELDS),
+        'next': next_url(request, cursor),
+    })
+
+@api_view
+def product_detail(request, slug):
+    names, columns = parse_fields(request, PRODUCT_FIELDS)
+    row = Product.objects.filter(slug=slug, available=True).values(*columns).first()
+    if row is None:
+        return JsonResponse({'error': 'Not found'}, status=404)
+    return json_response(request, render_rows([row], names, PRODUCT_FIELDS)[0])
+
+@api_view
+def category_list(request):
+    names, columns = parse_fields(request, CATEGORY_FIELDS)
+    rows, cursor = paginate(request, apply_batch(request, Category.objects.all()), columns)
+    return json_response(request, {
+        'results': render_rows(rows, names, CATEGORY_FIELDS),
+        'next': next_url(request, cursor),
+    })
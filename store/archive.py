@@ -0,0 +1,146 @@
+"""
+Cold storage for finished orders.
+
+``archive_orders`` moves delivered and cancelled orders older than
+``ORDER_ARCHIVE_AFTER_DAYS`` out of ``Order``/``OrderItem`` in batches. Each
+one becomes a single ``ArchivedOrder`` row. The row holds the columns
+needed for listing, and the full order with its lines as gzipped JSON, so
+the live tables (and their indexes) stay the size of the recent trade.
+Archived orders are still counted in the sales rollups and recommendations,
+which were updated while they were live. When those are rebuilt from
+scratch, archived orders are recounted from their payloads
+(:func:`payload_batches`).
+
+On Postgres ``store_archivedorder`` is range partitioned by ``created_at``
+with one partition per year, created here before rows are moved into it.
+"""
+import gzip
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import ArchivedOrder, Order, OrderItem, Product
+
+ARCHIVABLE_STATUSES = ('delivered', 'cancelled')
+ORDER_FIELDS = ('first_name', 'last_name', 'email', 'address', 'postal_code', 'city', 'updated_at')
+
+def cutoff(days=None):
+    if days is None:
+        days = settings.ORDER_ARCHIVE_AFTER_DAYS
+    return timezone.now() - timedelta(days=days)
+
+def pack(order):
+    data = {field: getattr(order, field) for field in ORDER_FIELDS}
+    data['items'] = [
+        {
+            'product_id': item.product_id,
+            'product_name': item.product.name,
+            'price': item.price,
+            'quantity': item.quantity,
+        }
+        for item in order.items.all()
+    ]
+    return gzip.compress(json.dumps(data, cls=DjangoJSONEncoder).encode())
+
+def unpack(archived):
+    """Rebuild an unsaved ``Order`` and its ``OrderItem`` list for display."""
+    data = json.loads(gzip.decompress(archived.payload))
+    order = Order(
+        id=archived.id,
+        order_id=archived.order_id,
+        user_id=archived.user_id,
+        status=archived.status,
+        total_cost=archived.total_cost,
+        created_at=archived.created_at,
+        **{field: data[field] for field in ORDER_FIELDS},
+    )
+    items = [
+        OrderItem(
+            order=order,
+            product=Product(id=line['product_id'], name=line['product_name']),
+            price=Decimal(line['price']),
+            quantity=line['quantity'],
+        )
+        for line in data['items']
+    ]
+    return order, items
+
+def payload_batches(batch_size, **filters):
+    """
+    Yield lists of ``(archived, data)`` for archived orders in id order,
+    ``data`` being the unpacked payload.
+    """
+    last_id = 0
+    while True:
+        batch = list(ArchivedOrder.objects.filter(id__gt=last_id, **filters).order_by('id')[:batch_size])
+        if not batch:
+            return
+        yield [(archived, json.loads(gzip.decompress(archived.payload))) for archived in batch]
+        last_id = batch[-1].id
+
+def ensure_partitions(moments):
+    """Create the yearly Postgres partitions covering ``moments``."""
+    if connection.vendor != 'postgresql':
+        return
+    tz = timezone.get_current_timezone()
+    with connection.cursor() as cursor:
+        for year in sorted({moment.astimezone(tz).year for moment in moments}):
+            start = datetime(year, 1, 1, tzinfo=tz)
+            end = datetime(year + 1, 1, 1, tzinfo=tz)
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS store_archivedorder_{year} '
+                f'PARTITION OF store_archivedorder FOR VALUES FROM (%s) TO (%s)',
+                [start, end],
+            )
+
+def archive_batch(before, batch_size):
+    """
+    Move up to ``batch_size`` finished orders created before ``before``
+    into the archive. Orders whose outbox jobs haven't yet brought the
+    rollups and recommendations in line with their status are left for a
+    later run. Returns the number of orders moved.
+    """
+    with transaction.atomic():
+        due = Order.objects.filter(
+            status__in=ARCHIVABLE_STATUSES, created_at__lt=before, counted_in_recommendations=True
+        ).exclude(
+            # Rollups still waiting to count a delivery or uncount a cancellation
+            Q(status='delivered', counted_in_rollups=False) | Q(status='cancelled', counted_in_rollups=True)
+        )
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return 0
+        orders = list(Order.objects.filter(id__in=ids).prefetch_related('items__product'))
+        ensure_partitions(order.created_at for order in orders)
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(
+                id=order.id,
+                order_id=order.order_id,
+                user_id=order.user_id,
+                status=order.status,
+                total_cost=order.total_cost,
+                item_count=len(order.items.all()),
+                created_at=order.created_at,
+                payload=pack(order),
+            )
+            for order in orders
+        ])
+        OrderItem.objects.filter(order_id__in=ids).delete()
+        Order.objects.filter(id__in=ids).delete()
+    return len(ids)
+
+def find_order(order_id, user):
+    """``(order, items)`` for a live or archived order, or ``None``."""
+    order = Order.objects.filter(order_id=order_id, user=user).first()
+    if order is not None:
+        return order, list(order.items.select_related('product'))
+    archived = ArchivedOrder.objects.filter(order_id=order_id, user=user).first()
+    if archived is not None:
+        return unpack(archived)
+    return None
@@ -0,0 +1,159 @@
+"""
+Resumable background backfills.
+
+Filling a new column or table from existing rows inside a migration runs
+as one transaction over the whole table. Instead, the migration only adds
+the schema (a nullable column, or an index with
+``store.operations.AddIndexOnline``), the application starts writing the
+new data for new rows, and a backfill registered here fills in the rest
+with ``manage.py run_backfills``:
+
+* rows are walked in primary-key order, ``chunk_size`` at a time, each
+  chunk in its own short transaction;
+* the chunk's work and its ``BackfillProgress`` checkpoint commit
+  together, so a killed run resumes after the last committed chunk and
+  never repeats one;
+* between chunks the run waits while replicas lag or the database is
+  busy (Postgres), plus ``BACKFILL_PAUSE_SECONDS``.
+
+A backfill covers the rows that existed when it started (up to
+``target_id``). Rows created later are the application's job.
+"""
+import time
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import BackfillProgress
+import logging
+
+logger = logging.getLogger(__name__)
+
+BACKFILLS = {}
+MAX_WAIT_SECONDS = 30
+
+class Backfill:
+    def __init__(self, name, model, func, chunk_size=None):
+        self.name = name
+        self.model = model
+        self.func = func
+        self.chunk_size = chunk_size
+
+    def __str__(self):
+        return self.name
+
+def register(name, model, chunk_size=None):
+    """
+    Register ``func(queryset)`` as backfill ``name`` over ``model``. It is
+    called with the rows of one primary-key range and returns how many it
+    changed (or ``None`` to count them all).
+    """
+    def decorator(func):
+        BACKFILLS[name] = Backfill(name, model, func, chunk_size)
+        return func
+    return decorator
+
+def replication_lag():
+    """Seconds the slowest replica is behind, or 0 off Postgres."""
+    if connection.vendor != 'postgresql':
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT COALESCE(EXTRACT(EPOCH FROM MAX(replay_lag)), 0) FROM pg_stat_replication'
+        )
+        return float(cursor.fetchone()[0])
+
+def active_queries():
+    """Other queries running in this database right now, or 0 off Postgres."""
+    if connection.vendor != 'postgresql':
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM pg_stat_activity "
+            "WHERE state = 'active' AND datname = current_database() AND pid <> pg_backend_pid()"
+        )
+        return cursor.fetchone()[0]
+
+def wait_for_headroom(should_stop=None):
+    """Sleep while the database is too busy for another chunk. Returns seconds waited."""
+    waited = 0
+    delay = settings.BACKFILL_PAUSE_SECONDS or 0.5
+    while not (should_stop and should_stop()):
+        lag = replication_lag()
+        active = active_queries()
+        max_active = settings.BACKFILL_MAX_ACTIVE_QUERIES
+        if lag <= settings.BACKFILL_MAX_LAG_SECONDS and not (max_active and active > max_active):
+            break
+        logger.info(f'Backfill waiting: replica lag {lag:.1f}s, {active} active queries')
+        time.sleep(delay)
+        waited += delay
+        delay = min(delay * 2, MAX_WAIT_SECONDS)
+    return waited
+
+def progress(name):
+    return BackfillProgress.objects.filter(name=name).first()
+
+def start(backfill, restart=False):
+    """The backfill's checkpoint, created (or reset with ``restart``) as needed."""
+    target_id = backfill.model._default_manager.order_by('-pk').values_list('pk', flat=True).first() or 0
+    state, created = BackfillProgress.objects.get_or_create(
+        name=backfill.name, defaults={'target_id': target_id}
+    )
+    if restart and not created:
+        BackfillProgress.objects.filter(pk=state.pk).update(
+            last_id=0, target_id=target_id, rows=0, chunks=0,
+            started_at=timezone.now(), finished_at=None,
+        )
+        state.refresh_from_db()
+    return state
+
+def run_chunk(backfill, chunk_size):
+    """
+    Process the next chunk and checkpoint it. Returns the updated
+    ``BackfillProgress``, with ``finished_at`` set once nothing is left.
+    """
+    manager = backfill.model._default_manager
+    with transaction.atomic():
+        # Serializes concurrent runs of the same backfill on Postgres
+        state = BackfillProgress.objects.select_for_update().get(name=backfill.name)
+        if state.finished_at:
+            return state
+        ids = manager.filter(pk__gt=state.last_id, pk__lte=state.target_id).order_by('pk').values_list('pk', flat=True)
+        end = list(ids[chunk_size - 1:chunk_size]) or [ids.last()]
+        if end[0] is None:
+            state.finished_at = timezone.now()
+            state.save(update_fields=['finished_at', 'updated_at'])
+            return state
+        chunk = manager.filter(pk__gt=state.last_id, pk__lte=end[0])
+        changed = backfill.func(chunk)
+        if changed is None:
+            changed = chunk.count()
+        BackfillProgress.objects.filter(pk=state.pk).update(
+            last_id=end[0], rows=F('rows') + changed, chunks=F('chunks') + 1, updated_at=timezone.now()
+        )
+    state.refresh_from_db()
+    return state
+
+def run(name, chunk_size=None, restart=False, should_stop=None, on_chunk=None):
+    """
+    Run backfill ``name`` from its checkpoint until it finishes or
+    ``should_stop()`` returns true. ``on_chunk(state, waited)`` is called
+    after every chunk. Returns the final ``BackfillProgress``.
+    """
+    backfill = BACKFILLS[name]
+    chunk_size = chunk_size or backfill.chunk_size or settings.BACKFILL_CHUNK_SIZE
+    state = start(backfill, restart)
+    if state.finished_at:
+        return state
+    while not state.finished_at and not (should_stop and should_stop()):
+        state = run_chunk(backfill, chunk_size)
+        waited = 0
+        if not state.finished_at:
+            if settings.BACKFILL_PAUSE_SECONDS:
+                time.sleep(settings.BACKFILL_PAUSE_SECONDS)
+            waited = wait_for_headroom(should_stop)
+        if on_chunk:
+            on_chunk(state, waited)
+    if state.finished_at:
+        logger.info(f'Backfill {name} finished: {state.rows} rows in {state.chunks} chunks')
+    return state
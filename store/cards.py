@@ -0,0 +1,102 @@
+"""
+The ``ProductCard`` read model behind the product grids.
+
+Cards are written whenever a product or category is saved (``signals.py``),
+whenever ``store.inventory`` copies a new stock total over and whenever
+``store.rankings`` flushes new scores, so the listing pages read one
+narrow row per card, in any sort order, and render it as is.
+``manage.py rebuild_product_cards`` rewrites them all, e.g. after bulk
+imports that skip signals; the ``product_cards`` backfill does the same
+in throttled chunks.
+"""
+from django.db.models import OuterRef, Subquery
+from django.utils.text import Truncator
+from .models import Product, ProductCard, ProductScore
+from . import backfills
+
+SUMMARY_WORDS = 15
+
+def summary(description):
+    """What ``{{ description|truncatewords:15 }}`` used to render."""
+    return Truncator(description).words(SUMMARY_WORDS, truncate=' …')
+
+def card_for(product, category):
+    return ProductCard(
+        product_id=product.pk,
+        category_id=category.pk,
+        category_slug=category.slug,
+        name=product.name,
+        slug=product.slug,
+        summary=summary(product.description),
+        price=product.price,
+        stock=product.stock,
+        image_url=product.image.url if product.image else '',
+        available=product.available,
+        created_at=product.created_at,
+    )
+
+CARD_FIELDS = [
+    'category', 'category_slug', 'name', 'slug', 'summary', 'price', 'stock',
+    'image_url', 'available', 'created_at',
+]
+
+def _upsert(cards):
+    ProductCard.objects.bulk_create(
+        cards,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=CARD_FIELDS,
+    )
+
+def sync_product(product):
+    _upsert([card_for(product, product.category)])
+
+def sync_category(category):
+    ProductCard.objects.filter(category=category).exclude(
+        category_slug=category.slug
+    ).update(category_slug=category.slug)
+
+def sync_stock(product_ids):
+    """Copy ``Product.stock`` for these products onto their cards."""
+    ProductCard.objects.filter(pk__in=product_ids).update(
+        stock=Subquery(Product.objects.filter(pk=OuterRef('pk')).values('stock')[:1])
+    )
+
+def sync_scores(product_ids):
+    """Copy the ``ProductScore`` rankings for these products onto their cards."""
+    scores = ProductScore.objects.filter(pk=OuterRef('pk'))
+    ProductCard.objects.filter(pk__in=product_ids, product__score__isnull=False).update(
+        popularity=Subquery(scores.values('popularity')[:1]),
+        trending=Subquery(scores.values('trending')[:1]),
+    )
+
+@backfills.register('product_cards', Product)
+def write_cards(products):
+    """Upsert the cards of a ``Product`` queryset. Returns how many were written."""
+    cards = [card_for(product, product.category) for product in products.select_related('category')]
+    _upsert(cards)
+    sync_scores([card.product_id for card in cards])
+    return len(cards)
+
+def rebuild(chunk_size=1000):
+    """Rewrite every card from its product. Returns the number written."""
+    written = 0
+    last_id = 0
+    while True:
+        ids = list(Product.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return written
+        written += write_cards(Product.objects.filter(pk__in=ids))
+        last_id = ids[-1]
+
+def listing(category=None, rank=None):
+    """
+    Available cards, newest first or by ``rank``, one of the score fields
+    (see ``rankings.SORTS``).
+    """
+    cards = ProductCard.objects.filter(available=True)
+    if category is not None:
+        cards = cards.filter(category=category)
+    if rank is not None:
+        cards = cards.order_by(f'-{rank}', '-created_at')
+    return cards
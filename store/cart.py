@@ -1,54 +1,298 @@
 from decimal import Decimal
 from django.conf import settings
-from .models import Product
+from django.db import transaction
+from django.utils.functional import cached_property
+from .models import Product, Cart as StoredCart, CartLine
+from . import money, objectcache
+
+VERSION_SESSION_KEY = 'cart_version'
+
+def version(session):
+    """
+    Bumped on every change this session makes to its cart, so conditional
+    GETs can tell the header's cart count changed without a query.
+    """
+    return session.get(VERSION_SESSION_KEY, 0)
+
+def _bump_version(session):
+    session[VERSION_SESSION_KEY] = version(session) + 1
 
 class Cart:
+    """
+    Shopping cart backed by the session for anonymous visitors and by the
+    ``Cart``/``CartLine`` tables for authenticated users. Both share the
+    same interface so views and templates don't care which one they get.
+    Session carts keep prices as integer pence (see store.money).
+    """
     def __init__(self, request):
         self.session = request.session
-        cart = self.session.get(settings.CART_SESSION_ID)
-        if not cart:
-            cart = self.session[settings.CART_SESSION_ID] = {}
-        self.cart = cart
+        user = getattr(request, 'user', None)
+        self.user = user if user is not None and user.is_authenticated else None
+        if self.user is None:
+            cart = self.session.get(settings.CART_SESSION_ID)
+            if not cart:
+                cart = self.session[settings.CART_SESSION_ID] = {}
+            self.cart = cart
+
+    @cached_property
+    def stored(self):
+        # Looked up lazily so pages that never touch the cart stay query-free
+        return StoredCart.objects.filter(user=self.user).first()
 
     def add(self, product, quantity=1, override_quantity=False):
+        if self.user is not None:
+            self._add_stored(product, quantity, override_quantity)
+            self.save()
+            return
         product_id = str(product.id)
         if product_id not in self.cart:
             self.cart[product_id] = {
                 'quantity': 0,
-                'price': str(product.price)
+                'price': money.to_pence(product.price)
             }
         if override_quantity:
             self.cart[product_id]['quantity'] = quantity
         else:
             self.cart[product_id]['quantity'] += quantity
+        if self.cart[product_id]['quantity'] <= 0:
+            del self.cart[product_id]
         self.save()
 
+    def _add_stored(self, product, quantity, override_quantity):
+        with transaction.atomic():
+            if self.stored is None:
+                self.stored, _ = StoredCart.objects.get_or_create(user=self.user)
+            line, _ = CartLine.objects.select_for_update().get_or_create(
+                cart=self.stored,
+                product=product,
+                defaults={'quantity': 0, 'price': product.price},
+            )
+            old_quantity = line.quantity
+            new_quantity = quantity if override_quantity else line.quantity + quantity
+            if new_quantity <= 0:
+                line.delete()
+                self.stored.apply_delta(-old_quantity, line.price)
+                return
+            line.quantity = new_quantity
+            line.save(update_fields=['quantity'])
+            self.stored.apply_delta(line.quantity - old_quantity, line.price)
+
     def save(self):
+        _bump_version(self.session)
         self.session.modified = True
 
+    def quantities(self):
+        """``{product_id: quantity}`` for every line, in at most one query."""
+        if self.user is not None:
+            if self.stored is None:
+                return {}
+            return dict(self.stored.lines.values_list('product_id', 'quantity'))
+        return {int(product_id): item['quantity'] for product_id, item in self.cart.items()}
+
+    def update_lines(self, changes):
+        """
+        Apply several ``(product_id, op, quantity)`` changes at once, where
+        ``op`` is ``add``, ``set`` or ``remove``. Stock for every line is
+        checked with a single query and nothing changes unless all lines
+        are valid. Returns a list of error messages, empty on success.
+        """
+        products = Product.objects.filter(
+            id__in={product_id for product_id, _, _ in changes}, available=True
+        ).only('id', 'name', 'price', 'stock').in_bulk()
+        if self.user is not None:
+            errors = self._update_stored(changes, products)
+            if not errors:
+                self.save()
+            return errors
+        target, errors = self._targets(changes, self.quantities(), products)
+        if errors:
+            return errors
+        for product_id, quantity in target.items():
+            if quantity:
+                item = self.cart.setdefault(
+                    str(product_id), {'quantity': 0, 'price': money.to_pence(products[product_id].price)}
+                )
+                item['quantity'] = quantity
+            else:
+                self.cart.pop(str(product_id), None)
+        self.save()
+        return []
+
+    def _targets(self, changes, current, products):
+        """The new quantity per product id, and any error messages."""
+        target = {}
+        errors = []
+        for product_id, op, quantity in changes:
+            existing = target.get(product_id, current.get(product_id, 0))
+            if op == 'add':
+                quantity += existing
+            elif op == 'remove':
+                quantity = 0
+            product = products.get(product_id)
+            if quantity and product is None:
+                errors.append(f'Product {product_id} is not available')
+            elif quantity and quantity > product.stock:
+                errors.append(f'Sorry, only {product.stock} {product.name} available')
+            else:
+                target[product_id] = quantity
+        return target, errors
+
+    def _update_stored(self, changes, products):
+        with transaction.atomic():
+            # Lock the cart before reading its lines, so concurrent updates
+            # queue here and each one adds to the other's result
+            self.stored, _ = StoredCart.objects.select_for_update().get_or_create(user=self.user)
+            current = dict(self.stored.lines.values_list('product_id', 'quantity'))
+            quantities, errors = self._targets(changes, current, products)
+            if errors:
+                return errors
+            removed = [product_id for product_id, quantity in quantities.items() if not quantity]
+            if removed:
+                self.stored.lines.filter(product_id__in=removed).delete()
+            kept = [
+                CartLine(cart=self.stored, product_id=product_id, quantity=quantity,
+                         price=products[product_id].price)
+                for product_id, quantity in quantities.items() if quantity
+            ]
+            if kept:
+                # Lines already in the cart keep the price they were added at
+                CartLine.objects.bulk_create(
+                    kept,
+                    update_conflicts=True,
+                    unique_fields=['cart', 'product'],
+                    update_fields=['quantity'],
+                )
+            self.stored.recalculate()
+        return []
+
+    def summary(self):
+        """JSON-ready cart contents for the AJAX cart endpoints."""
+        return {
+            'count': len(self),
+            'total': str(money.from_pence(self.get_total_pence())),
+            'lines': [
+                {
+                    'product_id': item['product'].id,
+                    'name': item['product'].name,
+                    'quantity': item['quantity'],
+                    'price': str(money.from_pence(item['price_pence'])),
+                    'total_price': str(money.from_pence(item['total_pence'])),
+                }
+                for item in self
+                if 'product' in item
+            ],
+        }
+
     def remove(self, product):
+        if self.user is not None:
+            if self.stored is None:
+                return
+            with transaction.atomic():
+                line = CartLine.objects.select_for_update().filter(
+                    cart=self.stored, product=product
+                ).first()
+                if line is not None:
+                    line.delete()
+                    self.stored.apply_delta(-line.quantity, line.price)
+            self.save()
+            return
         product_id = str(product.id)
         if product_id in self.cart:
             del self.cart[product_id]
             self.save()
 
     def __iter__(self):
-        product_ids = self.cart.keys()
-        products = Product.objects.filter(id__in=product_ids)
-        cart = self.cart.copy()
-        for product in products:
-            cart[str(product.id)]['product'] = product
-        for item in cart.values():
-            item['price'] = Decimal(item['price'])
-            item['total_price'] = item['price'] * item['quantity']
-            yield item
+        if self.user is not None:
+            if self.stored is None:
+                return
+            for line in self.stored.lines.select_related('product'):
+                yield self._item(line.product, line.quantity, money.to_pence(line.price))
+            return
+        products = objectcache.get_many(Product, [int(product_id) for product_id in self.cart])
+        for product_id, item in self.cart.items():
+            # Lines whose product has gone carry no 'product'
+            yield self._item(
+                products.get(int(product_id)), item['quantity'], money.stored_pence(item['price'])
+            )
+
+    def _item(self, product, quantity, price):
+        # Sums use the pence; templates and JSON get Decimal pounds
+        item = {
+            'quantity': quantity,
+            'price_pence': price,
+            'total_pence': price * quantity,
+            'price': money.from_pence(price),
+            'total_price': money.from_pence(price * quantity),
+        }
+        if product is not None:
+            item['product'] = product
+        return item
 
     def __len__(self):
+        if self.user is not None:
+            return self.stored.total_quantity if self.stored else 0
         return sum(item['quantity'] for item in self.cart.values())
 
+    def get_total_pence(self):
+        if self.user is not None:
+            return money.to_pence(self.stored.total_price) if self.stored else 0
+        return sum(money.stored_pence(item['price']) * item['quantity'] for item in self.cart.values())
+
     def get_total_price(self):
-        return sum(Decimal(item['price']) * item['quantity'] for item in self.cart.values())
+        return money.from_pence(self.get_total_pence())
 
     def clear(self):
+        if self.user is not None:
+            if self.stored is not None:
+                self.stored.lines.all().delete()
+                self.stored.total_quantity = 0
+                self.stored.total_price = Decimal('0.00')
+                self.stored.save(update_fields=['total_quantity', 'total_price', 'updated_at'])
+            self.save()
+            return
         del self.session[settings.CART_SESSION_ID]
-        self.save()
\ No newline at end of file
+        self.save()
+
+def merge_session_cart(session, user):
+    """
+    Fold an anonymous session cart into the user's stored cart on login.
+    Quantities for products already in the stored cart are summed, capped
+    at the product's stock as ``add`` is, and the result is written back
+    with a single bulk upsert.
+    """
+    session_cart = session.get(settings.CART_SESSION_ID)
+    if not session_cart:
+        return 0
+    stock = dict(
+        Product.objects.filter(id__in=session_cart.keys()).values_list('id', 'stock')
+    )
+    with transaction.atomic():
+        stored, _ = StoredCart.objects.select_for_update().get_or_create(user=user)
+        existing = {line.product_id: line for line in stored.lines.all()}
+        lines = []
+        for product_id, item in session_cart.items():
+            product_id = int(product_id)
+            if product_id not in stock:
+                continue
+            current = existing.get(product_id)
+            quantity = min(item['quantity'] + (current.quantity if current else 0), stock[product_id])
+            if quantity <= 0:
+                continue
+            lines.append(CartLine(
+                cart=stored,
+                product_id=product_id,
+                quantity=quantity,
+                price=current.price if current else money.from_pence(money.stored_pence(item['price'])),
+            ))
+        if lines:
+            CartLine.objects.bulk_create(
+                lines,
+                update_conflicts=True,
+                unique_fields=['cart', 'product'],
+                update_fields=['quantity'],
+            )
+            stored.recalculate()
+    del session[settings.CART_SESSION_ID]
+    _bump_version(session)
+    session.modified = True
+    return len(lines)
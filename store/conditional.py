@@ -0,0 +1,116 @@
+"""
+Conditional-GET support for catalog pages.
+
+Validators are derived from ``Product.updated_at`` so an unchanged page is
+answered with a 304 before any template is rendered. The per-visitor bits
+that ``base.html`` renders (login state, cart version, CSRF cookie) are
+folded into the ETag so a browser never revalidates a page showing someone
+else's header, and pages with pending flash messages are always rendered.
+These pages are ``private``: they carry the visitor's CSRF token.
+
+With ``EDGE_CACHE_CATALOG`` enabled the pages render a user-agnostic shell
+instead: nothing touches the session, user or messages, the header is
+filled in client-side from ``store:header_state``, and the response is
+public for every visitor so a shared cache can serve it to all of them.
+"""
+import hashlib
+from functools import wraps
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from .models import Product
+from . import cart, objectcache, rankings, recommendations
+
+def _products_state(products):
+    # Served from the (category, available, updated_at) index; the count
+    # catches deletions and availability flips that leave the max unchanged
+    state = products.aggregate(last_modified=Max('updated_at'), total=Count('id'))
+    if state['last_modified'] is None:
+        return None
+    return state['last_modified'], state['total']
+
+def product_state(request, slug):
+    # From the object cache, like the view itself: no query on a warm hit
+    product = objectcache.get_by_slug(Product, slug)
+    if product is None or not product.available:
+        return None
+    # Recommendations change with new orders, not with the product row
+    return product.updated_at, f'{slug}:{recommendations.related_ids(product.id)}'
+
+def product_list_state(request):
+    if request.GET.get('q'):
+        # Free-text search can't be answered from the index
+        return None
+    products = Product.objects.filter(available=True)
+    category_slug = request.GET.get('category')
+    if category_slug:
+        products = products.filter(category__slug=category_slug)
+    state = _products_state(products)
+    sort = request.GET.get('sort')
+    if state is None or sort not in rankings.SORTS:
+        return state
+    # Rank order moves with every flush, not with the product rows
+    last_modified, total = state
+    return last_modified, f'{total}:{sort}:{rankings.version()}'
+
+def category_state(request, slug):
+    return _products_state(Product.objects.filter(category__slug=slug, available=True))
+
+def viewer_key(request):
+    user = getattr(request, 'user', None)
+    user_id = user.pk if user is not None and user.is_authenticated else 0
+    csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    # The cart version lives in the session: no cart query on revalidation
+    return f'{user_id}:{cart.version(request.session)}:{csrf_cookie}'
+
+def patch_catalog_cache_headers(request, response):
+    if getattr(request, 'edge_cacheable', False):
+        patch_cache_control(response, public=True, max_age=settings.CATALOG_CACHE_MAX_AGE)
+        return
+    # Rendered with the visitor's header and CSRF token: never for shared caches
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Cookie'])
+
+def conditional_catalog_page(state_func):
+    """
+    Decorate a catalog view with ETag/Last-Modified handling.
+
+    ``state_func(request, *args, **kwargs)`` returns ``(updated_at, token)``
+    for the content shown on the page, or ``None`` to skip validation.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def inner(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+
+            edge = request.edge_cacheable = settings.EDGE_CACHE_CATALOG
+            etag = last_modified = None
+            response = None
+            state = state_func(request, *args, **kwargs)
+            if state is not None and (edge or not len(get_messages(request))):
+                updated_at, token = state
+                last_modified = int(updated_at.timestamp())
+                key = f'{updated_at.isoformat()}:{token}'
+                if not edge:
+                    key = f'{key}:{viewer_key(request)}'
+                digest = hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+                etag = quote_etag(digest)
+                response = get_conditional_response(
+                    request, etag=etag, last_modified=last_modified
+                )
+
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+
+            if etag is not None and response.status_code in (200, 304):
+                response.headers.setdefault('ETag', etag)
+                if not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(last_modified)
+            if response.status_code in (200, 304):
+                patch_catalog_cache_headers(request, response)
+            return response
+        return inner
+    return decorator
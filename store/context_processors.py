@@ -1,5 +1,12 @@
+from django.conf import settings
 from .cart import Cart
 
 def cart_context(request):
+    if getattr(request, 'edge_cacheable', False):
+        # User-agnostic shell: the header is filled in from store:header_state
+        return {'edge_cacheable': True}
     cart = Cart(request)
-    return {'cart': cart}
\ No newline at end of file
+    return {'cart': cart}
+
+def assets_context(request):
+    return {'self_hosted_assets': settings.SELF_HOSTED_ASSETS}
@@ -0,0 +1,33 @@
+"""
+Database helpers shared by the incrementally maintained tables.
+"""
+from django.db import connection
+
+def bulk_increment(model, key_fields, value_fields, rows, batch_size=500):
+    """
+    Add counters into ``model`` with one multi-row
+    ``INSERT ... ON CONFLICT (keys) DO UPDATE SET v = v + excluded.v`` per
+    batch (SQLite and Postgres). Each row is a tuple of the key values
+    followed by the increments, in field order. ``key_fields`` must be
+    covered by a unique constraint.
+    """
+    table = model._meta.db_table
+    fields = [model._meta.get_field(name) for name in (*key_fields, *value_fields)]
+    columns = [field.column for field in fields]
+    key_columns = columns[:len(key_fields)]
+    value_columns = columns[len(key_fields):]
+    placeholder = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    updates = ', '.join(f'{column} = {table}.{column} + excluded.{column}' for column in value_columns)
+
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        params = []
+        for row in batch:
+            params.extend(field.get_db_prep_save(value, connection) for field, value in zip(fields, row))
+        sql = (
+            f'INSERT INTO {table} ({", ".join(columns)}) '
+            f'VALUES {", ".join([placeholder] * len(batch))} '
+            f'ON CONFLICT ({", ".join(key_columns)}) DO UPDATE SET {updates}'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
@@ -0,0 +1,148 @@
+"""
+Sharded product stock.
+
+A product's stock is split across ``STOCK_SHARDS`` ``StockShard`` rows.
+Checkout takes a line's units with a conditional ``UPDATE`` on one randomly
+chosen shard that holds enough, so concurrent orders for the same product
+lock different rows instead of queueing on one. Only when no single shard
+covers a line are all of the product's shards locked and drained in order.
+
+``Product.stock`` is the summed total, read by the catalog and the cart's
+stock checks, and copied onto the product's ``ProductCard``. Checkouts
+never save the product: the total is copied over with an ``UPDATE`` of
+``stock`` and ``updated_at`` at most once per ``STOCK_REFRESH_SECONDS``
+per product after they commit. Bumping ``updated_at`` keeps the catalog's
+conditional-GET validators (store.conditional) in step with the stock.
+``manage.py rebalance_stock`` evens out drained shards and catches up any
+totals that are still behind.
+"""
+import random
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import Count, F, Max, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from .models import Product, StockShard
+from . import cards, objectcache
+
+REFRESH_KEY = 'inventory:refreshed:{}'
+
+class OutOfStock(Exception):
+    def __init__(self, product, available):
+        self.product = product
+        self.available = available
+        super().__init__(f'Sorry, only {available} {product.name} available')
+
+def split(quantity, count):
+    """``quantity`` units spread over ``count`` shards as evenly as possible."""
+    return [quantity // count + (shard < quantity % count) for shard in range(count)]
+
+def total(product_id):
+    """Exact stock, summed over the product's shards."""
+    return StockShard.objects.filter(product_id=product_id).aggregate(
+        total=Coalesce(Sum('quantity'), 0)
+    )['total']
+
+def set_stock(product_id, quantity=None):
+    """
+    Replace a product's stock with ``quantity`` units spread evenly. With no
+    ``quantity`` the current total is kept and only spread out again (taken
+    from ``Product.stock`` if the product has no shards yet).
+    """
+    count = settings.STOCK_SHARDS
+    with transaction.atomic():
+        shards = StockShard.objects.filter(product_id=product_id)
+        # Wait for checkouts holding a shard before overwriting them
+        current = list(shards.select_for_update().values_list('quantity', flat=True))
+        if quantity is None:
+            quantity = sum(current) if current else Product.objects.get(pk=product_id).stock
+        shards.filter(shard__gte=count).delete()
+        StockShard.objects.bulk_create(
+            [
+                StockShard(product_id=product_id, shard=shard, quantity=units)
+                for shard, units in enumerate(split(quantity, count))
+            ],
+            update_conflicts=True,
+            unique_fields=['product', 'shard'],
+            update_fields=['quantity'],
+        )
+        Product.objects.filter(pk=product_id).exclude(stock=quantity).update(
+            stock=quantity, updated_at=timezone.now()
+        )
+        cards.sync_stock([product_id])
+    objectcache.invalidate(Product, [product_id])
+
+def take(product, quantity):
+    """
+    Remove ``quantity`` units of ``product`` in the caller's transaction,
+    raising ``OutOfStock`` if its shards don't hold enough between them.
+    """
+    shards = StockShard.objects.filter(product=product)
+    candidates = list(shards.filter(quantity__gte=quantity).values_list('shard', flat=True))
+    random.shuffle(candidates)
+    for shard in candidates:
+        # Another checkout may have drained it since it was read
+        if shards.filter(shard=shard, quantity__gte=quantity).update(quantity=F('quantity') - quantity):
+            return
+    locked = list(shards.select_for_update().order_by('shard'))
+    available = sum(shard.quantity for shard in locked)
+    if available < quantity:
+        raise OutOfStock(product, available)
+    changed = []
+    for shard in locked:
+        used = min(shard.quantity, quantity)
+        if used:
+            shard.quantity -= used
+            quantity -= used
+            changed.append(shard)
+        if not quantity:
+            break
+    StockShard.objects.bulk_update(changed, ['quantity'])
+
+def _exact_total():
+    return Coalesce(Subquery(
+        StockShard.objects.filter(product=OuterRef('pk'))
+        .values('product').annotate(total=Sum('quantity')).values('total')
+    ), 0)
+
+def refresh(product_ids, force=False):
+    """
+    Copy exact totals into ``Product.stock``. Unless ``force`` is set, a
+    product refreshed in the last ``STOCK_REFRESH_SECONDS`` is skipped, so
+    a run of checkouts writes the product row once, not once per order.
+    """
+    if not force:
+        product_ids = [
+            product_id for product_id in product_ids
+            if cache.add(REFRESH_KEY.format(product_id), 1, timeout=settings.STOCK_REFRESH_SECONDS)
+        ]
+    if product_ids:
+        Product.objects.filter(pk__in=product_ids).exclude(stock=_exact_total()).update(
+            stock=_exact_total(), updated_at=timezone.now()
+        )
+        cards.sync_stock(product_ids)
+        objectcache.invalidate(Product, product_ids)
+
+def rebalance(chunk_size=500):
+    """
+    Spread stock evenly again for products whose shards have drifted more
+    than one unit apart or don't match ``STOCK_SHARDS``, then refresh any
+    ``Product.stock`` that disagrees with its shards. Products with no
+    shards yet are seeded from ``Product.stock``. Returns the number of
+    products rebalanced.
+    """
+    uneven = Product.objects.annotate(
+        shards=Count('stock_shards'),
+        low=Min('stock_shards__quantity'),
+        high=Max('stock_shards__quantity'),
+    ).exclude(shards=settings.STOCK_SHARDS, high__lte=F('low') + 1)
+    rebalanced = list(uneven.values_list('pk', flat=True))
+    for product_id in rebalanced:
+        set_stock(product_id)
+    stale = list(
+        Product.objects.annotate(exact=_exact_total()).exclude(stock=F('exact')).values_list('pk', flat=True)
+    )
+    for start in range(0, len(stale), chunk_size):
+        refresh(stale[start:start + chunk_size], force=True)
+    return len(rebalanced)
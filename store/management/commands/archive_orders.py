@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from store import archive
+
+class Command(BaseCommand):
+    help = 'Move delivered and cancelled orders past the retention window into the order archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Archive orders older than this many days (default: ORDER_ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Orders moved per transaction')
+        parser.add_argument('--limit', type=int,
+                            help='Stop after roughly this many orders')
+
+    def handle(self, *args, **options):
+        before = archive.cutoff(options['days'])
+        moved = 0
+        while options['limit'] is None or moved < options['limit']:
+            count = archive.archive_batch(before, options['batch_size'])
+            if not count:
+                break
+            moved += count
+            self.stdout.write(f'Archived {moved} orders')
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} orders created before {before:%Y-%m-%d}'))
@@ -0,0 +1,47 @@
+import random
+import timeit
+from decimal import Decimal
+from django.contrib.sessions.serializers import JSONSerializer
+from django.core.management.base import BaseCommand
+from store import money
+
+class Command(BaseCommand):
+    help = 'Compare session cart totals and sizes with prices as pound strings and as integer pence'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[10, 100, 1000],
+                            help='Cart sizes to measure')
+        parser.add_argument('--repeat', type=int, default=200,
+                            help='Totals computed per measurement')
+
+    def handle(self, *args, **options):
+        serializer = JSONSerializer()
+        self.stdout.write(
+            f"{'lines':>6} {'str us':>10} {'pence us':>10} {'speedup':>8} {'str bytes':>10} {'pence bytes':>12}"
+        )
+        for lines in options['lines']:
+            rng = random.Random(lines)
+            prices = [rng.randint(50, 200000) for _ in range(lines)]
+            # Session carts as written before and after prices moved to pence
+            legacy = {
+                str(product_id): {'quantity': rng.randint(1, 5), 'price': str(money.from_pence(price))}
+                for product_id, price in enumerate(prices, 1)
+            }
+            pence = {
+                product_id: {'quantity': item['quantity'], 'price': money.to_pence(item['price'])}
+                for product_id, item in legacy.items()
+            }
+
+            def legacy_total():
+                return sum(Decimal(item['price']) * item['quantity'] for item in legacy.values())
+
+            def pence_total():
+                return money.from_pence(sum(item['price'] * item['quantity'] for item in pence.values()))
+
+            assert legacy_total() == pence_total()
+            legacy_us = min(timeit.repeat(legacy_total, number=options['repeat'], repeat=3)) / options['repeat'] * 1e6
+            pence_us = min(timeit.repeat(pence_total, number=options['repeat'], repeat=3)) / options['repeat'] * 1e6
+            self.stdout.write(
+                f'{lines:>6} {legacy_us:>10.1f} {pence_us:>10.1f} {legacy_us / pence_us:>7.1f}x '
+                f'{len(serializer.dumps({"cart": legacy})):>10} {len(serializer.dumps({"cart": pence})):>12}'
+            )
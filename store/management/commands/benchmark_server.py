@@ -0,0 +1,127 @@
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from ipswich_retail.server import WORKER_CLASSES
+from store.models import Category, Product
+
+class Command(BaseCommand):
+    help = 'Run the store under gunicorn with each worker class and load the key routes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--worker-classes', nargs='+', default=['sync', 'gthread'],
+                            choices=WORKER_CLASSES)
+        parser.add_argument('--workers', type=int,
+                            help='WEB_CONCURRENCY for every run (default: gunicorn.conf.py sizing)')
+        parser.add_argument('--concurrency', type=int, default=16,
+                            help='Simultaneous client connections')
+        parser.add_argument('--duration', type=float, default=10.0,
+                            help='Seconds of load per worker class')
+        parser.add_argument('--paths', nargs='+',
+                            help='Paths to request (default: list, sorted list, category, product, header)')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or self._default_paths()
+        self.host = next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h != '*'), 'localhost')
+        self.stdout.write(f"Routes: {', '.join(paths)}")
+        self.stdout.write(
+            f"{'worker class':<14} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}"
+        )
+        for worker_class in options['worker_classes']:
+            port = self._free_port()
+            process = self._start(worker_class, port, options['workers'])
+            try:
+                base = f'http://127.0.0.1:{port}'
+                self._wait_until_ready(base, process)
+                latencies, errors, elapsed = self._load(base, paths, options['concurrency'], options['duration'])
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+            if not latencies:
+                raise CommandError(f'No successful requests with {worker_class} workers')
+            latencies.sort()
+            self.stdout.write(
+                f'{worker_class:<14} {len(latencies) / elapsed:>9.1f} '
+                f'{statistics.median(latencies) * 1000:>9.1f} '
+                f'{self._percentile(latencies, 95) * 1000:>9.1f} '
+                f'{self._percentile(latencies, 99) * 1000:>9.1f} {errors:>7}'
+            )
+
+    def _default_paths(self):
+        paths = ['/', '/?sort=popular', '/header/']
+        category = Category.objects.first()
+        if category is not None:
+            paths.append(category.get_absolute_url())
+        product = Product.objects.filter(available=True).first()
+        if product is not None:
+            paths.append(product.get_absolute_url())
+        return paths
+
+    def _free_port(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    def _start(self, worker_class, port, workers):
+        env = dict(os.environ, PORT=str(port), GUNICORN_WORKER_CLASS=worker_class)
+        if workers:
+            env['WEB_CONCURRENCY'] = str(workers)
+        # Access logs would dominate the measurement; errors go to a file
+        # rather than a pipe nobody drains while the load runs
+        self.log = tempfile.TemporaryFile()
+        return subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', str(settings.BASE_DIR / 'gunicorn.conf.py'),
+             '--access-logfile', '/dev/null'],
+            cwd=settings.BASE_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=self.log,
+        )
+
+    def _wait_until_ready(self, base, process, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                self.log.seek(0)
+                raise CommandError(f'gunicorn exited:\n{self.log.read().decode()[-2000:]}')
+            try:
+                request = urllib.request.Request(f'{base}/health/', headers={'Host': self.host})
+                with urllib.request.urlopen(request, timeout=2):
+                    return
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.2)
+        raise CommandError('gunicorn did not become ready')
+
+    def _load(self, base, paths, concurrency, duration):
+        deadline = time.monotonic() + duration
+
+        def client(offset):
+            latencies, errors, i = [], 0, offset
+            while time.monotonic() < deadline:
+                request = urllib.request.Request(base + paths[i % len(paths)], headers={'Host': self.host})
+                i += 1
+                started = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(request, timeout=30) as response:
+                        response.read()
+                except (urllib.error.URLError, ConnectionError):
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+            return latencies, errors
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(client, range(concurrency)))
+        elapsed = time.monotonic() - started
+        latencies = [latency for result, _ in results for latency in result]
+        return latencies, sum(errors for _, errors in results), elapsed
+
+    def _percentile(self, ordered, pct):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
@@ -0,0 +1,118 @@
+import gzip
+import re
+import urllib.request
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+BOOTSTRAP = 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist'
+BOOTSTRAP_ICONS = 'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.0/font'
+
+# Pinned third-party assets, fetched once into static/vendor/
+VENDOR_ASSETS = {
+    'vendor/bootstrap/bootstrap.min.css': f'{BOOTSTRAP}/css/bootstrap.min.css',
+    'vendor/bootstrap/bootstrap.bundle.min.js': f'{BOOTSTRAP}/js/bootstrap.bundle.min.js',
+    'vendor/bootstrap-icons/bootstrap-icons.css': f'{BOOTSTRAP_ICONS}/bootstrap-icons.css',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff2': f'{BOOTSTRAP_ICONS}/fonts/bootstrap-icons.woff2',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff': f'{BOOTSTRAP_ICONS}/fonts/bootstrap-icons.woff',
+}
+
+# Bundles written to static/dist/, in concatenation order
+BUNDLES = {
+    'dist/site.css': [
+        'vendor/bootstrap/bootstrap.min.css',
+        'vendor/bootstrap-icons/bootstrap-icons.css',
+    ],
+    'dist/site.js': [
+        'vendor/bootstrap/bootstrap.bundle.min.js',
+        'js/header.js',
+        'js/cart.js',
+        'js/order_status.js',
+        'js/product_view.js',
+    ],
+}
+
+# What base.html loads from the CDN without bundling, for --report
+UNBUNDLED_PAGE = [
+    'vendor/bootstrap/bootstrap.min.css',
+    'vendor/bootstrap-icons/bootstrap-icons.css',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff2',
+    'vendor/bootstrap/bootstrap.bundle.min.js',
+    'js/header.js',
+    'js/cart.js',
+    'js/order_status.js',
+    'js/product_view.js',
+]
+BUNDLED_PAGE = [
+    'dist/site.css',
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff2',
+    'dist/site.js',
+]
+
+# Source maps aren't shipped, and the manifest storage refuses dangling references
+SOURCE_MAP_RE = re.compile(r'^\s*(/\*# sourceMappingURL=.*?\*/|//# sourceMappingURL=.*)$', re.MULTILINE)
+ICON_FONT_URL_RE = re.compile(r'url\((["\']?)\./fonts/([^"\')?]+)(\?[^"\')]*)?\1\)')
+
+class Command(BaseCommand):
+    help = 'Fetch pinned vendor assets and build minified CSS/JS bundles for collectstatic'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refresh', action='store_true',
+                            help='Re-download vendor assets even if present')
+        parser.add_argument('--report', action='store_true',
+                            help='Print bytes and requests per page before and after bundling')
+
+    def handle(self, *args, **options):
+        import rcssmin
+        import rjsmin
+
+        static_dir = Path(settings.STATICFILES_DIRS[0])
+        for name, url in VENDOR_ASSETS.items():
+            path = static_dir / name
+            if path.exists() and not options['refresh']:
+                continue
+            self.stdout.write(f'Fetching {url}')
+            try:
+                with urllib.request.urlopen(url, timeout=30) as response:
+                    data = response.read()
+            except OSError as e:
+                raise CommandError(f'Could not fetch {url}: {e}')
+            if path.suffix in ('.css', '.js'):
+                data = SOURCE_MAP_RE.sub('', data.decode()).encode()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+
+        for bundle, sources in BUNDLES.items():
+            parts = []
+            for source in sources:
+                text = (static_dir / source).read_text()
+                if source.startswith('vendor/bootstrap-icons/'):
+                    text = ICON_FONT_URL_RE.sub(r'url("../vendor/bootstrap-icons/fonts/\2")', text)
+                parts.append(text)
+            if bundle.endswith('.css'):
+                output = rcssmin.cssmin('\n'.join(parts))
+            else:
+                output = rjsmin.jsmin(';\n'.join(parts))
+            path = static_dir / bundle
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(output)
+            self.stdout.write(f'Built {bundle} ({len(output.encode())} bytes)')
+
+        if options['report']:
+            self._report(static_dir, 'Before (CDN, unbundled)', UNBUNDLED_PAGE)
+            self._report(static_dir, 'After (self-hosted bundles)', BUNDLED_PAGE)
+
+        self.stdout.write(self.style.SUCCESS('Assets built; run collectstatic to fingerprint and precompress'))
+
+    def _report(self, static_dir, title, files):
+        import brotli
+
+        raw = gz = br = 0
+        for name in files:
+            data = (static_dir / name).read_bytes()
+            raw += len(data)
+            gz += len(gzip.compress(data, compresslevel=9))
+            br += len(brotli.compress(data))
+        self.stdout.write(
+            f'{title}: {len(files)} requests, {raw} bytes raw, {gz} gzip, {br} brotli'
+        )
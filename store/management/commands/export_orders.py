@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from store import export
+
+class Command(BaseCommand):
+    help = 'Write order lines for a date range to a gzipped CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('start', help='First day, YYYY-MM-DD')
+        parser.add_argument('end', help='Last day (inclusive), YYYY-MM-DD')
+        parser.add_argument('--format', choices=sorted(export.FORMATS), default='csv')
+        parser.add_argument('--output', help='File to write (default: orders-<start>-<end>.<format>.gz)')
+
+    def handle(self, *args, **options):
+        start = parse_date(options['start'])
+        end = parse_date(options['end'])
+        if start is None or end is None:
+            raise CommandError('Dates must be in YYYY-MM-DD format')
+        if end < start:
+            raise CommandError('End date is before start date')
+        path = options['output'] or export.filename(start, end, options['format'])
+        written = 0
+        with open(path, 'wb') as output:
+            for block in export.generate(start, end, options['format']):
+                output.write(block)
+                written += len(block)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} bytes to {path}'))
@@ -0,0 +1,28 @@
+import signal
+import time
+from django.core.management.base import BaseCommand
+from store import rankings
+
+class Command(BaseCommand):
+    help = 'Fold pending view/sale counters from the cache into the popular/trending rankings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Dirty-log entries read from the cache per round trip')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running, flushing every this many seconds')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        while True:
+            updated = rankings.flush(chunk_size=options['chunk_size'])
+            self.stdout.write(f'Updated rankings for {updated} products')
+            if not options['interval'] or self.stopping:
+                break
+            time.sleep(options['interval'])
+
+    def _stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,28 @@
+import signal
+import time
+from django.core.management.base import BaseCommand
+from store import sitemaps
+
+class Command(BaseCommand):
+    help = 'Write or update the gzipped product and category sitemaps and their index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int,
+                            help='URLs per sitemap file (default: SITEMAP_LIMIT)')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running, updating every this many seconds')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        while True:
+            written = sitemaps.generate(limit=options['limit'])
+            self.stdout.write(f'Rewrote {written} sitemap files in {sitemaps.root()}')
+            if not options['interval'] or self.stopping:
+                break
+            time.sleep(options['interval'])
+
+    def _stop(self, signum, frame):
+        self.stopping = True
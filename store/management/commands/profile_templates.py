@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from store import profiling
+
+class Command(BaseCommand):
+    help = 'Render store pages repeatedly and report per-template and per-block render time'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=['/'],
+                            help='URL paths to request (default: /)')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Number of requests per path')
+        parser.add_argument('--user', help='Username to log in as (needed for order pages)')
+        parser.add_argument('--limit', type=int, default=25,
+                            help='Number of rows to print')
+
+    def handle(self, *args, **options):
+        host = next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h != '*'), 'localhost')
+        client = Client(HTTP_HOST=host)
+        if options['user']:
+            try:
+                client.force_login(User.objects.get(username=options['user']))
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['user']} does not exist")
+
+        profiling.install()
+        profiling.reset()
+        try:
+            for path in options['paths']:
+                for _ in range(options['repeat']):
+                    response = client.get(path)
+                    if response.status_code != 200:
+                        raise CommandError(f'{path} returned {response.status_code}')
+            rows = profiling.get_stats()
+        finally:
+            profiling.uninstall()
+
+        self.stdout.write(f"{'template / block':<50} {'calls':>7} {'total ms':>10} {'own ms':>10} {'own/call':>10}")
+        for name, calls, total, own in rows[:options['limit']]:
+            self.stdout.write(
+                f'{name:<50} {calls:>7} {total * 1000:>10.2f} {own * 1000:>10.2f} {own * 1000 / calls:>10.3f}'
+            )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from store import ratelimit
+
+class Command(BaseCommand):
+    help = 'Show how many requests each rate limit rule has rejected'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help='Zero the counters after printing them')
+
+    def handle(self, *args, **options):
+        for name, count in ratelimit.throttled_counts().items():
+            self.stdout.write(f'{name:<24} {count:>8}')
+        if options['reset']:
+            ratelimit.reset_throttled_counts()
+            self.stdout.write('Counters reset')
@@ -0,0 +1,28 @@
+import signal
+import time
+from django.core.management.base import BaseCommand
+from store import inventory
+
+class Command(BaseCommand):
+    help = 'Even out drained stock shards and refresh the stock totals shown in the catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Products refreshed per UPDATE')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep running, rebalancing every this many seconds')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        while True:
+            rebalanced = inventory.rebalance(chunk_size=options['chunk_size'])
+            self.stdout.write(f'Rebalanced stock for {rebalanced} products')
+            if not options['interval'] or self.stopping:
+                break
+            time.sleep(options['interval'])
+
+    def _stop(self, signum, frame):
+        self.stopping = True
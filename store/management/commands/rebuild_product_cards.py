@@ -0,0 +1,17 @@
+import time
+from django.core.management.base import BaseCommand
+from store import cards
+
+class Command(BaseCommand):
+    help = 'Rewrite every ProductCard from its product, e.g. after a bulk import'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Products per batch')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        written = cards.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {written} product cards in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,71 @@
+import signal
+import time
+from django.core.management.base import BaseCommand, CommandError
+from store import backfills
+
+class Command(BaseCommand):
+    help = 'Run registered background backfills in throttled, checkpointed chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*',
+                            help='Backfills to run (default: every unfinished one)')
+        parser.add_argument('--list', action='store_true',
+                            help='Show each backfill and its progress, then exit')
+        parser.add_argument('--chunk-size', type=int,
+                            help='Rows per chunk (default: the backfill\'s own or BACKFILL_CHUNK_SIZE)')
+        parser.add_argument('--restart', action='store_true',
+                            help='Start again from the first row instead of the checkpoint')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        if options['list']:
+            for name in sorted(backfills.BACKFILLS):
+                state = backfills.progress(name)
+                if state is None:
+                    self.stdout.write(f'{name}: not started')
+                else:
+                    status = 'done' if state.finished_at else f'{state.percent:.1f}%'
+                    self.stdout.write(f'{name}: {status}, {state.rows} rows in {state.chunks} chunks')
+            return
+
+        unknown = set(options['names']) - set(backfills.BACKFILLS)
+        if unknown:
+            raise CommandError(f'Unknown backfills: {", ".join(sorted(unknown))}')
+        names = options['names'] or [
+            name for name in sorted(backfills.BACKFILLS)
+            if not getattr(backfills.progress(name), 'finished_at', None)
+        ]
+
+        for name in names:
+            if self.stopping:
+                break
+            started = time.monotonic()
+            first_rows = getattr(backfills.progress(name), 'rows', 0) if not options['restart'] else 0
+
+            def report(state, waited):
+                elapsed = time.monotonic() - started
+                rate = (state.rows - first_rows) / elapsed if elapsed else 0
+                line = f'{name}: {state.percent:.1f}% (id {state.last_id}/{state.target_id}), {state.rows} rows'
+                if rate:
+                    line += f', {rate:.0f} rows/s'
+                if waited:
+                    line += f', waited {waited:.1f}s for the database'
+                self.stdout.write(line)
+
+            state = backfills.run(
+                name,
+                chunk_size=options['chunk_size'],
+                restart=options['restart'],
+                should_stop=lambda: self.stopping,
+                on_chunk=report,
+            )
+            if state.finished_at:
+                self.stdout.write(self.style.SUCCESS(f'{name}: done, {state.rows} rows in {state.chunks} chunks'))
+            else:
+                self.stdout.write(f'{name}: stopped at id {state.last_id}; run again to resume')
+
+    def _stop(self, signum, frame):
+        self.stopping = True
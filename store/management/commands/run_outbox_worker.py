@@ -0,0 +1,48 @@
+import os
+import signal
+import socket
+import time
+from django.core.management.base import BaseCommand
+from store import outbox
+
+class Command(BaseCommand):
+    help = 'Process outbox jobs (confirmation emails, stock alerts, ...) in the background'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='Jobs claimed per round trip')
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Handlers run in parallel within a batch')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the due jobs and exit')
+
+    def handle(self, *args, **options):
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        executor = outbox.make_executor(options['concurrency'])
+        processed = 0
+        try:
+            while not self.stopping:
+                released = outbox.release_stale_jobs()
+                if released:
+                    self.stdout.write(f'Released {released} stale jobs')
+                claimed = outbox.process_batch(worker_id, options['batch_size'], executor)
+                processed += claimed
+                if not claimed:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True)
+
+        self.stdout.write(self.style.SUCCESS(f'Outbox worker {worker_id} processed {processed} jobs'))
+
+    def _stop(self, signum, frame):
+        # Finish the current batch, then exit
+        self.stopping = True
@@ -0,0 +1,64 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter so nothing is already imported
+BOOT_SCRIPT = '''
+import json, resource, sys, time
+started = time.perf_counter()
+import ipswich_retail.wsgi
+elapsed = time.perf_counter() - started
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"seconds": elapsed, "rss_kb": rss_kb, "modules": len(sys.modules)}))
+'''
+
+IMPORT_TIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+class Command(BaseCommand):
+    help = 'Boot the WSGI app in a fresh interpreter and report import time per package and peak RSS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20,
+                            help='Number of packages and modules to list')
+        parser.add_argument('--no-warmup', action='store_true',
+                            help='Boot with WARMUP_ON_BOOT=False')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'ipswich_retail.settings')
+        if options['no_warmup']:
+            env['WARMUP_ON_BOOT'] = 'False'
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT],
+            capture_output=True, text=True, env=env,
+        )
+        if result.returncode:
+            raise CommandError(f'Boot failed:\n{result.stderr[-2000:]}')
+        boot = json.loads(result.stdout.strip().splitlines()[-1])
+
+        by_package = defaultdict(int)
+        slowest = []
+        for line in result.stderr.splitlines():
+            match = IMPORT_TIME_RE.match(line)
+            if not match:
+                continue
+            own, cumulative, indent, module = match.groups()
+            by_package[module.split('.')[0]] += int(own)
+            # Depth 0 is the boot script's own imports; show what they pulled in
+            if 1 <= len(indent) // 2 <= 2:
+                slowest.append((int(cumulative), module))
+
+        self.stdout.write(
+            f"Boot: {boot['seconds'] * 1000:.0f}ms, {boot['modules']} modules, "
+            f"peak RSS {boot['rss_kb'] / 1024:.1f} MiB"
+        )
+        self.stdout.write(f"\n{'package':<40} {'own ms':>10}")
+        for package, own in sorted(by_package.items(), key=lambda item: -item[1])[:options['limit']]:
+            self.stdout.write(f'{package:<40} {own / 1000:>10.1f}')
+        self.stdout.write(f"\n{'module':<40} {'cumulative ms':>14}")
+        for cumulative, module in sorted(slowest, reverse=True)[:options['limit']]:
+            self.stdout.write(f'{module:<40} {cumulative / 1000:>14.1f}')
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_cart_cartline'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['available', 'updated_at'], name='store_produ_availab_51ee72_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'available', 'updated_at'], name='store_produ_categor_521835_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_scores(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ProductScore = apps.get_model('store', 'ProductScore')
+    ProductScore.objects.bulk_create(
+        (
+            ProductScore(product_id=pk, category_id=category_id, available=available)
+            for pk, category_id, available in Product.objects.values_list('pk', 'category_id', 'available').iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_product_cooccurrence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductScore',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='store.product')),
+                ('available', models.BooleanField(default=True)),
+                ('popularity', models.FloatField(default=0)),
+                ('trending', models.FloatField(default=0)),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.category')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['available', '-popularity'], name='store_produ_availab_9eebfe_idx'), models.Index(fields=['category', 'available', '-popularity'], name='store_produ_categor_5204d2_idx'), models.Index(fields=['available', '-trending'], name='store_produ_availab_c2d2eb_idx'), models.Index(fields=['category', 'available', '-trending'], name='store_produ_categor_afc5ac_idx')],
+            },
+        ),
+        migrations.RunPython(create_scores, migrations.RunPython.noop),
+    ]
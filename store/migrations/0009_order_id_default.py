@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:36
+
+import store.ids
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_productscore'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='order_id',
+            field=models.CharField(default=store.ids.new_order_id, max_length=100, unique=True),
+        ),
+    ]
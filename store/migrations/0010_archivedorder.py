@@ -0,0 +1,77 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Postgres: range partitioned by created_at. Every unique constraint on a
+# partitioned table has to include the partition key, hence the composite
+# primary key. Yearly partitions are added by store.archive as needed; the
+# default partition catches anything outside them.
+POSTGRES_TABLE = """
+CREATE TABLE store_archivedorder (
+    id bigint NOT NULL,
+    order_id varchar(100) NOT NULL,
+    user_id integer NOT NULL REFERENCES auth_user (id) DEFERRABLE INITIALLY DEFERRED,
+    status varchar(20) NOT NULL,
+    total_cost numeric(10, 2) NOT NULL,
+    item_count integer NOT NULL CHECK (item_count >= 0),
+    created_at timestamp with time zone NOT NULL,
+    archived_at timestamp with time zone NOT NULL,
+    payload bytea NOT NULL,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE TABLE store_archivedorder_default PARTITION OF store_archivedorder DEFAULT;
+CREATE INDEX store_archivedorder_order_id_idx ON store_archivedorder (order_id);
+CREATE INDEX store_archi_user_id_20172c_idx ON store_archivedorder (user_id, created_at DESC);
+"""
+
+
+def create_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(POSTGRES_TABLE)
+    else:
+        schema_editor.create_model(apps.get_model('store', 'ArchivedOrder'))
+
+
+def drop_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP TABLE store_archivedorder CASCADE')
+    else:
+        schema_editor.delete_model(apps.get_model('store', 'ArchivedOrder'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_order_id_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ArchivedOrder',
+                    fields=[
+                        ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                        ('order_id', models.CharField(db_index=True, max_length=100)),
+                        ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('shipped', 'Shipped'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled')], max_length=20)),
+                        ('total_cost', models.DecimalField(decimal_places=2, max_digits=10)),
+                        ('item_count', models.PositiveIntegerField()),
+                        ('created_at', models.DateTimeField()),
+                        ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                        ('payload', models.BinaryField()),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_orders', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'ordering': ['-created_at'],
+                        'indexes': [models.Index(fields=['user', '-created_at'], name='store_archi_user_id_20172c_idx')],
+                    },
+                ),
+            ],
+        ),
+        migrations.RunPython(create_table, drop_table),
+    ]
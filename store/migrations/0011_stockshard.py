@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-19 02:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_shards(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    StockShard = apps.get_model('store', 'StockShard')
+    count = settings.STOCK_SHARDS
+
+    def shards():
+        for pk, stock in Product.objects.values_list('pk', 'stock').iterator():
+            for shard in range(count):
+                yield StockShard(product_id=pk, shard=shard,
+                                 quantity=stock // count + (shard < stock % count))
+
+    StockShard.objects.bulk_create(shards(), batch_size=1000)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_archivedorder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_shards', to='store.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'shard'), name='unique_stock_shard')],
+            },
+        ),
+        migrations.RunPython(create_shards, migrations.RunPython.noop),
+    ]
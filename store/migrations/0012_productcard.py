@@ -0,0 +1,58 @@
+# Generated by Django 5.2.6 on 2026-10-19 03:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.text import Truncator
+
+
+def create_cards(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ProductCard = apps.get_model('store', 'ProductCard')
+
+    def cards():
+        for product in Product.objects.select_related('category').iterator(chunk_size=1000):
+            yield ProductCard(
+                product_id=product.pk,
+                category_id=product.category_id,
+                category_slug=product.category.slug,
+                name=product.name,
+                slug=product.slug,
+                summary=Truncator(product.description).words(15, truncate=' …'),
+                price=product.price,
+                stock=product.stock,
+                image_url=product.image.url if product.image else '',
+                available=product.available,
+                created_at=product.created_at,
+            )
+
+    ProductCard.objects.bulk_create(cards(), batch_size=1000)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_stockshard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCard',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='store.product')),
+                ('category_slug', models.SlugField(max_length=100)),
+                ('name', models.CharField(max_length=200)),
+                ('slug', models.SlugField(max_length=200)),
+                ('summary', models.CharField(blank=True, max_length=500)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('stock', models.PositiveIntegerField(default=0)),
+                ('image_url', models.CharField(blank=True, max_length=300)),
+                ('available', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField()),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.category')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['available', '-created_at'], name='store_produ_availab_91a192_idx'), models.Index(fields=['category', 'available', '-created_at'], name='store_produ_categor_11b42a_idx')],
+            },
+        ),
+        migrations.RunPython(create_cards, migrations.RunPython.noop),
+    ]
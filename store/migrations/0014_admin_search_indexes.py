@@ -0,0 +1,56 @@
+# Generated by Django 5.2.6 on 2026-10-19 03:31
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+import store.operations
+
+TRIGRAM_INDEX = 'store_product_name_trgm'
+
+
+def add_name_trigram_index(apps, schema_editor):
+    # Admin product search is name__icontains, UPPER(name) LIKE '%...%',
+    # which only a trigram index can serve (Postgres)
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {TRIGRAM_INDEX} '
+        f'ON store_product USING gin ((UPPER(name::text)) gin_trgm_ops)'
+    )
+
+
+def drop_name_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {TRIGRAM_INDEX}')
+
+
+class Migration(migrations.Migration):
+    # Concurrent index builds can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('store', '0013_backfillprogress'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Partitioned on Postgres, where CONCURRENTLY isn't supported
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(django.db.models.functions.text.Upper('order_id'), name='store_archived_order_id_upper'),
+        ),
+        store.operations.AddIndexOnline(
+            model_name='order',
+            index=models.Index(django.db.models.functions.text.Upper('order_id'), name='store_order_order_id_upper'),
+        ),
+        store.operations.AddIndexOnline(
+            model_name='order',
+            index=models.Index(django.db.models.functions.text.Upper('email'), name='store_order_email_upper'),
+        ),
+        store.operations.AddIndexOnline(
+            model_name='product',
+            index=models.Index(django.db.models.functions.text.Upper('slug'), name='store_product_slug_upper'),
+        ),
+        migrations.RunPython(add_name_trigram_index, drop_name_trigram_index),
+    ]
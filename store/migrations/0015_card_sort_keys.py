@@ -0,0 +1,79 @@
+# Generated by Django 5.2.6 on 2026-10-19 03:49
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import store.operations
+
+
+def copy_scores(apps, schema_editor):
+    ProductCard = apps.get_model('store', 'ProductCard')
+    ProductScore = apps.get_model('store', 'ProductScore')
+    scores = ProductScore.objects.filter(pk=OuterRef('pk'))
+    ProductCard.objects.filter(product__score__isnull=False).update(
+        popularity=Subquery(scores.values('popularity')[:1]),
+        trending=Subquery(scores.values('trending')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+    # Concurrent index builds can't run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('store', '0014_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productcard',
+            name='popularity',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productcard',
+            name='trending',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(copy_scores, migrations.RunPython.noop),
+        store.operations.AddIndexOnline(
+            model_name='productcard',
+            index=models.Index(fields=['available', '-popularity'], name='store_produ_availab_f9d7ac_idx'),
+        ),
+        store.operations.AddIndexOnline(
+            model_name='productcard',
+            index=models.Index(fields=['category', 'available', '-popularity'], name='store_produ_categor_a37db2_idx'),
+        ),
+        store.operations.AddIndexOnline(
+            model_name='productcard',
+            index=models.Index(fields=['available', '-trending'], name='store_produ_availab_cf7ccc_idx'),
+        ),
+        store.operations.AddIndexOnline(
+            model_name='productcard',
+            index=models.Index(fields=['category', 'available', '-trending'], name='store_produ_categor_83f59d_idx'),
+        ),
+        # Ranked listings are read off the card indexes now
+        migrations.RemoveIndex(
+            model_name='productscore',
+            name='store_produ_availab_9eebfe_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='productscore',
+            name='store_produ_categor_5204d2_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='productscore',
+            name='store_produ_availab_c2d2eb_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='productscore',
+            name='store_produ_categor_afc5ac_idx',
+        ),
+        migrations.RemoveField(
+            model_name='productscore',
+            name='available',
+        ),
+        migrations.RemoveField(
+            model_name='productscore',
+            name='category',
+        ),
+    ]
@@ -1,7 +1,11 @@
 from django.db import models
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import Coalesce, Upper
 from django.contrib.auth.models import User
 from django.urls import reverse
-from PIL import Image
+from django.utils import timezone
+from .ids import new_order_id
+from decimal import Decimal
 import logging
 
 logger = logging.getLogger(__name__)
@@ -40,6 +44,10 @@ class Product(models.Model):
             models.Index(fields=['slug']),
             models.Index(fields=['available']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['available', 'updated_at']),
+            models.Index(fields=['category', 'available', 'updated_at']),
+            # Admin search: "=slug" is an iexact lookup, UPPER(slug) = UPPER(%s)
+            models.Index(Upper('slug'), name='store_product_slug_upper'),
         ]
     
     def __str__(self):
@@ -51,6 +59,9 @@ class Product(models.Model):
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
         if self.image:
+            # Pillow is only needed here; importing it lazily keeps it out of
+            # every process that never saves an image
+            from PIL import Image
             img = Image.open(self.image.path)
             if img.height > 300 or img.width > 300:
                 output_size = (300, 300)
@@ -78,7 +89,7 @@ class Order(models.Model):
     ]
     
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
-    order_id = models.CharField(max_length=100, unique=True)
+    order_id = models.CharField(max_length=100, unique=True, default=new_order_id)
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
     email = models.EmailField()
@@ -89,15 +100,66 @@ class Order(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     total_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     status = models.CharField(max_length=20, choices=ORDER_STATUS_CHOICES, default='pending')
+    # Whether this order's lines are currently included in the sales rollups
+    counted_in_rollups = models.BooleanField(default=False)
+    # Whether this order's baskets are included in ProductCooccurrence
+    counted_in_recommendations = models.BooleanField(default=False)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['user', 'created_at']),
+            # Admin search ("=order_id", "=email") compares UPPER() of the column
+            models.Index(Upper('order_id'), name='store_order_order_id_upper'),
+            models.Index(Upper('email'), name='store_order_email_upper'),
+        ]
     
     def __str__(self):
         return f'Order {self.order_id}'
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so status transitions can be detected on save
+        if 'status' in field_names:
+            instance._loaded_status = instance.status
+        return instance
+    
     def get_total_cost(self):
-        return sum(item.get_cost() for item in self.items.all())
+        # Summed by the database rather than line by line in Python
+        cost = DecimalField(max_digits=12, decimal_places=2)
+        return self.items.aggregate(
+            total=Coalesce(Sum(F('price') * F('quantity'), output_field=cost), Decimal('0.00'), output_field=cost)
+        )['total']
+
+class ArchivedOrder(models.Model):
+    """
+    A delivered or cancelled order moved out of the live tables by
+    ``archive_orders``. The full order and its lines are kept as gzipped
+    JSON in ``payload`` (see store.archive). On Postgres the table is range
+    partitioned by ``created_at``.
+    """
+    id = models.BigIntegerField(primary_key=True)  # the original Order.pk
+    order_id = models.CharField(max_length=100, db_index=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    status = models.CharField(max_length=20, choices=Order.ORDER_STATUS_CHOICES)
+    total_cost = models.DecimalField(max_digits=10, decimal_places=2)
+    item_count = models.PositiveIntegerField()
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+    payload = models.BinaryField()
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at']),
+            models.Index(Upper('order_id'), name='store_archived_order_id_upper'),
+        ]
+
+    def __str__(self):
+        return f'Archived order {self.order_id}'
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
@@ -110,3 +172,246 @@ class OrderItem(models.Model):
     
     def get_cost(self):
         return self.price * self.quantity
+
+
+class Cart(models.Model):
+    """
+    Server-side cart for authenticated users. Totals are kept up to date
+    incrementally as lines change, so reads never aggregate the lines.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cart')
+    total_quantity = models.PositiveIntegerField(default=0)
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username}'s Cart"
+
+    def apply_delta(self, quantity, unit_price):
+        """Shift the cached totals by ``quantity`` units at ``unit_price``."""
+        if not quantity:
+            return
+        Cart.objects.filter(pk=self.pk).update(
+            total_quantity=models.F('total_quantity') + quantity,
+            total_price=models.F('total_price') + unit_price * quantity,
+        )
+        self.total_quantity += quantity
+        self.total_price += unit_price * quantity
+
+    def recalculate(self):
+        """Rebuild the cached totals from the lines in a single aggregate."""
+        totals = self.lines.aggregate(
+            line_quantity=models.Sum('quantity'),
+            line_price=models.Sum(models.F('price') * models.F('quantity')),
+        )
+        self.total_quantity = totals['line_quantity'] or 0
+        self.total_price = totals['line_price'] or 0
+        self.save(update_fields=['total_quantity', 'total_price', 'updated_at'])
+
+class CartLine(models.Model):
+    cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='lines')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
+
+    def __str__(self):
+        return f'{self.quantity} x {self.product.name}'
+
+class ProductScore(models.Model):
+    """
+    Time-decayed popularity scores per product, stored as log-weights
+    (see store.rankings). Flushes copy them onto ``ProductCard``, whose
+    indexes serve the ranked catalog pages.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='score')
+    popularity = models.FloatField(default=0)
+    trending = models.FloatField(default=0)
+
+    def __str__(self):
+        return f'Scores for {self.product_id}'
+
+class ProductCard(models.Model):
+    """
+    What a product grid shows, copied from the product and its category
+    (see store.cards): the summary is already truncated and the image URL
+    already resolved, and the ranking scores copied from ``ProductScore``,
+    so listings in any sort order are read off this table's indexes
+    without loading ``Product.description``.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    category_slug = models.SlugField(max_length=100)
+    name = models.CharField(max_length=200)
+    slug = models.SlugField(max_length=200)
+    summary = models.CharField(max_length=500, blank=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    stock = models.PositiveIntegerField(default=0)
+    image_url = models.CharField(max_length=300, blank=True)
+    available = models.BooleanField(default=True)
+    created_at = models.DateTimeField()
+    popularity = models.FloatField(default=0)
+    trending = models.FloatField(default=0)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['available', '-created_at']),
+            models.Index(fields=['category', 'available', '-created_at']),
+            models.Index(fields=['available', '-popularity']),
+            models.Index(fields=['category', 'available', '-popularity']),
+            models.Index(fields=['available', '-trending']),
+            models.Index(fields=['category', 'available', '-trending']),
+        ]
+
+    def __str__(self):
+        return f'Card for {self.name}'
+
+    def get_absolute_url(self):
+        return reverse('store:product_detail', kwargs={'slug': self.slug})
+
+class StockShard(models.Model):
+    """
+    One slice of a product's stock (see store.inventory). Checkouts
+    decrement a single shard, so concurrent orders for the same product
+    lock different rows; ``Product.stock`` holds the summed total for
+    display.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_shards')
+    shard = models.PositiveSmallIntegerField()
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'shard'], name='unique_stock_shard'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id}/{self.shard}: {self.quantity}'
+
+class SalesRollup(models.Model):
+    PERIOD_CHOICES = [
+        ('hour', 'Hourly'),
+        ('day', 'Daily'),
+    ]
+
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField()
+    units = models.BigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.BigIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        ordering = ['-bucket']
+
+class ProductSales(SalesRollup):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales')
+
+    class Meta(SalesRollup.Meta):
+        verbose_name_plural = 'Product sales'
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'product'], name='unique_product_sales_bucket'),
+        ]
+
+    def __str__(self):
+        return f'{self.product} {self.period} {self.bucket:%Y-%m-%d %H:%M}'
+
+class CategorySales(SalesRollup):
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='sales')
+
+    class Meta(SalesRollup.Meta):
+        verbose_name_plural = 'Category sales'
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'bucket', 'category'], name='unique_category_sales_bucket'),
+        ]
+
+    def __str__(self):
+        return f'{self.category} {self.period} {self.bucket:%Y-%m-%d %H:%M}'
+
+class ProductCooccurrence(models.Model):
+    """
+    Sparse, symmetric co-purchase matrix: one row per ordered pair of
+    products that appeared in the same order, with the number of such
+    orders. Indexed so a product's top neighbours are a single range scan.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='cooccurrences')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'related'], name='unique_product_cooccurrence'),
+        ]
+        indexes = [
+            models.Index(fields=['product', '-count']),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} -> {self.related_id} ({self.count})'
+
+class OutboxJob(models.Model):
+    """
+    Side effect recorded in the same transaction as the change that caused
+    it, and carried out later by the ``run_outbox_worker`` command.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['available_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+            models.Index(fields=['locked_by']),
+        ]
+
+    def __str__(self):
+        return f'{self.topic} #{self.pk} ({self.status})'
+
+class BackfillProgress(models.Model):
+    """
+    Checkpoint of a background backfill (see store.backfills), written in
+    the same transaction as each chunk so a restarted run resumes exactly
+    after the last chunk that committed.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    target_id = models.BigIntegerField(default=0)
+    rows = models.BigIntegerField(default=0)
+    chunks = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'Backfill progress'
+        ordering = ['name']
+
+    def __str__(self):
+        return f'{self.name} at id {self.last_id}/{self.target_id}'
+
+    @property
+    def percent(self):
+        if self.finished_at or not self.target_id:
+            return 100.0
+        return min(100.0, 100.0 * self.last_id / self.target_id)
@@ -0,0 +1,25 @@
+"""
+Money as integer pence.
+
+The database keeps prices in ``DecimalField`` columns and templates show
+``Decimal`` pounds. In between, session carts and cart totals keep
+amounts as plain ``int`` pence, so adding up a basket is integer
+arithmetic and only the final figure becomes a ``Decimal``. Order totals
+are summed by the database instead (``Order.get_total_cost``).
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+def to_pence(amount):
+    """Pence in a ``Decimal`` or string amount of pounds, e.g. ``'9.99'`` -> 999."""
+    return int((Decimal(amount) * 100).to_integral_value(ROUND_HALF_UP))
+
+def from_pence(pence):
+    """Pounds as a two-place ``Decimal``, e.g. 999 -> ``Decimal('9.99')``."""
+    return Decimal(pence).scaleb(-2)
+
+def stored_pence(value):
+    """
+    Pence from a session cart price. Sessions written before prices were
+    kept in pence hold pound strings instead.
+    """
+    return value if isinstance(value, int) else to_pence(value)
@@ -0,0 +1,132 @@
+"""
+Live order status notifications.
+
+:func:`order_status_changed` publishes a message once the change commits.
+It is called for saves (``signals.py``) and for the admin's bulk status
+actions. ``views.order_events`` streams the messages to the customer as
+Server-Sent Events.
+
+Every process keeps one queue per open stream and fans messages out to
+them, so an idle stream costs a coroutine and a queue, not a thread. With
+``ORDER_EVENTS_REDIS_URL`` set, messages travel over Redis pub/sub. Each
+process holds a single pattern subscription for all users, not one
+connection per stream. Without it they are delivered in-process only,
+which is enough for ``runserver`` and tests.
+"""
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from functools import partial
+from django.conf import settings
+from django.db import transaction
+from .models import Order
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'orders:user:{}'
+QUEUE_SIZE = 100
+
+class Broker:
+    """Delivers messages to this process's subscribers."""
+    def __init__(self):
+        self.subscribers = defaultdict(set)
+
+    def deliver(self, user_id, message):
+        for loop, queue in list(self.subscribers.get(user_id, ())):
+            loop.call_soon_threadsafe(self._put, queue, message)
+
+    def _put(self, queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # A stuck client; it gets a fresh snapshot when it reconnects
+            pass
+
+    def publish(self, user_id, message):
+        self.deliver(user_id, message)
+
+    async def start(self):
+        pass
+
+    def subscribe(self, user_id):
+        """``async with`` a queue receiving ``user_id``'s messages while open."""
+        return Subscription(self, user_id)
+
+class Subscription:
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+
+    async def __aenter__(self):
+        await self.broker.start()
+        self.entry = (asyncio.get_running_loop(), asyncio.Queue(QUEUE_SIZE))
+        self.broker.subscribers[self.user_id].add(self.entry)
+        return self.entry[1]
+
+    async def __aexit__(self, *exc_info):
+        subscribers = self.broker.subscribers
+        subscribers[self.user_id].discard(self.entry)
+        if not subscribers[self.user_id]:
+            del subscribers[self.user_id]
+
+class RedisBroker(Broker):
+    """Publishes through Redis; one listener task per process fans out."""
+    def __init__(self, url):
+        super().__init__()
+        self.url = url
+        self.listener = None
+        self._client = None
+
+    def publish(self, user_id, message):
+        import redis
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url)
+        self._client.publish(CHANNEL.format(user_id), json.dumps(message))
+
+    async def start(self):
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.create_task(self.listen())
+
+    async def listen(self):
+        import redis.asyncio
+        while True:
+            try:
+                client = redis.asyncio.Redis.from_url(self.url)
+                async with client.pubsub() as pubsub:
+                    await pubsub.psubscribe(CHANNEL.format('*'))
+                    async for message in pubsub.listen():
+                        if message['type'] != 'pmessage':
+                            continue
+                        user_id = int(message['channel'].decode().rsplit(':', 1)[1])
+                        self.deliver(user_id, json.loads(message['data']))
+            except (redis.RedisError, OSError) as e:
+                logger.warning(f'Order event listener lost Redis, retrying: {e}')
+                await asyncio.sleep(1)
+
+_broker = None
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        url = settings.ORDER_EVENTS_REDIS_URL
+        _broker = RedisBroker(url) if url else Broker()
+    return _broker
+
+def status_message(order_id, status):
+    return {
+        'order_id': order_id,
+        'status': status,
+        'status_display': dict(Order.ORDER_STATUS_CHOICES).get(status, status),
+    }
+
+def _publish(user_id, message):
+    try:
+        get_broker().publish(user_id, message)
+    except Exception as e:
+        # Live updates are best-effort; the page shows the truth on reload
+        logger.warning(f'Could not publish order event: {e}')
+
+def order_status_changed(user_id, order_id, status):
+    """Tell ``user_id``'s open streams about the new status after commit."""
+    transaction.on_commit(partial(_publish, user_id, status_message(order_id, status)))
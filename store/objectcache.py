@@ -0,0 +1,156 @@
+"""
+Two-tier cache of ``Product`` and ``Category`` instances by id and slug.
+
+The first tier is a small LRU in each worker process, so the hottest
+lookups cost no network hop at all. Behind it sits the shared cache (Redis
+in production), then the database. Every instance has a version key in the
+shared cache, replaced with a fresh token whenever the row is saved or
+deleted. Shared entries are stored under their version, so a bump makes
+them unreachable everywhere at once. Local entries are trusted for
+``OBJECT_CACHE_LOCAL_SECONDS`` and then revalidated against the version
+key. Other workers see a change within that window, and the worker that
+made it sees it at once.
+
+Slugs map to ids. The slug of the instance found is checked, so a
+renamed row is never served under its old slug. Callers get a copy they
+are free to modify.
+"""
+import copy
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+class LocalCache:
+    """Thread-safe LRU of ``key -> (expires_at, version, value)``."""
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, version, value):
+        expires_at = time.monotonic() + settings.OBJECT_CACHE_LOCAL_SECONDS
+        with self.lock:
+            self.entries[key] = (expires_at, version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > settings.OBJECT_CACHE_LOCAL_SIZE:
+                self.entries.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+local = LocalCache()
+
+def _label(model):
+    return model._meta.label_lower
+
+def version_key(model, pk):
+    return f'objcache:{_label(model)}:{pk}:version'
+
+def object_key(model, pk, version):
+    return f'objcache:{_label(model)}:{pk}:{version}'
+
+def slug_key(model, slug):
+    return f'objcache:{_label(model)}:slug:{slug}'
+
+def _new_version():
+    return secrets.token_hex(8)
+
+def _versions(model, pks):
+    """Current version token per pk, creating any that are missing."""
+    keys = {version_key(model, pk): pk for pk in pks}
+    found = cache.get_many(keys)
+    versions = {keys[key]: version for key, version in found.items()}
+    for key, pk in keys.items():
+        if pk not in versions:
+            version = _new_version()
+            # Another worker may have created it meanwhile; use theirs
+            if not cache.add(key, version, timeout=None):
+                version = cache.get(key, version)
+            versions[pk] = version
+    return versions
+
+def get_many(model, pks):
+    """``{pk: instance}`` for the rows that exist, like ``in_bulk``."""
+    now = time.monotonic()
+    found = {}
+    stale = {}
+    for pk in set(pks):
+        entry = local.get((_label(model), pk))
+        if entry is None:
+            continue
+        expires_at, version, instance = entry
+        if expires_at > now:
+            found[pk] = instance
+        else:
+            stale[pk] = entry
+    missing = [pk for pk in set(pks) if pk not in found]
+    if missing:
+        versions = _versions(model, missing)
+        # Expired local entries are still good if nothing was saved since
+        for pk, (_, version, instance) in stale.items():
+            if versions[pk] == version:
+                local.set((_label(model), pk), version, instance)
+                found[pk] = instance
+        missing = [pk for pk in missing if pk not in found]
+        keys = {object_key(model, pk, versions[pk]): pk for pk in missing}
+        shared = {keys[key]: instance for key, instance in cache.get_many(keys).items()}
+        loaded = model._default_manager.in_bulk([pk for pk in missing if pk not in shared])
+        if loaded:
+            cache.set_many(
+                {object_key(model, pk, versions[pk]): instance for pk, instance in loaded.items()},
+                settings.OBJECT_CACHE_SECONDS,
+            )
+        for pk, instance in {**shared, **loaded}.items():
+            local.set((_label(model), pk), versions[pk], instance)
+            found[pk] = instance
+    return {pk: copy.copy(instance) for pk, instance in found.items()}
+
+def get(model, pk):
+    return get_many(model, [pk]).get(pk)
+
+def get_by_slug(model, slug):
+    """The instance with ``slug``, or ``None`` if there isn't one."""
+    entry = local.get((_label(model), 'slug', slug))
+    pk = entry[2] if entry is not None else cache.get(slug_key(model, slug))
+    if pk is not None:
+        instance = get(model, pk)
+        if instance is not None and instance.slug == slug:
+            return instance
+    pk = model._default_manager.filter(slug=slug).values_list('pk', flat=True).first()
+    if pk is None:
+        return None
+    # A stale slug -> id entry is harmless: the slug is checked on every hit
+    local.set((_label(model), 'slug', slug), None, pk)
+    cache.set(slug_key(model, slug), pk, settings.OBJECT_CACHE_SECONDS)
+    return get(model, pk)
+
+def _bump(model, pks):
+    for pk in pks:
+        local.pop((_label(model), pk))
+    cache.set_many({version_key(model, pk): _new_version() for pk in pks}, timeout=None)
+
+def invalidate(model, pks):
+    """
+    Drop cached copies of these rows here and, via their versions,
+    everywhere. Done again once the transaction commits: until then other
+    workers still read the old row and could cache it under the new version.
+    """
+    pks = list(pks)
+    _bump(model, pks)
+    transaction.on_commit(partial(_bump, model, pks))
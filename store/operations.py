@@ -0,0 +1,49 @@
+"""
+Migration operations for large tables.
+
+``AddIndexOnline`` builds the index with ``CREATE INDEX CONCURRENTLY`` on
+Postgres, so writes to the table carry on while it builds. Concurrent
+builds can't run in a transaction: the migration using it must set
+``atomic = False``. Other databases get a plain ``AddIndex``.
+"""
+from django.db import NotSupportedError
+from django.db.migrations.operations import AddIndex
+
+class AddIndexOnline(AddIndex):
+    def _postgres(self, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return False
+        if schema_editor.atomic_migration:
+            raise NotSupportedError(
+                f'{self.__class__.__name__} needs a migration with "atomic = False".'
+            )
+        return True
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if not self._postgres(schema_editor):
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        # An interrupted concurrent build leaves an INVALID index behind,
+        # which would make the retry fail; drop it first
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid '
+                'WHERE pg_class.relname = %s AND NOT pg_index.indisvalid',
+                [self.index.name],
+            )
+            invalid = cursor.fetchone() is not None
+        if invalid:
+            schema_editor.remove_index(model, self.index, concurrently=True)
+        schema_editor.add_index(model, self.index, concurrently=True)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if not self._postgres(schema_editor):
+            return super().database_backwards(app_label, schema_editor, from_state, to_state)
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.index, concurrently=True)
+
+    def describe(self):
+        return super().describe() + ' concurrently'
@@ -0,0 +1,137 @@
+"""
+Transactional outbox.
+
+Views call :func:`enqueue` inside the transaction that makes the business
+change, so a job exists if and only if the change committed. The
+``run_outbox_worker`` command claims pending jobs in batches, runs their
+handlers concurrently and retries failures with exponential backoff.
+"""
+import random
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from .models import OutboxJob
+import logging
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+def handler(topic):
+    """Register ``func(payload)`` as the handler for ``topic``."""
+    def decorator(func):
+        HANDLERS[topic] = func
+        return func
+    return decorator
+
+def enqueue(topic, payload, delay=0):
+    return OutboxJob.objects.create(
+        topic=topic,
+        payload=payload,
+        available_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+def enqueue_many(topic, payloads):
+    return OutboxJob.objects.bulk_create(
+        [OutboxJob(topic=topic, payload=payload) for payload in payloads]
+    )
+
+def backoff_delay(attempts):
+    base = settings.OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1)
+    delay = min(base, settings.OUTBOX_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+def release_stale_jobs():
+    """Hand jobs held by a worker that died mid-batch back to the queue."""
+    cutoff = timezone.now() - timedelta(seconds=settings.OUTBOX_LOCK_TIMEOUT)
+    return OutboxJob.objects.filter(status='running', locked_at__lt=cutoff).update(
+        status='pending', locked_by='', locked_at=None
+    )
+
+def claim_batch(worker_id, batch_size):
+    """
+    Atomically move up to ``batch_size`` due jobs to ``running`` for this
+    worker and return them.
+
+    On backends with ``SKIP LOCKED`` (Postgres) concurrent workers skip rows
+    another worker is claiming. Elsewhere (SQLite) the claim is a
+    conditional ``UPDATE ... WHERE status = 'pending'`` tagged with a
+    per-batch token, so only rows this worker actually flipped are returned.
+    """
+    now = timezone.now()
+    claim = f'{worker_id}:{uuid.uuid4().hex[:12]}'
+    due = OutboxJob.objects.filter(status='pending', available_at__lte=now)
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return []
+        OutboxJob.objects.filter(id__in=ids, status='pending').update(
+            status='running', locked_by=claim, locked_at=now
+        )
+    return list(OutboxJob.objects.filter(locked_by=claim, status='running'))
+
+def run_job(job):
+    job.attempts += 1
+    try:
+        func = HANDLERS.get(job.topic)
+        if func is None:
+            raise LookupError(f'No outbox handler registered for {job.topic}')
+        func(job.payload)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            job.status = 'failed'
+            logger.error(f'Outbox job {job.pk} ({job.topic}) failed permanently')
+        else:
+            job.status = 'pending'
+            job.available_at = timezone.now() + timedelta(seconds=backoff_delay(job.attempts))
+            logger.warning(f'Outbox job {job.pk} ({job.topic}) failed, retry {job.attempts}')
+    else:
+        job.status = 'done'
+        job.last_error = ''
+    # Only while this claim still holds: past OUTBOX_LOCK_TIMEOUT the job
+    # may have been handed to another worker, whose result must stand
+    claim = job.locked_by
+    job.locked_by = ''
+    job.locked_at = None
+    finished = OutboxJob.objects.filter(pk=job.pk, locked_by=claim).update(
+        attempts=job.attempts,
+        status=job.status,
+        available_at=job.available_at,
+        last_error=job.last_error,
+        locked_by='',
+        locked_at=None,
+        updated_at=timezone.now(),
+    )
+    if not finished:
+        logger.warning(f'Outbox job {job.pk} ({job.topic}) was reclaimed by another worker; result dropped')
+    return job.status
+
+def _run_in_thread(job):
+    try:
+        return run_job(job)
+    finally:
+        close_old_connections()
+
+def process_batch(worker_id, batch_size, executor=None):
+    """Claim and run one batch; returns the number of jobs claimed."""
+    jobs = claim_batch(worker_id, batch_size)
+    if not jobs:
+        return 0
+    if executor is None:
+        for job in jobs:
+            run_job(job)
+    else:
+        list(executor.map(_run_in_thread, jobs))
+    return len(jobs)
+
+def make_executor(concurrency):
+    if concurrency <= 1:
+        return None
+    return ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='outbox')
@@ -0,0 +1,120 @@
+"""
+Template render profiling.
+
+When installed, every ``Template._render`` call is timed, which covers page
+templates, ``{% extends %}`` parents and ``{% include %}``d templates, as
+well as every ``{% block %}``. Timings are kept both inclusive ("total") and
+exclusive of nested templates/blocks ("own"), aggregated per process and
+per request. Enable with ``TEMPLATE_PROFILING=True`` to get a
+``Server-Timing`` header on each response, or run the ``profile_templates``
+management command.
+"""
+import threading
+import time
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.template.base import Template
+from django.template.loader_tags import BlockNode
+import logging
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_local = threading.local()
+_stats = {}
+_originals = {}
+
+def _record(table, name, total, own):
+    entry = table.get(name)
+    if entry is None:
+        entry = table[name] = [0, 0.0, 0.0]
+    entry[0] += 1
+    entry[1] += total
+    entry[2] += own
+
+def _timed(name, render, *args):
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    frame = [0.0]  # time spent in nested frames
+    stack.append(frame)
+    start = time.perf_counter()
+    try:
+        return render(*args)
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        if stack:
+            stack[-1][0] += elapsed
+        own = elapsed - frame[0]
+        with _lock:
+            _record(_stats, name, elapsed, own)
+        request_stats = getattr(_local, 'request', None)
+        if request_stats is not None:
+            _record(request_stats, name, elapsed, own)
+
+def install():
+    if _originals:
+        return
+    _originals['template'] = original_template_render = Template._render
+    _originals['block'] = original_block_render = BlockNode.render
+
+    def template_render(self, context):
+        name = self.origin.template_name or self.name or '<string>'
+        return _timed(name, original_template_render, self, context)
+
+    def block_render(self, context):
+        name = f'{context.template_name}#{self.name}'
+        return _timed(name, original_block_render, self, context)
+
+    Template._render = template_render
+    BlockNode.render = block_render
+
+def uninstall():
+    if not _originals:
+        return
+    Template._render = _originals.pop('template')
+    BlockNode.render = _originals.pop('block')
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+def get_stats():
+    """
+    Return ``(name, calls, total_seconds, own_seconds)`` rows, most
+    expensive own time first.
+    """
+    with _lock:
+        rows = [(name, *entry) for name, entry in _stats.items()]
+    return sorted(rows, key=lambda row: row[3], reverse=True)
+
+class TemplateProfilingMiddleware:
+    """
+    Adds a ``Server-Timing`` header listing the templates and blocks with
+    the highest own render time for each request.
+    """
+    def __init__(self, get_response):
+        if not settings.TEMPLATE_PROFILING:
+            raise MiddlewareNotUsed
+        install()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _local.request = {}
+        try:
+            response = self.get_response(request)
+        finally:
+            request_stats, _local.request = _local.request, None
+        if request_stats:
+            top = sorted(request_stats.items(), key=lambda item: item[1][2], reverse=True)
+            top = top[:settings.TEMPLATE_PROFILING_ENTRIES]
+            response['Server-Timing'] = ', '.join(
+                f'tpl{index};desc="{name}";dur={own * 1000:.2f}'
+                for index, (name, (calls, total, own)) in enumerate(top)
+            )
+            logger.info(
+                f'Template render for {request.path}: '
+                + ', '.join(f'{name}={own * 1000:.2f}ms' for name, (_, _, own) in top)
+            )
+        return response
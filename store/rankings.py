@@ -0,0 +1,156 @@
+"""
+Time-decayed "popular" and "trending" product rankings.
+
+Scores use forward decay: an event at time ``t`` weighs
+``2 ** ((t - epoch) / half_life)``, so later events outweigh earlier ones
+and rows never need to be rescaled as time passes. Scores are stored as the
+natural log of that sum, which keeps them small; adding an event is an
+atomic log-add-exp ``UPDATE`` on one row.
+
+Views and sales are counted with atomic cache increments on the request
+path, and the first event for a product since the last flush appends its
+id to a dirty log in the cache. ``flush_rankings`` reads only the logged
+products' counters, folds them into ``ProductScore`` in batches and copies the new scores onto ``ProductCard``. Catalog pages
+sorted by rank read the cards through their ``(category, available,
+-score)`` indexes, so no ``OrderItem`` aggregate or join runs on the
+request path.
+"""
+import math
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone
+from .models import ProductScore
+from . import cards
+
+# ?sort= value -> ProductScore / ProductCard field
+SORTS = {
+    'popular': 'popularity',
+    'trending': 'trending',
+}
+COUNTERS = ('views', 'units')
+VERSION_KEY = 'rankings:version'
+DIRTY_SEQ_KEY = 'rankings:dirty'
+FLUSHED_SEQ_KEY = 'rankings:flushed'
+# A product whose log entry was lost (evicted, or written while a flush
+# read the log) is logged again by its first event after this long
+DIRTY_MARK_TIMEOUT = 3600
+
+def counter_key(counter, product_id):
+    return f'rankings:{counter}:{product_id}'
+
+def dirty_key(seq):
+    return f'rankings:dirty:{seq}'
+
+def marker_key(product_id):
+    return f'rankings:marked:{product_id}'
+
+def _incr(key, amount):
+    try:
+        return cache.incr(key, amount)
+    except ValueError:
+        if cache.add(key, amount, timeout=None):
+            return amount
+        return cache.incr(key, amount)
+
+def _mark_dirty(product_id):
+    # One log entry per product between flushes
+    if cache.add(marker_key(product_id), 1, timeout=DIRTY_MARK_TIMEOUT):
+        seq = _incr(DIRTY_SEQ_KEY, 1)
+        cache.set(dirty_key(seq), product_id, timeout=None)
+
+def record_view(product_id):
+    _incr(counter_key('views', product_id), 1)
+    _mark_dirty(product_id)
+
+def record_sale(product_id, quantity):
+    _incr(counter_key('units', product_id), quantity)
+    _mark_dirty(product_id)
+
+def version():
+    return cache.get(VERSION_KEY, 0)
+
+def event_weights(views, units):
+    """Undecayed weight each ranking gets from the pending counts."""
+    return {
+        'popularity': units,
+        'trending': views * settings.RANKINGS_VIEW_WEIGHT + units * settings.RANKINGS_SALE_WEIGHT,
+    }
+
+def log_weight(field, weight, now):
+    epoch = datetime.fromisoformat(settings.RANKINGS_EPOCH)
+    half_life = settings.RANKINGS_HALF_LIFE_HOURS[field] * 3600
+    return math.log(weight) + math.log(2) * (now - epoch).total_seconds() / half_life
+
+def _log_add(field, value):
+    # ln(e^a + e^b) = max(a, b) + ln(1 + e^-|a - b|), stable for large scores
+    current = F(field)
+    value = Value(value, output_field=FloatField())
+    return Greatest(current, value) + Ln(Value(1.0) + Exp(-Abs(current - value)))
+
+def dirty_ids(chunk_size):
+    """
+    Yield the ids logged since the last flush, up to ``chunk_size`` log
+    entries at a time. Entries are consumed as they are read.
+    """
+    end = cache.get(DIRTY_SEQ_KEY, 0)
+    start = cache.get(FLUSHED_SEQ_KEY, 0)
+    if start > end:
+        # The sequence was evicted and started again
+        start = 0
+    for first in range(start + 1, end + 1, chunk_size):
+        keys = [dirty_key(seq) for seq in range(first, min(first + chunk_size, end + 1))]
+        ids = sorted(set(cache.get_many(keys).values()))
+        cache.delete_many(keys)
+        # Unmarked before their counters are read, so events from here on
+        # log them again for the next flush
+        cache.delete_many([marker_key(pk) for pk in ids])
+        yield ids
+        cache.set(FLUSHED_SEQ_KEY, first + len(keys) - 1, timeout=None)
+
+def flush(now=None, chunk_size=1000):
+    """
+    Move the pending cache counters of logged products into
+    ``ProductScore`` and copy the new scores onto their cards. Counters are
+    decremented by what was applied, so increments racing the flush are
+    kept for the next one. Returns the number of products updated.
+    """
+    now = now or timezone.now()
+    updated = 0
+    for ids in dirty_ids(chunk_size):
+        pending = cache.get_many([counter_key(c, pk) for pk in ids for c in COUNTERS])
+        pending = {key: count for key, count in pending.items() if count}
+        if not pending:
+            continue
+        with transaction.atomic():
+            changed = []
+            for pk in ids:
+                weights = event_weights(
+                    pending.get(counter_key('views', pk), 0),
+                    pending.get(counter_key('units', pk), 0),
+                )
+                changes = {
+                    field: _log_add(field, log_weight(field, weight, now))
+                    for field, weight in weights.items() if weight > 0
+                }
+                if changes and ProductScore.objects.filter(pk=pk).update(**changes):
+                    changed.append(pk)
+            cards.sync_scores(changed)
+            updated += len(changed)
+        for key, count in pending.items():
+            try:
+                cache.decr(key, count)
+            except ValueError:
+                # Evicted since it was read; its count is already applied
+                pass
+    if updated:
+        _incr(VERSION_KEY, 1)
+    return updated
+
+def sync_product(product, created):
+    """Give new products a score row to flush into."""
+    if created:
+        ProductScore.objects.get_or_create(product=product)
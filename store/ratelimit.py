@@ -0,0 +1,139 @@
+"""
+Cache-backed request rate limiting.
+
+``RateLimitMiddleware`` sits before the session and auth middleware. It
+resolves the URL name, checks the matching ``RATE_LIMITS`` rule and
+answers 429 before any session, user or ORM work happens. Clients are
+identified by IP and, for ``user_rate``, by their session cookie, or by IP
+again when they send none. ``user_rate`` is therefore per session, not per
+user: a logged-in user gets a fresh budget with each new session, and a
+client inventing a new cookie for every request is held only by ``rate``
+on its IP.
+
+Limits use a sliding-window counter: an atomic increment on the current
+fixed window, plus the previous window's count weighted by how much of it
+still overlaps the last ``period`` seconds. Two cache keys per client and
+rule give a smooth limit without storing every timestamp. In production
+the counters live in Redis (see ``production_settings.py``), so all
+workers share them; locmem serves tests and development.
+"""
+import hashlib
+import math
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+THROTTLED_KEY = 'ratelimit:throttled:{}'
+
+def parse_rate(rate):
+    """``'30/m'`` -> ``(30, 60)``."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period]
+
+def get_cache():
+    return caches[settings.RATE_LIMIT_CACHE]
+
+def _incr(cache, key, timeout):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, 1, timeout=timeout):
+            return 1
+        return cache.incr(key)
+
+def client_ip(request):
+    """
+    Client address, trusting ``RATE_LIMIT_TRUSTED_PROXIES`` hops of
+    ``X-Forwarded-For`` (set by the load balancer, not the client).
+    """
+    proxies = settings.RATE_LIMIT_TRUSTED_PROXIES
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if proxies and forwarded:
+        hops = [hop.strip() for hop in forwarded.split(',')]
+        return hops[-proxies] if len(hops) >= proxies else hops[0]
+    return request.META.get('REMOTE_ADDR', '')
+
+def session_ident(request):
+    """
+    A per-visitor identity read from the session cookie, without loading
+    the session. Hashed so session keys never appear in cache key names.
+    """
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not session_key:
+        return None
+    return hashlib.sha256(session_key.encode()).hexdigest()[:32]
+
+def hit(name, ident, limit, period, now=None):
+    """
+    Count one request and return ``(allowed, retry_after_seconds)``.
+    Rejected requests count too, so a client that keeps hammering stays
+    throttled.
+    """
+    cache = get_cache()
+    now = time.time() if now is None else now
+    window = int(now // period)
+    key = f'ratelimit:{name}:{ident}:'
+    current = _incr(cache, f'{key}{window}', timeout=period * 2)
+    previous = cache.get(f'{key}{window - 1}', 0)
+    overlap = 1 - (now % period) / period
+    if previous * overlap + current <= limit:
+        return True, 0
+    return False, max(1, math.ceil(period - now % period))
+
+def matching_rule(request, name):
+    rule = settings.RATE_LIMITS.get(name)
+    if rule is None:
+        return None
+    if 'methods' in rule and request.method not in rule['methods']:
+        return None
+    if 'param' in rule and not request.GET.get(rule['param']):
+        return None
+    return rule
+
+def throttled_counts():
+    """Rejected requests per rule since the counters were last reset."""
+    names = list(settings.RATE_LIMITS)
+    counts = get_cache().get_many([THROTTLED_KEY.format(name) for name in names])
+    return {name: counts.get(THROTTLED_KEY.format(name), 0) for name in names}
+
+def reset_throttled_counts():
+    get_cache().delete_many([THROTTLED_KEY.format(name) for name in settings.RATE_LIMITS])
+
+class RateLimitMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if settings.RATE_LIMIT_ENABLED:
+            try:
+                match = resolve(request.path_info)
+            except Resolver404:
+                match = None
+            name = match.view_name if match is not None else None
+            rule = matching_rule(request, name) if name else None
+            if rule is not None:
+                allowed, retry_after = self.check(request, name, rule)
+                if not allowed:
+                    _incr(get_cache(), THROTTLED_KEY.format(name), timeout=None)
+                    response = HttpResponse('Too many requests, please slow down.', status=429,
+                                            content_type='text/plain')
+                    response['Retry-After'] = str(retry_after)
+                    return response
+        return self.get_response(request)
+
+    def check(self, request, name, rule):
+        # Every rule limits per client IP; ``user_rate`` adds a tighter
+        # limit per session so one visitor can't use a shared IP's budget
+        ip = client_ip(request)
+        limit, period = parse_rate(rule['rate'])
+        allowed, retry_after = hit(name, f'ip:{ip}', limit, period)
+        if allowed and 'user_rate' in rule:
+            ident = session_ident(request)
+            # Without a cookie the tighter limit applies to the IP instead
+            ident = f'session:{ident}' if ident is not None else f'anon:{ip}'
+            limit, period = parse_rate(rule['user_rate'])
+            allowed, retry_after = hit(name, ident, limit, period)
+        return allowed, retry_after
@@ -0,0 +1,121 @@
+"""
+"Frequently bought together" recommendations.
+
+Order history is folded into ``ProductCooccurrence``, a sparse pair-count
+matrix kept as a dictionary of keys while a chunk of orders is processed
+and then added to the table with one batched upsert. New orders are added
+incrementally by the ``recommendations.add_order`` outbox job. At request
+time a product's top-k neighbours come from one range scan of the
+``(product, -count)`` index, stopped after k rows and cached per product,
+so nothing is sorted or aggregated while rendering. The full matrix is
+kept rather than each product's top k: incremental counts need every
+pair, since one outside the top k today can overtake tomorrow.
+"""
+from collections import Counter
+from functools import partial
+from itertools import combinations, groupby
+from operator import itemgetter
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .db import bulk_increment
+from .models import Order, OrderItem, Product, ProductCooccurrence
+
+def cache_key(product_id):
+    return f'recommendations:{product_id}'
+
+def pair_counts(lines):
+    """
+    Count co-purchases from ``(order_id, product_id)`` tuples sorted by
+    order. Baskets larger than ``RECOMMENDATIONS_MAX_BASKET`` are skipped:
+    they add quadratically many weak pairs.
+    """
+    counts = Counter()
+    for _, basket in groupby(lines, key=itemgetter(0)):
+        products = sorted({product_id for _, product_id in basket})
+        if len(products) > settings.RECOMMENDATIONS_MAX_BASKET:
+            continue
+        for a, b in combinations(products, 2):
+            counts[(a, b)] += 1
+    return counts
+
+def apply_pair_counts(counts):
+    rows = []
+    for (a, b), count in counts.items():
+        rows.append((a, b, count))
+        rows.append((b, a, count))
+    bulk_increment(ProductCooccurrence, ['product', 'related'], ['count'], rows)
+    touched = {a for a, _ in counts} | {b for _, b in counts}
+    # Until the counts commit, readers would just cache the old lists again
+    transaction.on_commit(partial(cache.delete_many, [cache_key(product_id) for product_id in touched]))
+
+def basket_lines(order_ids):
+    return OrderItem.objects.filter(order_id__in=order_ids).order_by('order_id').values_list(
+        'order_id', 'product_id'
+    )
+
+def add_orders(order_ids):
+    """
+    Count the given orders, skipping any already counted. Returns the
+    number of orders added.
+    """
+    with transaction.atomic():
+        ids = list(
+            Order.objects.select_for_update()
+            .filter(id__in=order_ids, counted_in_recommendations=False)
+            .values_list('id', flat=True)
+        )
+        if not ids:
+            return 0
+        apply_pair_counts(pair_counts(basket_lines(ids)))
+        Order.objects.filter(id__in=ids).update(counted_in_recommendations=True)
+    return len(ids)
+
+def build_chunk(after_id, chunk_size):
+    """
+    Count the next ``chunk_size`` uncounted orders with ``id > after_id``.
+    Returns the last id seen, or ``None`` when done.
+    """
+    ids = list(
+        Order.objects.filter(id__gt=after_id, counted_in_recommendations=False)
+        .order_by('id')
+        .values_list('id', flat=True)[:chunk_size]
+    )
+    if not ids:
+        return None
+    add_orders(ids)
+    return ids[-1]
+
+def count_archived(batch):
+    """
+    Add a batch of ``(archived, data)`` pairs from
+    ``archive.payload_batches``; only for rebuilding the matrix from scratch.
+    """
+    product_ids = {line['product_id'] for _, data in batch for line in data['items']}
+    existing = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+    lines = [
+        (archived.id, line['product_id'])
+        for archived, data in batch
+        for line in data['items']
+        if line['product_id'] in existing
+    ]
+    with transaction.atomic():
+        apply_pair_counts(pair_counts(lines))
+
+def related_ids(product_id):
+    ids = cache.get(cache_key(product_id))
+    if ids is None:
+        ids = list(
+            ProductCooccurrence.objects.filter(product_id=product_id)
+            .order_by('-count', 'related_id')
+            .values_list('related_id', flat=True)[:settings.RECOMMENDATIONS_PER_PRODUCT]
+        )
+        cache.set(cache_key(product_id), ids, settings.RECOMMENDATIONS_CACHE_SECONDS)
+    return ids
+
+def for_product(product):
+    ids = related_ids(product.id)
+    if not ids:
+        return []
+    products = Product.objects.filter(id__in=ids, available=True).in_bulk()
+    return [products[product_id] for product_id in ids if product_id in products]
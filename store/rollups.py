@@ -0,0 +1,123 @@
+"""
+Hourly and daily sales rollups per product and per category.
+
+Rollup rows are only ever adjusted by deltas: an order's lines are added
+when it is first counted and subtracted when it is cancelled, tracked by
+``Order.counted_in_rollups`` so replays (outbox retries, backfill racing
+live traffic) are no-ops. Deltas are written with one multi-row
+``INSERT ... ON CONFLICT DO UPDATE`` per table, supported by both SQLite
+and Postgres.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F
+from .db import bulk_increment
+from .models import CategorySales, Order, OrderItem, Product, ProductSales
+
+PERIODS = ('hour', 'day')
+
+def truncate(moment, period):
+    if period == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def counts_towards_sales(order):
+    return order.status != 'cancelled'
+
+def aggregate_lines(lines, sign=1):
+    """
+    Fold order lines (dicts with ``order_id``, ``created_at``, ``product_id``,
+    ``category_id``, ``price`` and ``quantity``) into per-bucket deltas for
+    both rollup tables.
+    """
+    products = defaultdict(lambda: [0, Decimal('0'), set()])
+    categories = defaultdict(lambda: [0, Decimal('0'), set()])
+    for line in lines:
+        revenue = line['price'] * line['quantity']
+        for period in PERIODS:
+            bucket = truncate(line['created_at'], period)
+            for table, key in ((products, line['product_id']), (categories, line['category_id'])):
+                entry = table[(period, bucket, key)]
+                entry[0] += line['quantity']
+                entry[1] += revenue
+                entry[2].add(line['order_id'])
+    return (
+        [(*key, sign * units, sign * revenue, sign * len(orders)) for key, (units, revenue, orders) in products.items()],
+        [(*key, sign * units, sign * revenue, sign * len(orders)) for key, (units, revenue, orders) in categories.items()],
+    )
+
+def apply_lines(lines, sign=1):
+    product_rows, category_rows = aggregate_lines(lines, sign)
+    values = ['units', 'revenue', 'order_count']
+    bulk_increment(ProductSales, ['period', 'bucket', 'product'], values, product_rows)
+    bulk_increment(CategorySales, ['period', 'bucket', 'category'], values, category_rows)
+
+def order_lines(order_ids):
+    return OrderItem.objects.filter(order_id__in=order_ids).values(
+        'order_id', 'product_id', 'price', 'quantity',
+        created_at=F('order__created_at'),
+        category_id=F('product__category_id'),
+    )
+
+def sync_order(order_id):
+    """
+    Bring one order's contribution to the rollups in line with its status.
+    Returns the applied sign (1, -1) or 0 when nothing changed.
+    """
+    with transaction.atomic():
+        order = Order.objects.select_for_update().get(pk=order_id)
+        should_count = counts_towards_sales(order)
+        if should_count == order.counted_in_rollups:
+            return 0
+        sign = 1 if should_count else -1
+        apply_lines(order_lines([order.pk]), sign)
+        Order.objects.filter(pk=order.pk).update(counted_in_rollups=should_count)
+        return sign
+
+def backfill_chunk(after_id, chunk_size):
+    """
+    Count the next ``chunk_size`` uncounted, non-cancelled orders with
+    ``id > after_id``. Returns the last id seen, or ``None`` when done.
+    """
+    with transaction.atomic():
+        ids = list(
+            Order.objects.select_for_update()
+            .filter(id__gt=after_id, counted_in_rollups=False)
+            .exclude(status='cancelled')
+            .order_by('id')
+            .values_list('id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            return None
+        apply_lines(order_lines(ids))
+        Order.objects.filter(id__in=ids).update(counted_in_rollups=True)
+    return ids[-1]
+
+def archived_lines(batch):
+    """
+    ``order_lines`` rows for a batch of ``(archived, data)`` pairs from
+    ``archive.payload_batches``. Lines of deleted products are left out,
+    as their live ``OrderItem`` rows would have been.
+    """
+    product_ids = {line['product_id'] for _, data in batch for line in data['items']}
+    categories = dict(Product.objects.filter(id__in=product_ids).values_list('id', 'category_id'))
+    return [
+        {
+            'order_id': archived.id,
+            'created_at': archived.created_at,
+            'product_id': line['product_id'],
+            'category_id': categories[line['product_id']],
+            'price': Decimal(line['price']),
+            'quantity': line['quantity'],
+        }
+        for archived, data in batch
+        if counts_towards_sales(archived)
+        for line in data['items']
+        if line['product_id'] in categories
+    ]
+
+def count_archived(batch):
+    """Add archived orders to the rollups; only for rebuilding them from scratch."""
+    with transaction.atomic():
+        apply_lines(archived_lines(batch))
@@ -0,0 +1,60 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cart import merge_session_cart
+from .models import Category, Order, Product
+from . import cards, inventory, notifier, objectcache, outbox, rankings
+import logging
+
+logger = logging.getLogger(__name__)
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    if request is None or not hasattr(request, 'session'):
+        return
+    merged = merge_session_cart(request.session, user)
+    if merged:
+        logger.info(f'Merged {merged} session cart lines for user {user.username}')
+
+@receiver(post_save, sender=Order)
+def queue_rollup_sync(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    # Written in the caller's transaction; applied by run_outbox_worker
+    if created or instance.status != getattr(instance, '_loaded_status', None):
+        outbox.enqueue('rollup.sync_order', {'order_id': instance.pk})
+        if not created:
+            notifier.order_status_changed(instance.user_id, instance.order_id, instance.status)
+    if created:
+        outbox.enqueue('recommendations.add_order', {'order_id': instance.pk})
+    instance._loaded_status = instance.status
+
+
+@receiver(post_save, sender=Product)
+def sync_product_score(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    rankings.sync_product(instance, created)
+
+@receiver(post_save, sender=Product)
+def sync_product_card(sender, instance, raw=False, **kwargs):
+    if not raw:
+        cards.sync_product(instance)
+
+@receiver(post_save, sender=Category)
+def sync_category_cards(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        cards.sync_category(instance)
+
+@receiver(post_save, sender=Product)
+def create_stock_shards(sender, instance, created, raw=False, **kwargs):
+    # Later stock changes go through store.inventory, never Product.save()
+    if created and not raw:
+        inventory.set_stock(instance.pk, instance.stock)
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_cached_object(sender, instance, **kwargs):
+    objectcache.invalidate(sender, [instance.pk])
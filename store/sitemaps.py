@@ -0,0 +1,167 @@
+"""
+Pre-generated XML sitemaps for the catalog.
+
+``manage.py generate_sitemaps`` writes gzipped sitemap files of at most
+``SITEMAP_LIMIT`` URLs each for available products and for categories,
+plus a ``sitemap.xml`` index, under ``SITEMAP_ROOT``. ``views.sitemap``
+serves those files as they are, so a crawler never makes the catalog
+query itself.
+
+Each file covers a range of primary keys, from just past the previous
+file's last id up to its own, and ``manifest.json`` records each range's
+row count and newest ``lastmod``. A later run checks every
+range with one indexed aggregate and rewrites only the files whose rows
+changed. New rows are appended as new files.
+"""
+import gzip
+import json
+import os
+from xml.sax.saxutils import escape
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from .models import Category, Product
+
+MANIFEST = 'manifest.json'
+INDEX = 'sitemap.xml'
+XMLNS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+def _products():
+    return Product.objects.filter(available=True)
+
+def _product_entries(queryset):
+    for product in queryset.only('id', 'slug', 'updated_at').iterator(chunk_size=2000):
+        yield product.get_absolute_url(), product.updated_at
+
+def _categories():
+    return Category.objects.all()
+
+def _category_entries(queryset):
+    categories = queryset.annotate(
+        lastmod=Max('products__updated_at', filter=Q(products__available=True))
+    ).only('id', 'slug')
+    for category in categories.iterator(chunk_size=2000):
+        yield category.get_absolute_url(), category.lastmod
+
+# name -> (base queryset, lastmod lookup for the range aggregate, url/lastmod rows)
+SECTIONS = {
+    'products': (_products, 'updated_at', _product_entries),
+    'categories': (_categories, 'products__updated_at', _category_entries),
+}
+
+def root():
+    return settings.SITEMAP_ROOT
+
+def filename(section, number):
+    return f'sitemap-{section}-{number}.xml.gz'
+
+def absolute(location):
+    return settings.SITEMAP_BASE_URL.rstrip('/') + location
+
+def _lastmod(value):
+    return value.isoformat() if value is not None else None
+
+def _signature(queryset, lastmod_lookup):
+    state = queryset.aggregate(count=Count('id', distinct=True), lastmod=Max(lastmod_lookup))
+    return state['count'], _lastmod(state['lastmod'])
+
+def _write(path, lines):
+    # Written aside and renamed so a crawler never reads half a file
+    partial = path.with_name(path.name + '.tmp')
+    with gzip.open(partial, 'wt', encoding='utf-8') as f:
+        f.writelines(lines)
+    os.replace(partial, path)
+
+def _urlset(entries):
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{XMLNS}">\n'
+    for location, lastmod in entries:
+        yield f'<url><loc>{escape(absolute(location))}</loc>'
+        if lastmod is not None:
+            yield f'<lastmod>{_lastmod(lastmod)}</lastmod>'
+        yield '</url>\n'
+    yield '</urlset>\n'
+
+def _next_last_id(queryset, after, limit):
+    """The last id of the next ``limit`` rows after ``after``, or None."""
+    ids = queryset.filter(id__gt=after).order_by('id').values_list('id', flat=True)
+    last = list(ids[limit - 1:limit]) or [ids.last()]
+    return last[0]
+
+def load_manifest():
+    try:
+        with open(root() / MANIFEST) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def generate_section(section, previous, limit):
+    """
+    Bring one section's files up to date. Returns its new manifest
+    entries and how many files were rewritten.
+    """
+    queryset_func, lastmod_lookup, entries_func = SECTIONS[section]
+    queryset = queryset_func()
+    chunks = []
+    written = 0
+    after = 0
+    reusable = list(previous)
+    while True:
+        # Ranges are contiguous, (previous last_id, last_id], so a row that
+        # appears between two existing ranges lands in the later one. Keep
+        # the old range while it still holds 1..limit rows; past the first
+        # one that doesn't, the rest are chunked afresh
+        chunk = reusable.pop(0) if reusable else None
+        if chunk is not None:
+            last = chunk['last_id']
+            signature = _signature(queryset.filter(id__gt=after, id__lte=last), lastmod_lookup)
+            if not 0 < signature[0] <= limit:
+                reusable = []
+                chunk = None
+        if chunk is None:
+            last = _next_last_id(queryset, after, limit)
+            if last is None:
+                break
+            signature = _signature(queryset.filter(id__gt=after, id__lte=last), lastmod_lookup)
+        number = len(chunks) + 1
+        entry = {
+            'file': filename(section, number),
+            'last_id': last,
+            'count': signature[0],
+            'lastmod': signature[1],
+        }
+        path = root() / entry['file']
+        if chunk != entry or not path.exists():
+            _write(path, _urlset(entries_func(queryset.filter(id__gt=after, id__lte=last).order_by('id'))))
+            written += 1
+        chunks.append(entry)
+        after = last
+    # Files past the new last chunk belong to rows that are gone
+    for stale in previous[len(chunks):]:
+        (root() / stale['file']).unlink(missing_ok=True)
+    return chunks, written
+
+def generate(limit=None):
+    """Update every section and the index. Returns the number of files rewritten."""
+    limit = limit or settings.SITEMAP_LIMIT
+    root().mkdir(parents=True, exist_ok=True)
+    previous = load_manifest()
+    manifest = {}
+    written = 0
+    for section in SECTIONS:
+        manifest[section], section_written = generate_section(section, previous.get(section, []), limit)
+        written += section_written
+    if written or manifest != previous or not (root() / INDEX).exists():
+        lines = [f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{XMLNS}">\n']
+        for chunks in manifest.values():
+            for chunk in chunks:
+                lines.append(f"<sitemap><loc>{escape(absolute('/sitemaps/' + chunk['file']))}</loc>")
+                if chunk['lastmod']:
+                    lines.append(f"<lastmod>{chunk['lastmod']}</lastmod>")
+                lines.append('</sitemap>\n')
+        lines.append('</sitemapindex>\n')
+        index = root() / INDEX
+        partial = index.with_name(INDEX + '.tmp')
+        partial.write_text(''.join(lines), encoding='utf-8')
+        os.replace(partial, index)
+        with open(root() / MANIFEST, 'w') as f:
+            json.dump(manifest, f, indent=1)
+    return written
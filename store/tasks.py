@@ -0,0 +1,44 @@
+"""
+Outbox handlers for work that happens after checkout commits.
+"""
+from django.conf import settings
+from django.core.mail import send_mail
+from django.template.loader import render_to_string
+from .models import ArchivedOrder, Order, Product
+from .outbox import handler
+from . import inventory, recommendations, rollups
+import logging
+
+logger = logging.getLogger(__name__)
+
+@handler('order.confirmation_email')
+def send_order_confirmation(payload):
+    order = Order.objects.prefetch_related('items__product').get(pk=payload['order_id'])
+    send_mail(
+        subject=f'Your Ipswich Retail order {order.order_id}',
+        message=render_to_string('store/email/order_confirmation.txt', {'order': order}),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipient_list=[order.email],
+    )
+    logger.info(f'Confirmation email sent for order {order.order_id}')
+
+@handler('product.low_stock')
+def report_low_stock(payload):
+    product = Product.objects.get(pk=payload['product_id'])
+    stock = inventory.total(product.pk)
+    if stock <= settings.LOW_STOCK_THRESHOLD:
+        logger.warning(f'Low stock: {product.name} has {stock} left')
+
+@handler('rollup.sync_order')
+def sync_order_rollups(payload):
+    try:
+        rollups.sync_order(payload['order_id'])
+    except Order.DoesNotExist:
+        # Only settled orders are archived; a leftover job has nothing to do
+        if not ArchivedOrder.objects.filter(pk=payload['order_id']).exists():
+            raise
+
+@handler('recommendations.add_order')
+def add_order_to_recommendations(payload):
+    recommendations.add_orders([payload['order_id']])
+
@@ -1,9 +1,45 @@
-from django.test import TestCase, Client
-from django.contrib.auth.models import User
+from django.test import AsyncClient, Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import NotSupportedError, connection, models
+from django.db.migrations.loader import MigrationLoader
+from django.http import HttpRequest
+from django.template import engines
 from django.urls import reverse
+from django.utils import timezone
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal
-from .models import Category, Product, Order, OrderItem
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+import asyncio
+import csv
+import gzip
+import importlib
+import json
+import os
+import runpy
+import tempfile
+from ipswich_retail.server import worker_count
+from .models import (
+    Category, Product, Order, OrderItem, ArchivedOrder, CartLine, OutboxJob, ProductSales,
+    CategorySales, ProductCooccurrence, ProductScore, ProductCard, StockShard,
+)
+from .models import Cart as StoredCart
 from .cart import Cart
+from .ids import TimeOrderedIdGenerator, normalize
+from .operations import AddIndexOnline
+from .pagination import EstimatedCountPaginator
+from .views import create_order
+from .warmup import warm_up
+from . import (
+    backfills, cards, export, inventory, money, notifier, objectcache, outbox, profiling,
+    rankings, ratelimit, recommendations, rollups, sitemaps,
+)
 
 class CategoryModelTest(TestCase):
     def setUp(self):
@@ -57,7 +93,6 @@ class CartTest(TestCase):
         )
     
     def test_cart_add_product(self):
-        from django.http import HttpRequest
         request = HttpRequest()
         request.session = self.client.session
         cart = Cart(request)
@@ -66,6 +101,107 @@ class CartTest(TestCase):
         self.assertEqual(len(cart), 2)
         self.assertEqual(cart.get_total_price(), Decimal('1999.98'))
 
+class StoreTestCase(TestCase):
+    """
+    Starts from a customer (``testuser``), a category and a laptop, created
+    once per class. Subclasses set ``laptop_stock`` to stock it differently.
+    """
+    laptop_stock = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='testpass123')
+        cls.category = Category.objects.create(name="Electronics", slug="electronics")
+        cls.product = Product.objects.create(
+            name="Laptop",
+            slug="laptop",
+            category=cls.category,
+            description="High-performance laptop",
+            price=Decimal('999.99'),
+            stock=cls.laptop_stock
+        )
+
+    def setUp(self):
+        # Counters, throttles and cached rows left over from other tests
+        cache.clear()
+        objectcache.local.clear()
+
+class StoredCartTest(StoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.mouse = Product.objects.create(
+            name="Mouse",
+            slug="mouse",
+            category=cls.category,
+            description="Wireless mouse",
+            price=Decimal('25.00'),
+            stock=10
+        )
+
+    def _request(self, user=None):
+        request = HttpRequest()
+        request.session = self.client.session
+        request.user = user or AnonymousUser()
+        return request
+
+    def test_stored_cart_totals_follow_add_and_remove(self):
+        cart = Cart(self._request(self.user))
+        cart.add(self.product, quantity=2)
+        cart.add(self.mouse, quantity=1)
+        cart.add(self.mouse, quantity=3, override_quantity=True)
+
+        cart = Cart(self._request(self.user))
+        self.assertEqual(len(cart), 5)
+        self.assertEqual(cart.get_total_price(), Decimal('2074.98'))
+
+        cart.remove(self.product)
+        self.assertEqual(len(cart), 3)
+        self.assertEqual(cart.get_total_price(), Decimal('75.00'))
+        self.assertEqual([item['product'] for item in cart], [self.mouse])
+
+    def test_session_cart_merged_on_login(self):
+        Cart(self._request(self.user)).add(self.product, quantity=1)
+        self.client.post(
+            reverse('store:cart_add', kwargs={'product_id': self.product.id}),
+            {'quantity': 2}
+        )
+        self.client.post(
+            reverse('store:cart_add', kwargs={'product_id': self.mouse.id}),
+            {'quantity': 1}
+        )
+
+        self.client.login(username='testuser', password='testpass123')
+
+        stored = StoredCart.objects.get(user=self.user)
+        self.assertEqual(stored.total_quantity, 4)
+        self.assertEqual(stored.total_price, Decimal('3024.97'))
+        self.assertEqual(CartLine.objects.get(cart=stored, product=self.product).quantity, 3)
+        self.assertNotIn('cart', self.client.session)
+
+    def test_setting_a_quantity_of_zero_removes_the_line(self):
+        for user in (self.user, None):
+            request = self._request(user)
+            cart = Cart(request)
+            cart.add(self.product, quantity=2)
+            cart.add(self.mouse, quantity=1)
+            cart.add(self.mouse, quantity=0, override_quantity=True)
+            cart = Cart(request)
+            self.assertEqual(len(cart), 2)
+            self.assertEqual([item['product'] for item in cart], [self.product])
+        self.assertFalse(CartLine.objects.filter(product=self.mouse).exists())
+
+    def test_merged_quantities_are_capped_at_stock(self):
+        Cart(self._request(self.user)).add(self.product, quantity=6)
+        self.client.post(
+            reverse('store:cart_add', kwargs={'product_id': self.product.id}),
+            {'quantity': 7}
+        )
+        self.client.login(username='testuser', password='testpass123')
+        stored = StoredCart.objects.get(user=self.user)
+        self.assertEqual(CartLine.objects.get(cart=stored, product=self.product).quantity, 10)
+        self.assertEqual(stored.total_quantity, 10)
+
 class ViewsTest(TestCase):
     def setUp(self):
         self.client = Client()
@@ -99,6 +235,73 @@ class ViewsTest(TestCase):
         self.assertContains(response, "Laptop")
         self.assertContains(response, "999.99")
     
+    def test_self_hosted_assets(self):
+        with self.settings(SELF_HOSTED_ASSETS=True):
+            response = self.client.get(reverse('store:product_list'))
+        self.assertContains(response, 'dist/site.css')
+        self.assertContains(response, 'dist/site.js')
+        self.assertNotContains(response, 'cdn.jsdelivr.net')
+
+    def test_category_detail_view(self):
+        response = self.client.get(
+            reverse('store:category_detail', kwargs={'slug': 'electronics'})
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Laptop")
+
+    def test_product_detail_conditional_get(self):
+        url = reverse('store:product_detail', kwargs={'slug': 'laptop'})
+        self.client.get(url)  # picks up the CSRF cookie, which is part of the ETag
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        # Carries the visitor's CSRF token, so never for shared caches
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotIn('public', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+
+        # The product is validated from the object cache; only the
+        # visitor's session (part of the ETag) is read
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertFalse([q for q in queries.captured_queries if 'store_' in q['sql']])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        self.product.price = Decimal('899.99')
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_category_etag_changes_with_cart(self):
+        url = reverse('store:category_detail', kwargs={'slug': 'electronics'})
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.post(
+            reverse('store:cart_add', kwargs={'product_id': self.product.id}),
+            {'quantity': 1}
+        )
+        # Flash message pending: always rendered
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_logged_in_revalidation_skips_the_cart(self):
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('store:category_detail', kwargs={'slug': 'electronics'})
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertFalse([q for q in queries.captured_queries if 'store_cart' in q['sql']])
+
+        # JSON updates leave no flash message, so only the cart version differs
+        self.client.post(reverse('store:cart_lines'), {
+            'lines': [{'product_id': self.product.id, 'op': 'add', 'quantity': 1}],
+        }, content_type='application/json')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
     def test_cart_add_view(self):
         response = self.client.post(
             reverse('store:cart_add', kwargs={'product_id': self.product.id}),
@@ -122,6 +325,51 @@ class ViewsTest(TestCase):
         response = self.client.get(reverse('store:checkout'))
         self.assertEqual(response.status_code, 200)
 
+@override_settings(EDGE_CACHE_CATALOG=True)
+class EdgeCachedCatalogTest(StoreTestCase):
+    def test_catalog_page_is_user_agnostic(self):
+        url = reverse('store:product_detail', kwargs={'slug': 'laptop'})
+        anonymous = self.client.get(url)
+        self.assertEqual(anonymous.status_code, 200)
+        self.assertEqual(anonymous.cookies, {})
+        self.assertNotIn('Cookie', anonymous.get('Vary', ''))
+        self.assertIn('public', anonymous['Cache-Control'])
+
+        self.client.login(username='testuser', password='testpass123')
+        logged_in = self.client.get(url)
+        self.assertIn('public', logged_in['Cache-Control'])
+        self.assertEqual(logged_in['ETag'], anonymous['ETag'])
+        self.assertEqual(logged_in.content, anonymous.content)
+
+    def test_header_state(self):
+        self.client.login(username='testuser', password='testpass123')
+        self.client.post(
+            reverse('store:cart_add', kwargs={'product_id': self.product.id}),
+            {'quantity': 2}
+        )
+        state = self.client.get(reverse('store:header_state')).json()
+        self.assertTrue(state['authenticated'])
+        self.assertEqual(state['username'], 'testuser')
+        self.assertEqual(state['cart_count'], 2)
+        self.assertEqual(state['messages'][0]['text'], 'Laptop added to cart')
+        self.assertTrue(state['csrf_token'])
+
+class TemplateProfilingTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(profiling.uninstall)
+
+    @override_settings(TEMPLATE_PROFILING=True)
+    def test_server_timing_lists_templates_and_blocks(self):
+        response = Client().get(reverse('store:product_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('store/product_list.html', response['Server-Timing'])
+        self.assertIn('#content', response['Server-Timing'])
+
+    def test_profiling_disabled_by_default(self):
+        response = Client().get(reverse('store:product_list'))
+        self.assertNotIn('Server-Timing', response)
+
 class OrderTest(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
@@ -168,3 +416,1228 @@ class OrderTest(TestCase):
     
     def test_order_total_cost(self):
         self.assertEqual(self.order.get_total_cost(), Decimal('999.99'))
+
+class OutboxTest(StoreTestCase):
+    laptop_stock = 6
+
+    def _checkout(self):
+        self.client.login(username='testuser', password='testpass123')
+        self.client.post(
+            reverse('store:cart_add', kwargs={'product_id': self.product.id}),
+            {'quantity': 2}
+        )
+        return self.client.post(reverse('store:checkout'), {
+            'first_name': 'John',
+            'last_name': 'Doe',
+            'email': 'john@example.com',
+            'address': '123 Test St',
+            'postal_code': 'IP1 1AA',
+            'city': 'Ipswich',
+        })
+
+    def test_checkout_enqueues_jobs_instead_of_sending(self):
+        response = self._checkout()
+        order = Order.objects.get(user=self.user)
+        self.assertRedirects(response, reverse('store:order_detail', kwargs={'order_id': order.order_id}))
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            sorted(OutboxJob.objects.values_list('topic', flat=True)),
+            ['order.confirmation_email', 'product.low_stock', 'recommendations.add_order', 'rollup.sync_order']
+        )
+
+        call_command('run_outbox_worker', once=True, concurrency=1, stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(order.order_id, mail.outbox[0].subject)
+        self.assertFalse(OutboxJob.objects.exclude(status='done').exists())
+
+    def test_failed_job_is_retried_with_backoff(self):
+        job = outbox.enqueue('unknown.topic', {})
+        outbox.process_batch('test-worker', 10)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'pending')
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.available_at, job.created_at)
+        self.assertIn('No outbox handler', job.last_error)
+
+        # Not due yet, so nothing is claimed
+        self.assertEqual(outbox.process_batch('test-worker', 10), 0)
+
+        with self.settings(OUTBOX_MAX_ATTEMPTS=2):
+            OutboxJob.objects.filter(pk=job.pk).update(available_at=job.created_at)
+            outbox.process_batch('test-worker', 10)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+
+    def test_reclaimed_job_keeps_the_second_workers_result(self):
+        job = outbox.enqueue('unknown.topic', {})
+        slow = outbox.claim_batch('slow-worker', 10)[0]
+        # The lock timed out and another worker finished the job meanwhile
+        OutboxJob.objects.filter(pk=job.pk).update(status='done', attempts=1, locked_by='', locked_at=None)
+        with self.assertLogs('store.outbox', 'WARNING') as logs:
+            outbox.run_job(slow)
+        self.assertIn('reclaimed', logs.output[-1])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.last_error), ('done', 1, ''))
+
+class SalesRollupTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.mouse = Product.objects.create(
+            name="Mouse",
+            slug="mouse",
+            category=self.category,
+            description="Wireless mouse",
+            price=Decimal('25.00'),
+            stock=10
+        )
+        self.order = Order.objects.create(
+            user=self.user,
+            order_id="TEST123",
+            first_name="John",
+            last_name="Doe",
+            email="john@example.com",
+            address="123 Test St",
+            postal_code="12345",
+            city="Test City",
+            total_cost=Decimal('2049.98')
+        )
+        OrderItem.objects.create(order=self.order, product=self.product, price=Decimal('999.99'), quantity=2)
+        OrderItem.objects.create(order=self.order, product=self.mouse, price=Decimal('25.00'), quantity=2)
+
+    def _run_worker(self):
+        call_command('run_outbox_worker', once=True, concurrency=1, stdout=StringIO())
+
+    def test_rollups_follow_order_status(self):
+        self._run_worker()
+        daily = CategorySales.objects.get(period='day', category=self.category)
+        self.assertEqual(daily.units, 4)
+        self.assertEqual(daily.revenue, Decimal('2049.98'))
+        self.assertEqual(daily.order_count, 1)
+        self.assertEqual(ProductSales.objects.get(period='hour', product=self.product).units, 2)
+
+        order = Order.objects.get(pk=self.order.pk)
+        order.status = 'cancelled'
+        order.save()
+        self._run_worker()
+        daily.refresh_from_db()
+        self.assertEqual((daily.units, daily.revenue, daily.order_count), (0, Decimal('0'), 0))
+
+    def test_backfill_is_idempotent_with_live_sync(self):
+        call_command('backfill_sales_rollups', chunk_size=1, stdout=StringIO())
+        self._run_worker()  # the queued sync for the same order must be a no-op
+        self.assertEqual(CategorySales.objects.get(period='day').units, 4)
+
+        call_command('backfill_sales_rollups', reset=True, stdout=StringIO())
+        self.assertEqual(CategorySales.objects.get(period='day').units, 4)
+
+    def test_sales_report_page(self):
+        self._run_worker()
+        User.objects.create_superuser('admin', 'admin@example.com', 'adminpass123')
+        self.client.login(username='admin', password='adminpass123')
+        response = self.client.get(reverse('admin:store_sales_report'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Laptop')
+        self.assertContains(response, '2049.98')
+
+class AdminTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'adminpass123')
+        self.client.login(username='admin', password='adminpass123')
+        category = Category.objects.create(name="Electronics", slug="electronics")
+        self.product = Product.objects.create(
+            name="Laptop",
+            slug="laptop",
+            category=category,
+            description="High-performance laptop",
+            price=Decimal('999.99'),
+            stock=10
+        )
+        self.orders = [
+            Order.objects.create(
+                user=self.admin,
+                order_id=f"TEST{i}",
+                first_name="John",
+                last_name="Doe",
+                email="john@example.com",
+                address="123 Test St",
+                postal_code="12345",
+                city="Test City",
+                status='cancelled' if i == 0 else 'pending',
+            )
+            for i in range(3)
+        ]
+        OutboxJob.objects.all().delete()
+
+    def test_order_changelist_query_count_is_flat(self):
+        url = reverse('admin:store_order_changelist')
+        self.client.get(url)
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'TEST2')
+
+    def test_bulk_status_action(self):
+        response = self.client.post(reverse('admin:store_order_changelist'), {
+            'action': 'mark_processing',
+            '_selected_action': [order.pk for order in self.orders],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.filter(status='processing').count(), 3)
+        # Only the un-cancelled order needs its rollups re-synced
+        self.assertEqual(
+            list(OutboxJob.objects.values_list('payload', flat=True)),
+            [{'order_id': self.orders[0].pk}]
+        )
+
+    def test_search_fields(self):
+        response = self.client.get(reverse('admin:store_product_changelist'), {'q': 'apto'})
+        self.assertContains(response, 'Laptop')
+        response = self.client.get(reverse('admin:store_order_changelist'), {'q': 'test1'})
+        self.assertEqual([order.order_id for order in response.context['cl'].result_list], ['TEST1'])
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(cursor, Order._meta.db_table)
+        self.assertIn('store_order_order_id_upper', indexes)
+
+    def test_estimated_paginator_falls_back_to_exact_count(self):
+        self.assertEqual(EstimatedCountPaginator(Order.objects.all(), 10).count, 3)
+
+class RecommendationTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.mouse, self.bag, self.cable = [
+            Product.objects.create(
+                name=name,
+                slug=name.lower(),
+                category=self.category,
+                description=name,
+                price=Decimal('10.00'),
+                stock=10
+            )
+            for name in ("Mouse", "Bag", "Cable")
+        ]
+        for i, basket in enumerate([
+            [self.product, self.mouse, self.bag],
+            [self.product, self.mouse],
+            [self.mouse, self.cable],
+        ]):
+            order = Order.objects.create(
+                user=self.user,
+                order_id=f"TEST{i}",
+                first_name="John",
+                last_name="Doe",
+                email="john@example.com",
+                address="123 Test St",
+                postal_code="12345",
+                city="Test City",
+            )
+            for product in basket:
+                OrderItem.objects.create(order=order, product=product, price=product.price, quantity=1)
+
+    def _counts(self):
+        return sorted(ProductCooccurrence.objects.values_list('product_id', 'related_id', 'count'))
+
+    def test_incremental_matches_rebuild(self):
+        call_command('run_outbox_worker', once=True, concurrency=1, stdout=StringIO())
+        incremental = self._counts()
+        self.assertIn((self.product.id, self.mouse.id, 2), incremental)
+        self.assertIn((self.mouse.id, self.product.id, 2), incremental)
+
+        call_command('build_recommendations', stdout=StringIO())  # nothing left to count
+        self.assertEqual(self._counts(), incremental)
+        call_command('build_recommendations', rebuild=True, chunk_size=2, stdout=StringIO())
+        self.assertEqual(self._counts(), incremental)
+
+    def test_product_detail_shows_top_neighbours(self):
+        call_command('build_recommendations', stdout=StringIO())
+        response = self.client.get(reverse('store:product_detail', kwargs={'slug': 'mouse'}))
+        self.assertEqual(
+            [product.name for product in response.context['recommendations']],
+            ['Laptop', 'Bag', 'Cable']
+        )
+
+    def test_cached_neighbours_are_dropped_on_commit(self):
+        call_command('build_recommendations', stdout=StringIO())
+        self.assertEqual(recommendations.related_ids(self.cable.id), [self.mouse.id])
+        order = Order.objects.create(
+            user=self.user, order_id="TEST9", first_name="John", last_name="Doe",
+            email="john@example.com", address="123 Test St", postal_code="12345", city="Test City",
+        )
+        OrderItem.objects.create(order=order, product=self.cable, price=self.cable.price, quantity=1)
+        OrderItem.objects.create(order=order, product=self.bag, price=self.bag.price, quantity=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            recommendations.add_orders([order.id])
+            # Not yet: a reader now would cache the old list again
+            self.assertIsNotNone(cache.get(recommendations.cache_key(self.cable.id)))
+        self.assertIsNone(cache.get(recommendations.cache_key(self.cable.id)))
+        self.assertEqual(recommendations.related_ids(self.cable.id), [self.mouse.id, self.bag.id])
+
+
+class RankingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.category = Category.objects.create(name="Electronics", slug="electronics")
+        self.old_hit, self.new_hit, self.quiet = [
+            Product.objects.create(
+                name=name,
+                slug=name.lower().replace(' ', '-'),
+                category=self.category,
+                description=name,
+                price=Decimal('10.00'),
+                stock=10
+            )
+            for name in ("Old Hit", "New Hit", "Quiet")
+        ]
+
+    def _moment(self, days):
+        return datetime(2026, 1, 1, tzinfo=dt_timezone.utc) + timedelta(days=days)
+
+    def test_new_products_get_a_score_row(self):
+        score = ProductScore.objects.get(pk=self.quiet.pk)
+        self.assertEqual((score.popularity, score.trending), (0, 0))
+
+    def test_decay_orders_popular_and_trending_differently(self):
+        rankings.record_sale(self.old_hit.id, 3)
+        self.assertEqual(rankings.flush(now=self._moment(10)), 1)
+        rankings.record_sale(self.new_hit.id, 1)
+        self.assertEqual(rankings.flush(now=self._moment(12)), 1)
+        # Flushed counts are consumed
+        self.assertEqual(cache.get(rankings.counter_key('units', self.old_hit.id)), 0)
+        self.assertEqual(rankings.flush(now=self._moment(12)), 0)
+
+        # The flushed scores are copied onto the cards the listings sort by
+        card = ProductCard.objects.get(pk=self.old_hit.pk)
+        self.assertEqual(card.popularity, ProductScore.objects.get(pk=self.old_hit.pk).popularity)
+        popular = [card.product_id for card in cards.listing(rank='popularity')]
+        trending = [card.product_id for card in cards.listing(self.category, 'trending')]
+        self.assertEqual(popular[:2], [self.old_hit.id, self.new_hit.id])
+        self.assertEqual(trending[:2], [self.new_hit.id, self.old_hit.id])
+        self.assertEqual(popular[2], self.quiet.id)
+        # Rebuilt cards keep their scores
+        ProductCard.objects.all().delete()
+        call_command('rebuild_product_cards', stdout=StringIO())
+        self.assertEqual([card.product_id for card in cards.listing(rank='popularity')], popular)
+
+    def test_flush_reads_only_logged_products(self):
+        rankings.record_view(self.quiet.id)
+        rankings.record_view(self.quiet.id)
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            self.assertEqual(rankings.flush(), 1)
+        counters = [key for call in get_many.call_args_list for key in call.args[0] if ':views:' in key]
+        self.assertEqual(counters, [rankings.counter_key('views', self.quiet.id)])
+        with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            self.assertEqual(rankings.flush(), 0)
+        get_many.assert_not_called()
+
+        # A counter evicted between the read and the decrement doesn't
+        # abort the flush
+        rankings.record_sale(self.new_hit.id, 1)
+        with mock.patch.object(cache, 'decr', side_effect=ValueError):
+            self.assertEqual(rankings.flush(), 1)
+        rankings.record_view(self.new_hit.id)
+        self.assertEqual(rankings.flush(), 1)
+
+    def test_views_and_sort_param(self):
+        response = self.client.get(reverse('store:product_detail', args=[self.quiet.slug]))
+        self.assertContains(response, reverse('store:product_viewed', args=[self.quiet.id]))
+        # Rendering (or revalidating) the page counts nothing; the beacon does
+        self.client.get(reverse('store:product_detail', args=[self.quiet.slug]),
+                        HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertIsNone(cache.get(rankings.counter_key('views', self.quiet.id)))
+        for _ in range(3):
+            response = self.client.post(reverse('store:product_viewed', args=[self.quiet.id]))
+            self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.post(reverse('store:product_viewed', args=[999999])).status_code, 204)
+        self.assertEqual(cache.get(rankings.counter_key('views', self.quiet.id)), 3)
+        first = self.client.get(reverse('store:product_list'), {'sort': 'trending'})
+        rankings.flush()
+        response = self.client.get(reverse('store:product_list'), {'sort': 'trending'})
+        self.assertEqual(list(response.context['products'])[0].product_id, self.quiet.id)
+        self.assertEqual(response.context['sort'], 'trending')
+        self.assertNotEqual(first['ETag'], response['ETag'])
+
+class OrderIdTest(TestCase):
+    def test_ids_are_unique_and_time_ordered(self):
+        now = [1_800_000_000.0]
+        generator = TimeOrderedIdGenerator(clock=lambda: now[0])
+        generated = [generator() for _ in range(100)]
+        now[0] += 0.001
+        generated.append(generator())
+        now[0] -= 5  # clock stepped backwards
+        generated.append(generator())
+        self.assertEqual(len(set(generated)), len(generated))
+        self.assertEqual(generated, sorted(generated))
+        self.assertTrue(all(len(order_id) == 16 for order_id in generated))
+        self.assertFalse(set(''.join(generated)) & set('ILOU'))
+
+    def test_normalize_accepts_typed_and_legacy_references(self):
+        self.assertEqual(normalize(' 01hx-0l2o '), '01HX0120')
+        self.assertEqual(normalize('A1B2C3D4'), 'A1B2C3D4')
+
+    def test_create_order_retries_on_collision(self):
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        fields = {
+            'user': user,
+            'first_name': 'John',
+            'last_name': 'Doe',
+            'email': 'john@example.com',
+            'address': '123 Test St',
+            'postal_code': '12345',
+            'city': 'Test City',
+        }
+        Order.objects.create(order_id='TAKEN', **fields)
+        with mock.patch('store.ids.new_order_id', side_effect=['TAKEN', 'FRESH']):
+            order = create_order(**fields)
+        self.assertEqual(order.order_id, 'FRESH')
+        self.assertEqual(Order.objects.count(), 2)
+
+class OrderArchiveTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.orders = {}
+        for order_id, status, age in [
+            ("OLDDONE", 'delivered', 400),
+            ("OLDOPEN", 'processing', 400),
+            ("NEWDONE", 'delivered', 10),
+        ]:
+            order = Order.objects.create(
+                user=self.user,
+                order_id=order_id,
+                first_name="John",
+                last_name="Doe",
+                email="john@example.com",
+                address="123 Test St",
+                postal_code="12345",
+                city="Test City",
+                total_cost=Decimal('1999.98'),
+                status=status,
+            )
+            OrderItem.objects.create(order=order, product=self.product, price=Decimal('999.99'), quantity=2)
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=age))
+            self.orders[order_id] = order
+
+    def _settle(self):
+        # Count the orders in the rollups and recommendations
+        call_command('run_outbox_worker', once=True, concurrency=1, stdout=StringIO())
+
+    def test_archives_only_old_finished_orders(self):
+        self._settle()
+        out = StringIO()
+        call_command('archive_orders', batch_size=1, stdout=out)
+        self.assertIn('Archived 1 orders', out.getvalue())
+        self.assertEqual(list(ArchivedOrder.objects.values_list('order_id', flat=True)), ["OLDDONE"])
+        self.assertFalse(Order.objects.filter(order_id="OLDDONE").exists())
+        self.assertFalse(OrderItem.objects.filter(order_id=self.orders["OLDDONE"].pk).exists())
+        self.assertEqual(Order.objects.count(), 2)
+        archived = ArchivedOrder.objects.get()
+        self.assertEqual(archived.id, self.orders["OLDDONE"].pk)
+        self.assertEqual(archived.item_count, 1)
+
+    def test_unsettled_orders_are_not_archived(self):
+        call_command('archive_orders', stdout=StringIO())
+        self.assertFalse(ArchivedOrder.objects.exists())
+        self._settle()
+        old = Order.objects.get(order_id="OLDDONE")
+        old.status = 'cancelled'
+        old.save()
+        # Still counted in the rollups until its cancellation job runs
+        call_command('archive_orders', stdout=StringIO())
+        self.assertFalse(ArchivedOrder.objects.exists())
+        self._settle()
+        call_command('archive_orders', stdout=StringIO())
+        self.assertEqual(list(ArchivedOrder.objects.values_list('order_id', flat=True)), ["OLDDONE"])
+
+    def test_archived_order_pages(self):
+        self._settle()
+        call_command('archive_orders', stdout=StringIO())
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('store:order_detail', args=["OLDDONE"]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['order'].status, 'delivered')
+        self.assertContains(response, "Laptop")
+        self.assertContains(response, "1999.98")
+        self.assertContains(response, "John Doe")
+        history = self.client.get(reverse('store:order_history'))
+        self.assertContains(history, "OLDDONE")
+        self.assertContains(history, "NEWDONE")
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_login(other)
+        response = self.client.get(reverse('store:order_detail', args=["OLDDONE"]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_rebuilding_rollups_and_recommendations_keeps_archived_orders(self):
+        mouse = Product.objects.create(
+            name="Mouse", slug="mouse", category=self.product.category,
+            description="Mouse", price=Decimal('19.99'), stock=10
+        )
+        OrderItem.objects.create(order=self.orders["OLDDONE"], product=mouse, price=Decimal('19.99'), quantity=1)
+        for order in self.orders.values():
+            rollups.sync_order(order.pk)
+        call_command('build_recommendations', stdout=StringIO())
+        call_command('archive_orders', stdout=StringIO())
+
+        def totals():
+            return (
+                list(ProductSales.objects.filter(period='day', product=self.product).order_by('bucket')
+                     .values_list('units', 'order_count')),
+                list(ProductCooccurrence.objects.values_list('product_id', 'related_id', 'count')),
+            )
+        before = totals()
+        self.assertEqual(sum(units for units, _ in before[0]), 6)
+        self.assertEqual(len(before[1]), 2)
+        call_command('backfill_sales_rollups', reset=True, stdout=StringIO())
+        out = StringIO()
+        call_command('build_recommendations', rebuild=True, stdout=out)
+        self.assertIn('Counted 1 archived orders', out.getvalue())
+        self.assertEqual(totals(), before)
+
+class OrderExportTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'adminpass123')
+        category = Category.objects.create(name="Electronics", slug="electronics")
+        laptop, mouse = [
+            Product.objects.create(
+                name=name,
+                slug=name.lower(),
+                category=category,
+                description=name,
+                price=Decimal('10.00'),
+                stock=10
+            )
+            for name in ("Laptop", "Mouse")
+        ]
+        for order_id, status, age, products in [
+            ("OLD1", 'delivered', 400, [laptop]),
+            ("NEW1", 'pending', 0, [laptop, mouse]),
+        ]:
+            order = Order.objects.create(
+                user=self.admin,
+                order_id=order_id,
+                first_name="John",
+                last_name="Doe",
+                email="john@example.com",
+                address="123 Test St",
+                postal_code="12345",
+                city="Test City",
+                status=status,
+            )
+            for product in products:
+                OrderItem.objects.create(order=order, product=product, price=product.price, quantity=3)
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=age))
+        call_command('run_outbox_worker', once=True, concurrency=1, stdout=StringIO())
+        call_command('archive_orders', stdout=StringIO())
+        self.start = (timezone.localdate() - timedelta(days=500)).isoformat()
+        self.end = timezone.localdate().isoformat()
+
+    def test_admin_streams_gzipped_csv(self):
+        self.client.login(username='admin', password='adminpass123')
+        response = self.client.get(reverse('admin:store_order_export'), {
+            'start': self.start, 'end': self.end, 'format': 'csv',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('.csv.gz', response['Content-Disposition'])
+        text = gzip.decompress(b''.join(response.streaming_content)).decode()
+        records = list(csv.DictReader(text.splitlines()))
+        self.assertEqual([r['order_id'] for r in records], ["OLD1", "NEW1", "NEW1"])
+        self.assertEqual(records[0]['product_name'], "Laptop")
+        self.assertEqual(records[0]['line_total'], "30.00")
+
+    def test_csv_cells_are_not_spreadsheet_formulas(self):
+        Order.objects.filter(order_id="NEW1").update(
+            first_name="=HYPERLINK(\"x\")", city="@SUM(A1)", address="\t=1+1", postal_code="\r-2"
+        )
+        since, until = export.date_window(date.fromisoformat(self.start), date.fromisoformat(self.end))
+        text = ''.join(export.encode(export.rows(since, until), 'csv'))
+        # Quoted cells may hold line breaks: let csv do the splitting
+        record = list(csv.DictReader(StringIO(text, newline='')))[-1]
+        self.assertEqual(record['first_name'], "'=HYPERLINK(\"x\")")
+        self.assertEqual(record['city'], "'@SUM(A1)")
+        self.assertEqual(record['address'], "'\t=1+1")
+        self.assertEqual(record['postal_code'], "'\r-2")
+        self.assertEqual(record['last_name'], "Doe")
+        jsonl = ''.join(export.encode(export.rows(since, until), 'jsonl')).splitlines()[-1]
+        self.assertEqual(json.loads(jsonl)['city'], "@SUM(A1)")
+
+    def test_export_requires_staff(self):
+        User.objects.create_user(username='customer', password='testpass123')
+        self.client.login(username='customer', password='testpass123')
+        response = self.client.get(reverse('admin:store_order_export'), {
+            'start': self.start, 'end': self.end, 'format': 'csv',
+        })
+        self.assertEqual(response.status_code, 302)
+
+    def test_command_writes_jsonl(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'orders.jsonl.gz')
+            call_command('export_orders', self.start, self.end, format='jsonl', output=path, stdout=StringIO())
+            with gzip.open(path, 'rt') as f:
+                records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[-1]['product_name'], "Mouse")
+        self.assertEqual(records[-1]['quantity'], 3)
+
+class StartupTest(TestCase):
+    def test_warm_up_compiles_site_templates(self):
+        compiled = warm_up()
+        self.assertGreaterEqual(compiled, 10)
+        loader = engines['django'].engine.template_loaders[0]
+        if hasattr(loader, 'get_template_cache'):
+            self.assertIn('store/product_list.html', loader.get_template_cache)
+
+    def test_asgi_app_warms_up_like_wsgi(self):
+        # Imported here: loading the module builds the application
+        import ipswich_retail.asgi
+        with self.settings(WARMUP_ON_BOOT=True), mock.patch('store.warmup.warm_up') as warm_up:
+            importlib.reload(ipswich_retail.asgi)
+        warm_up.assert_called_once_with()
+
+    def test_startup_report(self):
+        out = StringIO()
+        call_command('startup_report', limit=5, no_warmup=True, stdout=out)
+        report = out.getvalue()
+        self.assertIn('Boot:', report)
+        self.assertIn('peak RSS', report)
+        self.assertIn('django', report)
+
+class ServerConfigTest(TestCase):
+    def test_worker_count_by_class_and_memory(self):
+        gib = 1024 ** 3
+        self.assertEqual(worker_count('sync', 2), 5)
+        self.assertEqual(worker_count('gthread', 4, threads=4), 3)
+        self.assertEqual(worker_count('gevent', 4), 4)
+        # 512 MiB container: only three 150 MiB workers fit
+        self.assertEqual(worker_count('sync', 8, memory=gib // 2), 3)
+        self.assertEqual(worker_count('sync', 1, memory=64 * 1024 * 1024), 1)
+
+    def test_config_reads_environment(self):
+        env = {'GUNICORN_WORKER_CLASS': 'gthread', 'WEB_CONCURRENCY': '7', 'GUNICORN_MAX_REQUESTS': '0'}
+        with mock.patch.dict(os.environ, env):
+            config = runpy.run_path(str(settings.BASE_DIR / 'gunicorn.conf.py'))
+        self.assertEqual(config['worker_class'], 'gthread')
+        self.assertEqual(config['workers'], 7)
+        self.assertEqual(config['threads'], 4)
+        self.assertEqual(config['max_requests_jitter'], 0)
+        self.assertTrue(config['preload_app'])
+        with mock.patch.dict(os.environ, {'GUNICORN_WORKER_CLASS': 'eventlet'}):
+            with self.assertRaises(RuntimeError):
+                runpy.run_path(str(settings.BASE_DIR / 'gunicorn.conf.py'))
+        # gevent must patch before Django loads, so it isn't preloaded
+        with mock.patch.dict(os.environ, {'GUNICORN_WORKER_CLASS': 'gevent'}), \
+                mock.patch('importlib.util.find_spec', return_value=object()):
+            config = runpy.run_path(str(settings.BASE_DIR / 'gunicorn.conf.py'))
+        self.assertFalse(config['preload_app'])
+
+class CatalogApiTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.category = Category.objects.create(name="Electronics", slug="electronics")
+        self.products = [
+            Product.objects.create(
+                name=f"Item {i}",
+                slug=f"item-{i}",
+                category=self.category,
+                description="Description",
+                price=Decimal('9.99'),
+                stock=10,
+                available=i != 4,
+            )
+            for i in range(5)
+        ]
+
+    def test_batched_lookup_with_sparse_fields(self):
+        ids = ','.join(str(p.id) for p in self.products[:3])
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('store:api_product_list'), {'ids': ids, 'fields': 'name,price'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [
+            {'name': f"Item {i}", 'price': '9.99'} for i in range(3)
+        ])
+        response = self.client.get(reverse('store:api_product_list'), {'slugs': 'item-1,item-4', 'fields': 'slug,url'})
+        self.assertEqual(response.json()['results'], [{'slug': 'item-1', 'url': '/product/item-1/'}])
+
+    def test_cursor_pagination_walks_all_available_products(self):
+        url = reverse('store:api_product_list')
+        seen = []
+        params = {'limit': 2, 'fields': 'id'}
+        while url:
+            data = self.client.get(url, params).json()
+            seen.extend(row['id'] for row in data['results'])
+            url, params = data['next'], None
+        self.assertEqual(seen, [p.id for p in self.products[:4]])
+
+    def test_etag_and_errors(self):
+        url = reverse('store:api_product_detail', args=['item-0'])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['category'], self.category.id)
+        cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(self.client.get(url, {'fields': 'secret'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('store:api_product_list'), {'ids': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('store:api_product_detail', args=['item-4'])).status_code, 404)
+        categories = self.client.get(reverse('store:api_category_list'), {'fields': 'slug'}).json()
+        self.assertEqual(categories['results'], [{'slug': 'electronics'}])
+
+class CartLinesTest(StoreTestCase):
+    laptop_stock = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.mouse = Product.objects.create(
+            name="Mouse", slug="mouse", category=cls.category,
+            description="Mouse", price=Decimal('25.00'), stock=10
+        )
+
+    def _post(self, lines):
+        return self.client.post(
+            reverse('store:cart_lines'), json.dumps({'lines': lines}), content_type='application/json'
+        )
+
+    def _bulk_update(self):
+        response = self._post([
+            {'product_id': self.product.id, 'op': 'add', 'quantity': 2},
+            {'product_id': self.mouse.id, 'op': 'add', 'quantity': 4},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['cart']['count'], 6)
+        response = self._post([
+            {'product_id': self.product.id, 'op': 'remove'},
+            {'product_id': self.mouse.id, 'op': 'set', 'quantity': 1},
+        ])
+        cart = response.json()['cart']
+        self.assertEqual(cart['count'], 1)
+        self.assertEqual(cart['total'], '25.00')
+        self.assertEqual([line['product_id'] for line in cart['lines']], [self.mouse.id])
+
+    def test_anonymous_bulk_update(self):
+        self._bulk_update()
+        self.assertEqual(self.client.get(reverse('store:cart_detail')).status_code, 200)
+
+    def test_stored_bulk_update(self):
+        self.client.login(username='testuser', password='testpass123')
+        self._bulk_update()
+        self.assertEqual(StoredCart.objects.get(user=self.user).total_quantity, 1)
+
+    def test_concurrent_adds_are_not_lost(self):
+        request = RequestFactory().post('/')
+        request.session = self.client.session
+        request.user = self.user
+        lock = StoredCart.objects.select_for_update
+        raced = []
+
+        def other_request_commits_first():
+            # Another request adds a mouse just before this one gets the lock
+            if not raced:
+                raced.append(True)
+                Cart(request).update_lines([(self.mouse.id, 'add', 2)])
+            return lock()
+
+        with mock.patch.object(StoredCart.objects, 'select_for_update', side_effect=other_request_commits_first):
+            Cart(request).update_lines([(self.mouse.id, 'add', 1)])
+        self.assertEqual(StoredCart.objects.get(user=self.user).lines.get().quantity, 3)
+
+    def test_stock_is_checked_for_every_line_before_applying(self):
+        self._post([{'product_id': self.product.id, 'op': 'add', 'quantity': 2}])
+        response = self._post([
+            {'product_id': self.mouse.id, 'op': 'add', 'quantity': 1},
+            {'product_id': self.product.id, 'op': 'add', 'quantity': 2},
+        ])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['errors'], ['Sorry, only 3 Laptop available'])
+        self.assertEqual(response.json()['cart']['count'], 2)
+        self.assertEqual(self._post([{'product_id': 'x'}]).status_code, 400)
+
+    def test_form_post_sets_quantities(self):
+        self._post([{'product_id': self.product.id, 'op': 'add', 'quantity': 1}])
+        response = self.client.post(reverse('store:cart_lines'), {
+            f'quantity_{self.product.id}': '3',
+            f'quantity_{self.mouse.id}': '0',
+        })
+        self.assertRedirects(response, reverse('store:cart_detail'))
+        response = self.client.get(reverse('store:cart_detail'))
+        self.assertEqual(len(response.context['cart']), 3)
+
+@override_settings(RATE_LIMITS={
+    'store:product_list': {'rate': '3/m', 'param': 'q'},
+    'store:cart_add': {'rate': '10/m', 'user_rate': '2/m', 'methods': ['POST']},
+})
+class RateLimitTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(cache.clear)
+
+    def test_search_is_limited_before_touching_the_database(self):
+        url = reverse('store:product_list')
+        for _ in range(3):
+            self.assertEqual(self.client.get(url, {'q': 'lap'}).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'q': 'lap'})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        # Browsing without a search term isn't limited
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(ratelimit.throttled_counts()['store:product_list'], 1)
+        out = StringIO()
+        call_command('ratelimit_stats', '--reset', stdout=out)
+        self.assertIn('store:product_list', out.getvalue())
+        self.assertEqual(ratelimit.throttled_counts()['store:product_list'], 0)
+
+    def test_user_rate_applies_per_session(self):
+        url = reverse('store:cart_add', args=[self.product.id])
+        first, second = Client(), Client()
+        # The first add creates the session the next two are counted against
+        for _ in range(3):
+            self.assertEqual(first.post(url, {'quantity': 1}).status_code, 302)
+        self.assertEqual(first.post(url, {'quantity': 1}).status_code, 429)
+        self.assertEqual(second.post(url, {'quantity': 1}).status_code, 302)
+        # GETs aren't covered by the rule
+        self.assertNotEqual(first.get(url).status_code, 429)
+
+    def test_user_rate_falls_back_to_ip_without_a_cookie(self):
+        url = reverse('store:cart_add', args=[self.product.id])
+        statuses = []
+        for _ in range(3):
+            # Never sends back the session cookie it is given
+            statuses.append(Client().post(url, {'quantity': 1}).status_code)
+        self.assertEqual(statuses, [302, 302, 429])
+
+    def test_sliding_window_and_forwarded_for(self):
+        for _ in range(4):
+            allowed, _ = ratelimit.hit('test', 'ip:1', 4, 60, now=600)
+        self.assertTrue(allowed)
+        # Half the previous window still counts: 4 * 0.5 + 3 > 4
+        self.assertEqual([ratelimit.hit('test', 'ip:1', 4, 60, now=690)[0] for _ in range(3)],
+                         [True, True, False])
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='6.6.6.6, 1.2.3.4', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(ratelimit.client_ip(request), '10.0.0.1')
+        with self.settings(RATE_LIMIT_TRUSTED_PROXIES=1):
+            self.assertEqual(ratelimit.client_ip(request), '1.2.3.4')
+
+class StockShardTest(StoreTestCase):
+    laptop_stock = 20
+
+    def _checkout(self, quantity):
+        self.client.login(username='testuser', password='testpass123')
+        self.client.post(reverse('store:cart_add', args=[self.product.id]), {'quantity': quantity})
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(reverse('store:checkout'), {
+                'first_name': 'John', 'last_name': 'Doe', 'email': 'john@example.com',
+                'address': '123 Test St', 'postal_code': 'IP1 1AA', 'city': 'Ipswich',
+            })
+
+    def _shards(self):
+        return list(self.product.stock_shards.order_by('shard').values_list('quantity', flat=True))
+
+    @override_settings(STOCK_SHARDS=4)
+    def test_new_products_are_split_into_shards(self):
+        inventory.set_stock(self.product.id, 10)
+        self.assertEqual(self._shards(), [3, 3, 2, 2])
+        self.assertEqual(inventory.total(self.product.id), 10)
+
+    def test_checkout_takes_from_shards_without_saving_the_product(self):
+        updated_at = self.product.updated_at
+        response = self._checkout(2)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(inventory.total(self.product.id), 18)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 18)
+        # Moved by the stock refresh, so catalog validators change too
+        self.assertGreater(self.product.updated_at, updated_at)
+
+    def test_selling_out_changes_the_product_page_etag(self):
+        url = reverse('store:product_detail', args=[self.product.slug])
+        etag = self.client.get(url)['ETag']
+        inventory.take(self.product, 20)
+        inventory.refresh([self.product.id], force=True)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, '20 available')
+
+    @override_settings(STOCK_SHARDS=4)
+    def test_line_spanning_shards_and_out_of_stock(self):
+        inventory.set_stock(self.product.id, 6)
+        with self.assertRaises(inventory.OutOfStock):
+            inventory.take(self.product, 7)
+        inventory.take(self.product, 5)
+        self.assertEqual(sum(self._shards()), 1)
+        # Someone else bought the last one between cart and checkout
+        self.client.login(username='testuser', password='testpass123')
+        self.client.post(reverse('store:cart_add', args=[self.product.id]), {'quantity': 1})
+        inventory.take(self.product, 1)
+        response = self.client.post(reverse('store:checkout'), {
+            'first_name': 'John', 'last_name': 'Doe', 'email': 'john@example.com',
+            'address': '123 Test St', 'postal_code': 'IP1 1AA', 'city': 'Ipswich',
+        })
+        self.assertRedirects(response, reverse('store:cart_detail'))
+        self.assertFalse(Order.objects.exists())
+
+    @override_settings(STOCK_SHARDS=4)
+    def test_rebalance_evens_out_shards_and_refreshes_totals(self):
+        inventory.set_stock(self.product.id, 8)
+        StockShard.objects.filter(product=self.product, shard=0).update(quantity=0)
+        with self.settings(STOCK_SHARDS=2):
+            call_command('rebalance_stock', stdout=StringIO())
+            self.assertEqual(self._shards(), [3, 3])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 6)
+
+    def test_admin_stock_edit_sets_new_total(self):
+        User.objects.create_superuser(username='admin', password='adminpass123', email='a@example.com')
+        self.client.login(username='admin', password='adminpass123')
+        response = self.client.post(reverse('admin:store_product_change', args=[self.product.id]), {
+            'name': 'Laptop', 'slug': 'laptop', 'category': self.product.category_id,
+            'description': 'Laptop', 'price': '999.99', 'stock': '50', 'available': 'on',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(inventory.total(self.product.id), 50)
+
+class ObjectCacheTest(StoreTestCase):
+    def test_repeat_lookups_skip_database_and_shared_cache(self):
+        self.assertEqual(objectcache.get_by_slug(Product, 'laptop').pk, self.product.pk)
+        with self.assertNumQueries(0), mock.patch.object(objectcache, 'cache') as shared:
+            product = objectcache.get_by_slug(Product, 'laptop')
+            self.assertEqual(objectcache.get_many(Product, [self.product.pk]), {self.product.pk: product})
+        shared.get.assert_not_called()
+        shared.get_many.assert_not_called()
+        # Callers get their own copy
+        product.name = 'Changed'
+        self.assertEqual(objectcache.get(Product, self.product.pk).name, 'Laptop')
+        self.assertIsNone(objectcache.get_by_slug(Product, 'missing'))
+
+    def test_save_invalidates_and_renames_miss(self):
+        objectcache.get_by_slug(Product, 'laptop')
+        self.product.price = Decimal('899.99')
+        self.product.slug = 'laptop-pro'
+        self.product.save()
+        self.assertIsNone(objectcache.get_by_slug(Product, 'laptop'))
+        self.assertEqual(objectcache.get_by_slug(Product, 'laptop-pro').price, Decimal('899.99'))
+
+    @override_settings(OBJECT_CACHE_LOCAL_SECONDS=0)
+    def test_other_workers_revalidate_against_the_version(self):
+        objectcache.get(Product, self.product.pk)
+        # An expired local copy is reused while the version is unchanged
+        with self.assertNumQueries(0):
+            objectcache.get(Product, self.product.pk)
+        # A save elsewhere only bumps the shared version
+        Product.objects.filter(pk=self.product.pk).update(name='Renamed')
+        cache.set(objectcache.version_key(Product, self.product.pk), 'elsewhere')
+        self.assertEqual(objectcache.get(Product, self.product.pk).name, 'Renamed')
+
+    def test_product_page_uses_cached_objects(self):
+        url = self.product.get_absolute_url()
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.product.available = False
+        self.product.save()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+class OrderEventsTest(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.order = Order.objects.create(
+            user=self.user, first_name='John', last_name='Doe', email='john@example.com',
+            address='123 Test St', postal_code='IP1 1AA', city='Ipswich', total_cost=Decimal('10.00')
+        )
+
+    def test_status_changes_are_published_after_commit(self):
+        with mock.patch.object(notifier, '_publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                order = Order.objects.get(pk=self.order.pk)
+                order.status = 'processing'
+                order.save()
+            publish.assert_called_once_with(self.user.pk, {
+                'order_id': self.order.order_id, 'status': 'processing', 'status_display': 'Processing',
+            })
+            publish.reset_mock()
+            # Bulk admin actions bypass save()
+            User.objects.create_superuser(username='admin', password='adminpass123', email='a@example.com')
+            self.client.login(username='admin', password='adminpass123')
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('admin:store_order_changelist'), {
+                    'action': 'mark_shipped', '_selected_action': [self.order.pk],
+                })
+            publish.assert_called_once()
+            self.assertEqual(publish.call_args.args[1]['status'], 'shipped')
+
+    def test_wsgi_falls_back_to_a_snapshot(self):
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('store:order_events'), {'order': self.order.order_id})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = response.content.decode()
+        self.assertIn('retry: 30000', body)
+        self.assertIn(f'"order_id": "{self.order.order_id}", "status": "pending"', body)
+
+    async def test_asgi_stream_pushes_changes(self):
+        client = AsyncClient()
+        await client.aforce_login(self.user)
+        response = await client.get(reverse('store:order_events'))
+        self.assertTrue(response.streaming)
+        chunks = aiter(response.streaming_content)
+        first = (await anext(chunks)).decode()
+        self.assertIn('"status": "pending"', first)
+        notifier.get_broker().publish(self.user.pk, notifier.status_message(self.order.order_id, 'shipped'))
+        update = (await asyncio.wait_for(anext(chunks), 5)).decode()
+        self.assertEqual(update.splitlines()[0], 'event: status')
+        self.assertIn('"status": "shipped"', update)
+        await chunks.aclose()
+
+class MoneyTest(StoreTestCase):
+    def test_conversions(self):
+        self.assertEqual(money.to_pence(Decimal('999.99')), 99999)
+        self.assertEqual(money.to_pence('0.005'), 1)
+        self.assertEqual(money.from_pence(99999), Decimal('999.99'))
+        self.assertEqual(str(money.from_pence(2500)), '25.00')
+        self.assertEqual(str(money.from_pence(0)), '0.00')
+
+    def test_session_cart_stores_pence_and_reads_old_sessions(self):
+        self.client.post(reverse('store:cart_add', args=[self.product.id]), {'quantity': 3})
+        session_cart = self.client.session['cart']
+        self.assertEqual(session_cart[str(self.product.id)], {'quantity': 3, 'price': 99999})
+        response = self.client.get(reverse('store:cart_detail'))
+        self.assertEqual(response.context['cart'].get_total_price(), Decimal('2999.97'))
+        item = list(response.context['cart'])[0]
+        self.assertEqual((item['price'], item['total_pence']), (Decimal('999.99'), 299997))
+
+        session = self.client.session
+        session['cart'] = {str(self.product.id): {'quantity': 2, 'price': '999.99'}}
+        session.save()
+        response = self.client.get(reverse('store:cart_detail'))
+        self.assertEqual(response.context['cart'].get_total_price(), Decimal('1999.98'))
+
+    def test_order_costs(self):
+        order = Order.objects.create(
+            user=self.user, first_name='John', last_name='Doe', email='john@example.com',
+            address='123 Test St', postal_code='IP1 1AA', city='Ipswich'
+        )
+        OrderItem.objects.create(order=order, product=self.product, price=Decimal('0.10'), quantity=3)
+        OrderItem.objects.create(order=order, product=self.product, price=Decimal('0.20'), quantity=1)
+        self.assertEqual(order.get_total_cost(), Decimal('0.50'))
+        self.assertEqual(str(order.items.first().get_cost()), '0.30')
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_cart', lines=[5], repeat=2, stdout=out)
+        self.assertIn('pence', out.getvalue())
+
+
+class SitemapTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        settings_override = override_settings(
+            SITEMAP_ROOT=Path(self.tmp.name), SITEMAP_BASE_URL='https://shop.example.com'
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.category = Category.objects.create(name='Electronics', slug='electronics')
+        self.products = [
+            Product.objects.create(
+                category=self.category, name=f'Product {i}', slug=f'product-{i}',
+                price=Decimal('9.99'), stock=5
+            )
+            for i in range(5)
+        ]
+
+    def read(self, name):
+        with gzip.open(Path(self.tmp.name) / name, 'rt') as f:
+            return f.read()
+
+    def test_chunks_and_index(self):
+        self.assertEqual(sitemaps.generate(limit=2), 4)
+        self.assertIn('https://shop.example.com/product/product-0/', self.read('sitemap-products-1.xml.gz'))
+        self.assertEqual(self.read('sitemap-products-3.xml.gz').count('<url>'), 1)
+        self.assertIn('/category/electronics/', self.read('sitemap-categories-1.xml.gz'))
+        response = self.client.get(reverse('store:sitemap'))
+        self.assertEqual(response['Content-Type'], 'application/xml')
+        index = b''.join(response.streaming_content).decode()
+        self.assertEqual(index.count('<sitemap>'), 4)
+        self.assertIn('https://shop.example.com/sitemaps/sitemap-products-2.xml.gz', index)
+        response = self.client.get(reverse('store:sitemap'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_rerun_rewrites_only_changed_chunks(self):
+        sitemaps.generate(limit=2)
+        self.assertEqual(sitemaps.generate(limit=2), 0)
+        self.products[2].slug = 'renamed'
+        self.products[2].save()
+        self.assertEqual(sitemaps.generate(limit=2), 2)  # its chunk and its category's lastmod
+        self.assertIn('/product/renamed/', self.read('sitemap-products-2.xml.gz'))
+
+        self.products[4].delete()
+        sitemaps.generate(limit=2)
+        self.assertFalse((Path(self.tmp.name) / 'sitemap-products-3.xml.gz').exists())
+
+    def test_rows_appearing_between_ranges_are_listed(self):
+        # Chunks of two: products 0-1 and 3-4, with product 2 falling between
+        self.products[2].available = False
+        self.products[2].save()
+        sitemaps.generate(limit=2)
+        self.products[2].available = True
+        self.products[2].save()
+        sitemaps.generate(limit=2)
+        listed = ''.join(
+            self.read(name) for name in sorted(os.listdir(self.tmp.name)) if name.endswith('.xml.gz')
+        )
+        for product in self.products:
+            self.assertIn(f'/product/{product.slug}/', listed)
+
+    def test_unknown_files_are_not_served(self):
+        sitemaps.generate(limit=2)
+        self.assertEqual(self.client.get('/sitemaps/manifest.json').status_code, 404)
+        self.assertEqual(self.client.get('/sitemaps/sitemap-products-9.xml.gz').status_code, 404)
+        response = self.client.get(reverse('store:sitemap_file', args=['sitemap-products-1.xml.gz']))
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+
+
+class ProductCardTest(StoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.product.description = ' '.join(f'word{i}' for i in range(40))
+        cls.product.save()
+
+    def test_card_follows_product_and_category(self):
+        card = ProductCard.objects.get(pk=self.product.pk)
+        self.assertEqual(card.summary, ' '.join(f'word{i}' for i in range(15)) + ' …')
+        self.assertEqual((card.category_slug, card.stock, card.image_url), ('electronics', 10, ''))
+
+        self.product.price = Decimal('899.99')
+        self.product.available = False
+        self.product.save()
+        self.category.slug = 'gadgets'
+        self.category.save()
+        card.refresh_from_db()
+        self.assertEqual((card.price, card.available, card.category_slug), (Decimal('899.99'), False, 'gadgets'))
+
+    def test_stock_changes_reach_the_card(self):
+        inventory.set_stock(self.product.pk, 3)
+        self.assertEqual(ProductCard.objects.get(pk=self.product.pk).stock, 3)
+        inventory.take(self.product, 2)
+        inventory.refresh([self.product.pk], force=True)
+        self.assertEqual(ProductCard.objects.get(pk=self.product.pk).stock, 1)
+
+    def test_listing_pages_read_cards(self):
+        response = self.client.get(reverse('store:product_list'), {'q': 'word30'})
+        self.assertEqual([card.slug for card in response.context['products']], ['laptop'])
+        self.assertContains(response, 'word14 …')
+        self.assertNotContains(response, 'word15')
+        response = self.client.get(reverse('store:category_detail', args=['electronics']))
+        self.assertEqual(len(response.context['products']), 1)
+
+    def test_rebuild(self):
+        ProductCard.objects.all().delete()
+        Product.objects.filter(pk=self.product.pk).update(name='Renamed')
+        out = StringIO()
+        call_command('rebuild_product_cards', stdout=out)
+        self.assertIn('Rebuilt 1 product cards', out.getvalue())
+        self.assertEqual(ProductCard.objects.get(pk=self.product.pk).name, 'Renamed')
+
+
+class BackfillTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Electronics', slug='electronics')
+        self.products = [
+            Product.objects.create(
+                category=self.category, name=f'Product {i}', slug=f'product-{i}',
+                description='A product', price=Decimal('9.99'), stock=5
+            )
+            for i in range(5)
+        ]
+        override = override_settings(BACKFILL_PAUSE_SECONDS=0)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_product_cards_backfill_in_chunks(self):
+        ProductCard.objects.all().delete()
+        state = backfills.run('product_cards', chunk_size=2)
+        self.assertEqual(ProductCard.objects.count(), 5)
+        self.assertEqual((state.rows, state.chunks, state.percent), (5, 3, 100.0))
+        self.assertIsNotNone(state.finished_at)
+        # Finished backfills are not run again
+        self.assertEqual(backfills.run('product_cards', chunk_size=2).chunks, 3)
+
+    def test_resumes_after_the_last_committed_chunk(self):
+        seen = []
+
+        def touch(products):
+            ids = list(products.values_list('pk', flat=True))
+            if len(seen) == 2:
+                raise RuntimeError('worker killed')
+            seen.append(ids)
+
+        backfills.register('test.touch', Product)(touch)
+        self.addCleanup(backfills.BACKFILLS.pop, 'test.touch')
+        with self.assertRaises(RuntimeError):
+            backfills.run('test.touch', chunk_size=2)
+        state = backfills.progress('test.touch')
+        self.assertEqual((state.last_id, state.rows), (self.products[3].pk, 4))
+        seen.append('restarted')
+        backfills.run('test.touch', chunk_size=2)
+        self.assertEqual(seen[-1], [self.products[4].pk])
+
+    def test_waits_while_replicas_lag(self):
+        with mock.patch('store.backfills.replication_lag', side_effect=[30, 0]), \
+                mock.patch('store.backfills.time.sleep') as sleep:
+            self.assertEqual(backfills.wait_for_headroom(), 0.5)
+        sleep.assert_called_once_with(0.5)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('run_backfills', 'product_cards', chunk_size=3, stdout=out)
+        self.assertIn('product_cards: done, 5 rows in 2 chunks', out.getvalue())
+        out = StringIO()
+        call_command('run_backfills', list=True, stdout=out)
+        self.assertIn('product_cards: done', out.getvalue())
+
+
+class AddIndexOnlineTest(TransactionTestCase):
+    def _operation(self):
+        return AddIndexOnline('product', models.Index(fields=['price'], name='store_product_price_test'))
+
+    def _states(self, operation):
+        before = MigrationLoader(connection).project_state()
+        after = before.clone()
+        operation.state_forwards('store', after)
+        return before, after
+
+    def _indexes(self):
+        with connection.cursor() as cursor:
+            return connection.introspection.get_constraints(cursor, Product._meta.db_table)
+
+    def test_plain_index_off_postgres(self):
+        operation = self._operation()
+        before, after = self._states(operation)
+        with connection.schema_editor(atomic=False) as editor:
+            operation.database_forwards('store', editor, before, after)
+        self.assertIn('store_product_price_test', self._indexes())
+        with connection.schema_editor(atomic=False) as editor:
+            operation.database_backwards('store', editor, after, before)
+        self.assertNotIn('store_product_price_test', self._indexes())
+
+    def _postgres_editor(self, atomic, invalid=False):
+        editor = mock.MagicMock(atomic_migration=atomic)
+        editor.connection.vendor = 'postgresql'
+        editor.connection.alias = 'default'
+        cursor = editor.connection.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = (1,) if invalid else None
+        return editor
+
+    def test_postgres_needs_a_non_atomic_migration(self):
+        operation = self._operation()
+        before, after = self._states(operation)
+        with self.assertRaises(NotSupportedError):
+            operation.database_forwards('store', self._postgres_editor(atomic=True), before, after)
+
+    def test_postgres_builds_concurrently_and_replaces_invalid_index(self):
+        operation = self._operation()
+        before, after = self._states(operation)
+        editor = self._postgres_editor(atomic=False)
+        operation.database_forwards('store', editor, before, after)
+        editor.remove_index.assert_not_called()
+        self.assertEqual(editor.add_index.call_args.kwargs, {'concurrently': True})
+
+        editor = self._postgres_editor(atomic=False, invalid=True)
+        operation.database_forwards('store', editor, before, after)
+        self.assertEqual(editor.remove_index.call_args.kwargs, {'concurrently': True})
+        self.assertEqual(editor.add_index.call_args.args[1].name, 'store_product_price_test')
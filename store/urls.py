@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 from .health import health_check, readiness_check
 
 app_name = 'store'
@@ -7,13 +7,23 @@ app_name = 'store'
 urlpatterns = [
     path('', views.product_list, name='product_list'),
     path('product/<slug:slug>/', views.product_detail, name='product_detail'),
+    path('product/<int:product_id>/viewed/', views.product_viewed, name='product_viewed'),
     path('category/<slug:slug>/', views.category_detail, name='category_detail'),
+    path('header/', views.header_state, name='header_state'),
     path('cart/', views.cart_detail, name='cart_detail'),
     path('cart/add/<int:product_id>/', views.cart_add, name='cart_add'),
     path('cart/remove/<int:product_id>/', views.cart_remove, name='cart_remove'),
+    path('cart/lines/', views.cart_lines, name='cart_lines'),
     path('checkout/', views.checkout, name='checkout'),
     path('order/<str:order_id>/', views.order_detail, name='order_detail'),
     path('orders/', views.order_history, name='order_history'),
+    path('orders/events/', views.order_events, name='order_events'),
+    path('sitemap.xml', views.sitemap, name='sitemap'),
+    path('sitemaps/<str:name>', views.sitemap, name='sitemap_file'),
+    # JSON catalog API
+    path('api/products/', api.product_list, name='api_product_list'),
+    path('api/products/<slug:slug>/', api.product_detail, name='api_product_detail'),
+    path('api/categories/', api.category_list, name='api_category_list'),
     # Health check endpoints
     path('health/', health_check, name='health_check'),
     path('ready/', readiness_check, name='readiness_check'),
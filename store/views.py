@@ -1,64 +1,127 @@
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import IntegrityError, transaction
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.middleware.csrf import get_token
 from django.db.models import Q
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
-from .models import Category, Product, Order, OrderItem
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET, require_POST
+from django.views.decorators.cache import never_cache
+from django.views.decorators.csrf import csrf_exempt
+from .models import ArchivedOrder, Category, Product, Order, OrderItem
 from .cart import Cart
+from . import archive, cards, ids, inventory, notifier, objectcache, outbox, rankings, recommendations, sitemaps
+from .conditional import conditional_catalog_page, product_list_state, product_state, category_state
+from functools import partial
+import asyncio
+import json
 import logging
-import uuid
+import re
 
 logger = logging.getLogger(__name__)
 
+@conditional_catalog_page(product_list_state)
 def product_list(request):
-    products = Product.objects.filter(available=True)
     categories = Category.objects.all()
     
+    # Category filtering
+    category = None
+    category_slug = request.GET.get('category')
+    if category_slug:
+        category = objectcache.get_by_slug(Category, category_slug)
+        if category is None:
+            raise Http404('No such category')
+    
+    # Sorting: popular/trending read the ranking indexes, default is newest first
+    sort = request.GET.get('sort')
+    if sort not in rankings.SORTS:
+        sort = None
+    products = cards.listing(category, rankings.SORTS.get(sort))
+    
     # Search functionality
     query = request.GET.get('q')
     if query:
         products = products.filter(
             Q(name__icontains=query) | 
-            Q(description__icontains=query) |
+            Q(product__description__icontains=query) |
             Q(category__name__icontains=query)
         )
     
-    # Category filtering
-    category_slug = request.GET.get('category')
-    if category_slug:
-        category = get_object_or_404(Category, slug=category_slug)
-        products = products.filter(category=category)
-    
     context = {
         'products': products,
         'categories': categories,
         'query': query,
+        'sort': sort,
     }
     logger.info(f'Product list view accessed, showing {products.count()} products')
     return render(request, 'store/product_list.html', context)
 
+@conditional_catalog_page(product_state)
 def product_detail(request, slug):
-    product = get_object_or_404(Product, slug=slug, available=True)
+    product = objectcache.get_by_slug(Product, slug)
+    if product is None or not product.available:
+        raise Http404('No such product')
+    product.category = objectcache.get(Category, product.category_id)
     context = {
         'product': product,
+        'recommendations': recommendations.for_product(product),
     }
     logger.info(f'Product detail view accessed for {product.name}')
     return render(request, 'store/product_detail.html', context)
 
+@csrf_exempt
+@require_POST
+@never_cache
+def product_viewed(request, product_id):
+    """
+    Beacon sent by product_view.js on every product page view. Views are
+    counted here rather than in ``product_detail``, which 304 responses and
+    edge-cached copies never reach.
+    """
+    if objectcache.get(Product, product_id) is not None:
+        rankings.record_view(product_id)
+    return HttpResponse(status=204)
+
+@conditional_catalog_page(category_state)
 def category_detail(request, slug):
-    category = get_object_or_404(Category, slug=slug)
-    products = Product.objects.filter(category=category, available=True)
+    category = objectcache.get_by_slug(Category, slug)
+    if category is None:
+        raise Http404('No such category')
+    products = cards.listing(category)
     context = {
         'category': category,
         'products': products,
     }
     return render(request, 'store/category_detail.html', context)
 
+@require_GET
+@never_cache
+def header_state(request):
+    """
+    Per-visitor header bits for pages rendered as an edge-cacheable shell.
+    """
+    user = request.user
+    return JsonResponse({
+        'authenticated': user.is_authenticated,
+        'username': user.get_username() if user.is_authenticated else None,
+        'cart_count': len(Cart(request)),
+        'csrf_token': get_token(request),
+        'messages': [
+            {'tags': message.tags, 'text': str(message)}
+            for message in messages.get_messages(request)
+        ],
+    })
+
 @require_POST
 def cart_add(request, product_id):
     cart = Cart(request)
-    product = get_object_or_404(Product, id=product_id)
+    product = objectcache.get(Product, product_id)
+    if product is None:
+        raise Http404('No such product')
     quantity = int(request.POST.get('quantity', 1))
     
     if product.stock >= quantity:
@@ -82,6 +145,73 @@ def cart_remove(request, product_id):
     messages.success(request, f'{product.name} removed from cart')
     return redirect('store:cart_detail')
 
+CART_OPS = ('add', 'set', 'remove')
+
+def _parse_cart_lines(request):
+    """
+    ``[(product_id, op, quantity)]`` from a JSON body
+    (``{"lines": [{"product_id": 1, "op": "add", "quantity": 2}]}``) or
+    from ``quantity_<product_id>`` form fields, which set quantities.
+    """
+    if request.content_type == 'application/json':
+        try:
+            lines = json.loads(request.body)['lines']
+            return [
+                (int(line['product_id']), line.get('op', 'add'), int(line.get('quantity', 1)))
+                for line in lines
+            ]
+        except (ValueError, KeyError, TypeError):
+            raise ValueError('Expected {"lines": [{"product_id": ..., "op": ..., "quantity": ...}]}')
+    return [
+        (int(name[len('quantity_'):]), 'set', int(value))
+        for name, value in request.POST.items()
+        if name.startswith('quantity_')
+    ]
+
+@require_POST
+def cart_lines(request):
+    """
+    Add, update or remove several cart lines in one request. JSON callers
+    (static/js/cart.js) get the updated cart back; plain form posts are
+    redirected to the cart page.
+    """
+    wants_json = request.content_type == 'application/json'
+    cart = Cart(request)
+    try:
+        changes = _parse_cart_lines(request)
+        if any(op not in CART_OPS or quantity < 0 for _, op, quantity in changes):
+            raise ValueError('op must be add, set or remove and quantity non-negative')
+    except ValueError as e:
+        if wants_json:
+            return JsonResponse({'errors': [str(e)]}, status=400)
+        messages.error(request, 'Please enter valid quantities')
+        return redirect('store:cart_detail')
+
+    errors = cart.update_lines(changes)
+    if wants_json:
+        if errors:
+            return JsonResponse({'errors': errors, 'cart': cart.summary()}, status=409)
+        return JsonResponse({'cart': cart.summary()})
+    for error in errors:
+        messages.error(request, error)
+    if not errors:
+        messages.success(request, 'Cart updated')
+    return redirect('store:cart_detail')
+
+def create_order(attempts=3, **fields):
+    """
+    Create an order with a fresh ``order_id``, generating another if the
+    reference is somehow already taken.
+    """
+    for attempt in range(attempts):
+        try:
+            with transaction.atomic():
+                return Order.objects.create(order_id=ids.new_order_id(), **fields)
+        except IntegrityError:
+            if attempt == attempts - 1:
+                raise
+            logger.warning('Order reference collision, retrying with a new one')
+
 @login_required
 def checkout(request):
     cart = Cart(request)
@@ -90,34 +220,46 @@ def checkout(request):
         return redirect('store:cart_detail')
     
     if request.method == 'POST':
-        # Create order
-        order = Order.objects.create(
-            user=request.user,
-            order_id=str(uuid.uuid4())[:8].upper(),
-            first_name=request.POST['first_name'],
-            last_name=request.POST['last_name'],
-            email=request.POST['email'],
-            address=request.POST['address'],
-            postal_code=request.POST['postal_code'],
-            city=request.POST['city'],
-        )
-        
-        # Create order items
-        for item in cart:
-            OrderItem.objects.create(
-                order=order,
-                product=item['product'],
-                price=item['price'],
-                quantity=item['quantity']
-            )
-            # Update product stock
-            product = item['product']
-            product.stock -= item['quantity']
-            product.save()
-        
-        # Calculate total cost
-        order.total_cost = cart.get_total_price()
-        order.save()
+        # The order, its items, stock changes and the follow-up jobs commit
+        # together; emails and alerts run later in run_outbox_worker
+        items = list(cart)
+        try:
+            with transaction.atomic():
+                # Stock is taken in product order so two checkouts never
+                # wait on each other's shards in opposite orders
+                for item in sorted(items, key=lambda item: item['product'].id):
+                    inventory.take(item['product'], item['quantity'])
+                order = create_order(
+                    user=request.user,
+                    first_name=request.POST['first_name'],
+                    last_name=request.POST['last_name'],
+                    email=request.POST['email'],
+                    address=request.POST['address'],
+                    postal_code=request.POST['postal_code'],
+                    city=request.POST['city'],
+                )
+                
+                # Create order items
+                for item in items:
+                    product = item['product']
+                    OrderItem.objects.create(
+                        order=order,
+                        product=product,
+                        price=item['price'],
+                        quantity=item['quantity']
+                    )
+                    transaction.on_commit(partial(rankings.record_sale, product.id, item['quantity']))
+                    if inventory.total(product.id) <= settings.LOW_STOCK_THRESHOLD:
+                        outbox.enqueue('product.low_stock', {'product_id': product.id})
+                
+                # Calculate total cost
+                order.total_cost = cart.get_total_price()
+                order.save()
+                outbox.enqueue('order.confirmation_email', {'order_id': order.id})
+                transaction.on_commit(partial(inventory.refresh, [item['product'].id for item in items]))
+        except inventory.OutOfStock as e:
+            messages.error(request, str(e))
+            return redirect('store:cart_detail')
         
         # Clear cart
         cart.clear()
@@ -131,10 +273,89 @@ def checkout(request):
 
 @login_required
 def order_detail(request, order_id):
-    order = get_object_or_404(Order, order_id=order_id, user=request.user)
-    return render(request, 'store/order_detail.html', {'order': order})
+    # Older finished orders live in the archive; the page reads either
+    found = archive.find_order(order_id, request.user)
+    if found is None and ids.normalize(order_id) != order_id:
+        found = archive.find_order(ids.normalize(order_id), request.user)
+    if found is None:
+        raise Http404('No such order')
+    order, items = found
+    return render(request, 'store/order_detail.html', {'order': order, 'items': items})
 
 @login_required
 def order_history(request):
     orders = Order.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'store/order_history.html', {'orders': orders})
+    archived_orders = ArchivedOrder.objects.filter(user=request.user).defer('payload')
+    return render(request, 'store/order_history.html', {
+        'orders': orders,
+        'archived_orders': archived_orders,
+    })
+
+SITEMAP_NAME = re.compile(r'^sitemap(-[a-z]+-\d+\.xml\.gz|\.xml)$')
+
+@require_GET
+def sitemap(request, name='sitemap.xml'):
+    """Serve a file written by ``manage.py generate_sitemaps``."""
+    if not SITEMAP_NAME.match(name):
+        raise Http404('No such sitemap')
+    path = sitemaps.root() / name
+    try:
+        modified = int(path.stat().st_mtime)
+    except FileNotFoundError:
+        raise Http404('No such sitemap')
+    response = get_conditional_response(request, last_modified=modified)
+    if response is None:
+        content_type = 'application/gzip' if name.endswith('.gz') else 'application/xml'
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    response['Last-Modified'] = http_date(modified)
+    patch_cache_control(response, public=True, max_age=3600)
+    return response
+
+FINAL_STATUSES = ('delivered', 'cancelled')
+
+def _sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+@login_required
+async def order_events(request):
+    """
+    Server-Sent Events carrying status changes to the user's orders, or to
+    one order with ``?order=``. Each stream starts with the current
+    statuses, so a reconnecting browser never misses a change. Under WSGI
+    a worker can't hold idle streams cheaply, so only the current statuses
+    are sent and the browser is told to reconnect later, i.e. it polls.
+    """
+    user = await request.auser()
+    order_id = request.GET.get('order')
+    orders = Order.objects.filter(user=user)
+    if order_id:
+        orders = orders.filter(order_id=order_id)
+    else:
+        orders = orders.exclude(status__in=FINAL_STATUSES)
+
+    async def snapshot():
+        rows = orders.order_by('-created_at').values_list('order_id', 'status')[:50]
+        return ''.join([_sse('status', notifier.status_message(*row)) async for row in rows])
+
+    if not isinstance(request, ASGIRequest):
+        body = f'retry: {settings.ORDER_EVENTS_POLL_SECONDS * 1000}\n\n' + await snapshot()
+        response = HttpResponse(body, content_type='text/event-stream')
+    else:
+        async def stream():
+            # Subscribed before the snapshot is read so nothing falls between
+            async with notifier.get_broker().subscribe(user.pk) as queue:
+                yield f'retry: {settings.ORDER_EVENTS_RETRY_SECONDS * 1000}\n\n' + await snapshot()
+                while True:
+                    try:
+                        message = await asyncio.wait_for(queue.get(), settings.ORDER_EVENTS_KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        # Keeps proxies from closing an idle connection
+                        yield ': keepalive\n\n'
+                        continue
+                    if not order_id or message['order_id'] == order_id:
+                        yield _sse('status', message)
+
+        response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+        response['X-Accel-Buffering'] = 'no'
+    response['Cache-Control'] = 'no-cache'
+    return response
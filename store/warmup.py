@@ -0,0 +1,57 @@
+"""
+Boot-time warm-up.
+
+``ipswich_retail.wsgi`` and ``ipswich_retail.asgi`` call :func:`warm_up`
+once the application is loaded. With ``gunicorn --preload`` that happens
+in the master before it forks, so the imported modules, the populated URL
+resolver and the compiled site templates are shared copy-on-write by
+every worker instead of being rebuilt by each one on its first requests.
+Nothing here opens a database connection, which must not be shared
+across the fork.
+"""
+import importlib
+import time
+from pathlib import Path
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist, TemplateSyntaxError
+from django.template.loader import get_template
+from django.urls import get_resolver
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Imported by the first request anyway; pull them in up front
+MODULES = [
+    'store.views',
+    'store.context_processors',
+    'store.conditional',
+    'django.contrib.admin.views.main',
+]
+
+def site_templates():
+    for directory in settings.TEMPLATES[0]['DIRS']:
+        directory = Path(directory)
+        for path in sorted(directory.rglob('*.html')):
+            yield path.relative_to(directory).as_posix()
+
+def warm_up():
+    started = time.perf_counter()
+    for name in MODULES:
+        importlib.import_module(name)
+    # Loads the backend module (e.g. psycopg2) without connecting
+    for alias in connections:
+        connections[alias].ops
+    resolver = get_resolver()
+    resolver.reverse_dict  # populates the reverse and namespace maps
+    templates = 0
+    for name in site_templates():
+        try:
+            get_template(name)
+        except (TemplateDoesNotExist, TemplateSyntaxError):
+            logger.warning(f'Warm-up could not compile template {name}')
+        else:
+            templates += 1
+    elapsed = (time.perf_counter() - started) * 1000
+    logger.info(f'Warm-up compiled {templates} templates in {elapsed:.0f}ms')
+    return templates